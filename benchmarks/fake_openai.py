@@ -0,0 +1,66 @@
+"""
+A local stand-in for the OpenAI Responses API, so that ``/ai`` can be benchmarked offline.
+Every request waits ``delay`` seconds (the model's latency) and returns one MCP tool call
+followed by a short answer.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_response(text, tool="search"):
+    return {
+        "id": "resp_bench",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": "bench",
+        "status": "completed",
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "output": [
+            {"type": "mcp_call", "id": "mcp_bench", "server_label": "PYTERRIER_MCP",
+             "name": tool, "arguments": json.dumps({"query": text}), "output": "[]"},
+            {"type": "message", "id": "msg_bench", "role": "assistant", "status": "completed",
+             "content": [{"type": "output_text", "text": f"An answer to {text}", "annotations": []}]},
+        ],
+    }
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.05):
+        super().__init__((host, port), _Handler)
+        self.delay = delay
+        self.requests = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        inputs = body.get("input") or []
+        text = inputs[-1].get("content", "") if inputs and isinstance(inputs[-1], dict) else str(inputs)
+        data = json.dumps(fake_response(text)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,338 @@
+"""
+Offline benchmark harness for pyterrier-server.
+
+Starts the server on the synthetic functions in ``benchmarks/functions.yaml`` in each of the
+requested serving modes, drives its endpoints (and the MCP tools) at each concurrency level,
+and reports throughput, latency percentiles and the server's RSS. Nothing is downloaded:
+the pipelines are stand-ins (see ``benchmarks/standins.py``) and ``/ai`` talks to a local
+fake of the OpenAI API.
+
+    python -m benchmarks.run --modes threaded,prefork,asgi --targets search,rag,ai --concurrency 1,8,32
+    python -m benchmarks.run --json after.json --baseline before.json   # fails on regressions
+"""
+import argparse
+import asyncio
+import http.client
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+MODES = ["threaded", "prefork", "asgi"]
+TARGETS = ["search", "search-batched", "rag", "batch", "ai", "mcp"]
+BATCH_SIZE = 100
+
+
+def percentile(values, p):
+    """The ``p``-th percentile (0-100) of ``values``, by the nearest-rank method."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, round(p / 100 * len(ordered) + 0.5 - 1e-9))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarise(latencies, errors, seconds, items_per_request=1):
+    n = len(latencies)
+    return {
+        "requests": n,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(n / seconds, 2) if seconds else None,
+        "items_per_second": round(n * items_per_request / seconds, 2) if seconds else None,
+        "mean_ms": round(1000 * sum(latencies) / n, 2) if n else None,
+        "p50_ms": round(1000 * percentile(latencies, 50), 2) if n else None,
+        "p95_ms": round(1000 * percentile(latencies, 95), 2) if n else None,
+        "p99_ms": round(1000 * percentile(latencies, 99), 2) if n else None,
+    }
+
+
+def process_rss(pid):
+    """RSS in bytes of ``pid`` and all of its descendants (e.g. pre-forked workers)."""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, ValueError):
+        return total
+    return total + sum(process_rss(c) for c in children)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Queries:
+    """Unique queries (so the result cache never hits), or ``distinct`` repeating ones."""
+    def __init__(self, distinct=None):
+        self.nonce = uuid.uuid4().hex[:8]
+        self.distinct = distinct
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def __next__(self):
+        with self.lock:
+            i = next(self.counter)
+        if self.distinct:
+            i %= self.distinct
+        return {"qid": str(i), "query": f"query {self.nonce} {i}"}
+
+
+def request_for(target, queries):
+    """``(path, body, content type, items)`` for one request to ``target``."""
+    if target == "batch":
+        body = "\n".join(json.dumps(next(queries)) for _ in range(BATCH_SIZE))
+        return "/pipeline/search/batch", body.encode(), "application/x-ndjson", BATCH_SIZE
+    if target == "ai":
+        return "/ai", json.dumps({"input": next(queries)["query"]}).encode(), "application/json", 1
+    return f"/pipeline/{target}", json.dumps(next(queries)).encode(), "application/json", 1
+
+
+def drive_http(port, target, concurrency, num_requests, queries):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while next(remaining) < num_requests:
+            path, body, content_type, _ = request_for(target, queries)
+            start = time.perf_counter()
+            try:
+                conn.request("POST", path, body, {"Content-Type": content_type})
+                res = conn.getresponse()
+                res.read()
+                ok = res.status == 200
+                if res.getheader("Connection", "").lower() == "close" or res.version == 10:
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+        conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def drive_mcp(mcp, concurrency, num_requests, queries, tool="search"):
+    from fastmcp import Client
+
+    async def run():
+        latencies, errors = [], 0
+        semaphore = asyncio.Semaphore(concurrency)
+        async with Client(mcp) as client:
+            async def one():
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        await client.call_tool(tool, next(queries))
+                        latencies.append(time.perf_counter() - start)
+                    except Exception:  # noqa: BLE001 - any failed call counts as an error
+                        errors += 1
+            start = time.perf_counter()
+            await asyncio.gather(*[one() for _ in range(num_requests)])
+            return latencies, errors, time.perf_counter() - start
+    return asyncio.run(run())
+
+
+class ServerProcess:
+    """The server under test, in a subprocess started with ``benchmarks.serve``."""
+    def __init__(self, mode, workers, env):
+        self.port = free_port()
+        args = [sys.executable, "-m", "benchmarks.serve", "--host", "127.0.0.1", "--port", str(self.port)]
+        if mode == "threaded":
+            args += ["--threaded"]
+        if mode == "prefork":
+            args += ["--workers", str(workers)]
+        if mode == "asgi":
+            args += ["--asgi"]
+        self.proc = subprocess.Popen(args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_ready(self, timeout=120):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Server exited with status {self.proc.returncode}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=1)
+                conn.request("GET", "/ready")
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("Server did not become ready")
+
+    def rss(self):
+        return process_rss(self.proc.pid)
+
+    def stop(self):
+        self.proc.send_signal(signal.SIGTERM)
+        try:
+            self.proc.wait(30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def bench_env(args, fake):
+    env = dict(os.environ)
+    env.update({
+        "PYTERRIER_SERVER_PIPELINE": os.path.join(HERE, "functions.yaml"),
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake.base_url,
+        "OPENAI_MODEL": "bench",
+        "BENCH_CPU": "true" if args.cpu else "false",
+        "PYTERRIER_SERVER_MAX_QUEUE": str(max(64, max(args.concurrency) * 2)),
+    })
+    env.pop("PYTERRIER_MCP_URL", None)
+    for knob in ["retriever_latency", "loader_per_doc", "reader_latency", "num_results"]:
+        value = getattr(args, knob)
+        if value is not None:
+            env[f"BENCH_{knob.upper()}"] = str(value)
+    return env
+
+
+def run(args):
+    fake = FakeOpenAIServer(delay=args.openai_delay).start()
+    env = bench_env(args, fake)
+    results = []
+
+    def record(mode, target, concurrency, measured, rss, items=1):
+        row = {"mode": mode, "target": target, "concurrency": concurrency,
+               **summarise(*measured, items_per_request=items), "rss_mb": round(rss / 2**20, 1)}
+        results.append(row)
+        print(format_row(row), flush=True)
+
+    print(format_header(), flush=True)
+    http_targets = [t for t in args.targets if t != "mcp"]
+    for mode in args.modes if http_targets else []:
+        server = ServerProcess(mode, args.workers, env)
+        try:
+            server.wait_ready()
+            for target in http_targets:
+                items = request_for(target, Queries())[3]
+                drive_http(server.port, target, 2, args.warmup, Queries())
+                for concurrency in args.concurrency:
+                    measured = drive_http(server.port, target, concurrency, args.requests, Queries(args.distinct))
+                    record(mode, target, concurrency, measured, server.rss(), items)
+        finally:
+            server.stop()
+
+    if "mcp" in args.targets:
+        # the tools run in this process, over FastMCP's in-memory transport
+        os.environ.update(env)
+        from pyterrier_server._artifacts import rss_bytes
+        from pyterrier_server._loader import load_pipeline
+        from pyterrier_server._mcp_server import build_mcp_server
+        mcp = build_mcp_server(load_pipeline())
+        drive_mcp(mcp, 2, args.warmup, Queries())
+        for concurrency in args.concurrency:
+            measured = drive_mcp(mcp, concurrency, args.requests, Queries(args.distinct))
+            record("in-process", "mcp", concurrency, measured, rss_bytes())
+    fake.shutdown()
+    return results
+
+
+COLUMNS = ["mode", "target", "concurrency", "requests", "errors", "throughput", "p50_ms", "p95_ms", "p99_ms", "rss_mb"]
+
+
+def format_header():
+    return "  ".join(f"{c:>12}" for c in COLUMNS)
+
+
+def format_row(row):
+    return "  ".join(f"{row.get(c)!s:>12}" for c in COLUMNS)
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of ``results`` against ``baseline`` (lower throughput or higher p95, beyond ``tolerance``)."""
+    def key(row):
+        return row["mode"], row["target"], row["concurrency"]
+    before = {key(row): row for row in baseline}
+    regressions = []
+    for row in results:
+        old = before.get(key(row))
+        if not old or not old.get("throughput") or not row.get("throughput"):
+            continue
+        if row["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{key(row)}: throughput {old['throughput']} -> {row['throughput']} req/s")
+        if old.get("p95_ms") and row.get("p95_ms") and row["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key(row)}: p95 {old['p95_ms']} -> {row['p95_ms']} ms")
+    return regressions
+
+
+def _list(cast=str):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", type=_list(), default=["threaded", "asgi"], help=f"serving modes, from {MODES}")
+    parser.add_argument("--targets", type=_list(), default=["search", "rag", "ai"], help=f"what to drive, from {TARGETS}")
+    parser.add_argument("--concurrency", type=_list(int), default=[1, 8, 32], help="concurrent clients (default: 1,8,32)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per measurement (default: 200)")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each target (default: 20)")
+    parser.add_argument("--workers", type=int, default=4, help="workers in prefork mode (default: 4)")
+    parser.add_argument("--distinct", type=int, default=None, help="cycle through this many distinct queries (default: all unique)")
+    parser.add_argument("--cpu", action="store_true", help="spend stage costs busy-waiting (holding the GIL) instead of sleeping")
+    parser.add_argument("--retriever-latency", type=float, default=None, help="seconds per retriever call (default: 0.005)")
+    parser.add_argument("--loader-per-doc", type=float, default=None, help="seconds per document loaded (default: 0.0001)")
+    parser.add_argument("--reader-latency", type=float, default=None, help="seconds per reader call (default: 0.02)")
+    parser.add_argument("--num-results", type=int, default=None, help="documents retrieved per query (default: 100)")
+    parser.add_argument("--openai-delay", type=float, default=0.05, help="seconds the fake OpenAI API takes to respond")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results previously written with --json")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression (default: 0.1)")
+    args = parser.parse_args(argv)
+    for value, allowed in [(args.modes, MODES), (args.targets, TARGETS)]:
+        unknown = set(value) - set(allowed)
+        if unknown:
+            parser.error(f"unknown {sorted(unknown)}; expected some of {allowed}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
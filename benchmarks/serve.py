@@ -0,0 +1,33 @@
+"""
+Start the server for a benchmark run: the same as ``pyterrier-server``, except that ``/ai``
+is enabled without connecting to an MCP server (the fake OpenAI endpoint never calls one).
+With ``--threaded``, the app is served by werkzeug's threaded server in a single process
+instead of the pre-forking launcher.
+"""
+import argparse
+import sys
+
+from pyterrier_server._cli import PreforkServer, parse_args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--threaded", action="store_true")
+    extra, rest = parser.parse_known_args(argv)
+    args = parse_args(rest)
+    from pyterrier_server._loader import load_pipeline
+    from pyterrier_server._server import create_app
+    app = create_app(load_pipeline())
+    app.config["MCP_EXISTS"] = True
+    if extra.threaded:
+        from werkzeug.serving import make_server
+        make_server(args.host, args.port, app, threaded=True).serve_forever()
+        return
+    if args.asgi:
+        from pyterrier_server._asgi import create_asgi_app
+        app = create_asgi_app(app)
+    PreforkServer(app, args.host, args.port, args.workers, args.graceful_timeout, asgi=args.asgi).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
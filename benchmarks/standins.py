@@ -0,0 +1,109 @@
+"""
+Synthetic stand-ins for the real pipeline stages, with configurable costs, so that the
+serving path can be benchmarked without downloading indexes or models.
+
+Each stage costs ``latency + per_item * items`` seconds per call, where items are queries
+(retriever, reader) or documents (text loader); ``latency`` is paid once per call, so
+batching amortises it. Costs default to the ``BENCH_*`` environment variables set by
+``benchmarks.run``. By default the cost is spent sleeping, like a stage that waits on I/O or
+a GPU; with ``BENCH_CPU=true`` it is spent busy-waiting while holding the GIL, like pure
+Python work.
+"""
+import os
+import time
+
+import pandas as pd
+import pyterrier as pt
+
+
+def _env(var, default):
+    try:
+        return float(os.environ.get(var, default))
+    except ValueError:
+        return float(default)
+
+
+def spend(seconds, cpu=None):
+    if seconds <= 0:
+        return
+    if cpu is None:
+        cpu = os.environ.get("BENCH_CPU", "").lower() in ['1', 'true', 'yes']
+    if not cpu:
+        time.sleep(seconds)
+        return
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class SyntheticRetriever(pt.Transformer):
+    """Returns ``num_results`` documents per query."""
+    def __init__(self, num_results=None, latency=None, per_query=None):
+        self.num_results = int(num_results if num_results is not None else _env("BENCH_NUM_RESULTS", 100))
+        self.latency = latency if latency is not None else _env("BENCH_RETRIEVER_LATENCY", 0.005)
+        self.per_query = per_query if per_query is not None else _env("BENCH_RETRIEVER_PER_QUERY", 0.002)
+
+    def transform_inputs(self):
+        return [["qid", "query"]]
+
+    def transform_outputs(self, input_columns):
+        return ["qid", "query", "docno", "score", "rank"]
+
+    def fuse_rank_cutoff(self, k):
+        if k < self.num_results:
+            return SyntheticRetriever(k, self.latency, self.per_query)
+        return self
+
+    def transform(self, inp):
+        spend(self.latency + self.per_query * len(inp))
+        n = self.num_results
+        return pd.DataFrame({
+            "qid": [q for q in inp["qid"] for _ in range(n)],
+            "query": [q for q in inp["query"] for _ in range(n)],
+            "docno": [f"{q}-{i}" for q in inp["qid"] for i in range(n)],
+            "score": [float(n - i) for _ in range(len(inp)) for i in range(n)],
+            "rank": [i for _ in range(len(inp)) for i in range(n)],
+        })
+
+
+class SyntheticTextLoader(pt.Transformer):
+    """Adds a ``text`` column to each document."""
+    def __init__(self, latency=None, per_doc=None, length=200):
+        self.latency = latency if latency is not None else _env("BENCH_LOADER_LATENCY", 0.001)
+        self.per_doc = per_doc if per_doc is not None else _env("BENCH_LOADER_PER_DOC", 0.0001)
+        self.length = length
+
+    def transform_inputs(self):
+        return [["qid", "docno"]]
+
+    def transform_outputs(self, input_columns):
+        return list(input_columns) + ["text"]
+
+    def fuse_rank_cutoff(self, k):
+        return pt.RankCutoff(k) >> self
+
+    def transform(self, inp):
+        spend(self.latency + self.per_doc * len(inp))
+        return inp.assign(text=[(d + " ") * (self.length // (len(d) + 1) + 1) for d in inp["docno"]])
+
+
+class SyntheticReader(pt.Transformer):
+    """Produces one ``qanswer`` per query, like a generative reader."""
+    def __init__(self, latency=None, per_query=None):
+        self.latency = latency if latency is not None else _env("BENCH_READER_LATENCY", 0.02)
+        self.per_query = per_query if per_query is not None else _env("BENCH_READER_PER_QUERY", 0.01)
+
+    def transform_inputs(self):
+        return [["qid", "query", "docno", "text"]]
+
+    def transform_outputs(self, input_columns):
+        return ["qid", "query", "qanswer"]
+
+    def transform(self, inp):
+        queries = inp.drop_duplicates("qid")
+        spend(self.latency + self.per_query * len(queries))
+        return pd.DataFrame({
+            "qid": queries["qid"].tolist(),
+            "query": queries["query"].tolist(),
+            "qanswer": [f"An answer to {q}" for q in queries["query"]],
+        })
@@ -16,7 +16,14 @@ def _setup_logging():
       - PYTERRIER_SERVER_LOG_LEVEL (default: INFO)
       - PYTERRIER_SERVER_LOG_FILE  (default: <package_parent>/pyterrier_server.log)
       - PYTERRIER_MCP              (if set, logs go to <package_parent>/pyterrier_mcp.log)
+      - PYTERRIER_SERVER_LOG_FORMAT (text or json, default: text)
+      - PYTERRIER_SERVER_LOG_QUEUE  (default: false; write logs from a background thread, see _logging.py)
     """
+    from pyterrier_server._logging import (
+        JsonFormatter,
+        queue_enabled,
+        start_queue_logging,
+    )
     root = logging.getLogger()
 
     if getattr(root, "_pyterrier_serve_configured", False):
@@ -43,8 +50,11 @@ def _setup_logging():
 
     root.setLevel(level)
 
-    fmt = logging.Formatter(fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s",
-                            datefmt="%Y-%m-%d %H:%M:%S")
+    if os.environ.get("PYTERRIER_SERVER_LOG_FORMAT", "text").lower() == "json":
+        fmt = JsonFormatter()
+    else:
+        fmt = logging.Formatter(fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+                                datefmt="%Y-%m-%d %H:%M:%S")
 
     # Stream handler
     sh = logging.StreamHandler(stream=sys.stdout)
@@ -61,6 +71,10 @@ def _setup_logging():
     except Exception:
         root.exception("Could not create log file handler; continuing without file logging")
 
+    if queue_enabled():
+        # the stream and file writes happen on a background thread, not in request threads
+        start_queue_logging(root)
+
     root._pyterrier_serve_configured = True
     root.debug(f"pyterrier_server logging configured (level={level_name}, file={default_logfile})")
 
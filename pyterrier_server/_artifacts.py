@@ -0,0 +1,214 @@
+# _artifacts.py
+import importlib
+import inspect
+import logging
+import os
+import resource
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Constructors of large artifacts that are commonly repeated across functions.
+# They are memoised by their arguments while pipelines are being built.
+DEFAULT_MEMOIZE = [
+    "pyterrier.get_dataset",
+    "pyterrier.Artifact.from_hf",
+    "pyterrier_pisa.PisaIndex.from_hf",
+]
+
+_MISSING = object()
+
+
+def rss_bytes():
+    """Current resident set size of this process in bytes (approximate)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # peak RSS is the best we can do without /proc (KiB on Linux, bytes on macOS)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+
+def _resolve(path):
+    """Resolve ``package.module.Attr.method`` into ``(owner, attribute name)``, or ``None`` if it is not importable."""
+    parts = path.split(".")
+    for i in range(len(parts) - 1, 0, -1):
+        try:
+            owner = importlib.import_module(".".join(parts[:i]))
+        except ImportError:
+            continue
+        try:
+            for part in parts[i:-1]:
+                owner = getattr(owner, part)
+        except AttributeError:
+            return None
+        if not hasattr(owner, parts[-1]):
+            return None
+        return owner, parts[-1]
+    return None
+
+
+class _Artifact:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = _MISSING
+        self.size = 0
+        self.uses = 0
+        self.owners = set()
+        # built outside of any function (e.g. in the shared section): never released
+        self.pinned = False
+
+
+class ArtifactRegistry:
+    """
+    Builds each distinct artifact (dataset, index, model, ...) once and shares it
+    between every pipeline that asks for it.
+
+    While :meth:`patched` is active, the configured constructors are replaced by
+    wrappers that memoise their results on the call arguments. The memory an
+    artifact took to build is measured so that the savings from reusing it can
+    be reported.
+
+    Artifacts built while a function is being loaded (see :meth:`owned_by`) belong to the
+    functions that use them, and are dropped by :meth:`release` once none of them does.
+    While a function is rebuilt, its old version keeps its artifacts under another owner
+    (see :meth:`transfer`), so that the ones the new version does not use can be released.
+    """
+
+    def __init__(self, targets=None):
+        self.targets = list(DEFAULT_MEMOIZE if targets is None else targets)
+        self._artifacts = {}
+        self._lock = threading.Lock()
+        self._patch_lock = threading.Lock()
+        self._patch_depth = 0
+        self._originals = []
+        self._local = threading.local()
+
+    @contextmanager
+    def owned_by(self, owner):
+        """Attribute the artifacts used in this thread during the block to ``owner`` (e.g. a function name)."""
+        previous = getattr(self._local, "owner", None)
+        self._local.owner = owner
+        try:
+            yield
+        finally:
+            self._local.owner = previous
+
+    def release(self, owner):
+        """
+        Forget that ``owner`` uses its artifacts, dropping those that no other owner uses, so
+        that they are freed (and rebuilt when next needed). Returns the approximate bytes released.
+        """
+        released = 0
+        with self._lock:
+            for artifact in self._artifacts.values():
+                if owner not in artifact.owners:
+                    continue
+                artifact.owners.discard(owner)
+                if not artifact.owners and not artifact.pinned and artifact.value is not _MISSING:
+                    artifact.value = _MISSING
+                    released += artifact.size
+                    artifact.size = 0
+        return released
+
+    def transfer(self, owner, to):
+        """Hand the artifacts of ``owner`` over to ``to`` (e.g. the old version of a function that is being rebuilt)."""
+        with self._lock:
+            for artifact in self._artifacts.values():
+                if owner in artifact.owners:
+                    artifact.owners.discard(owner)
+                    artifact.owners.add(to)
+
+    def add_targets(self, targets):
+        with self._patch_lock:
+            for t in targets or []:
+                if t not in self.targets:
+                    self.targets.append(t)
+
+    def memoize(self, path, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                key = (path, repr(args), repr(sorted(kwargs.items())))
+            except Exception:  # noqa: BLE001 - the repr of any argument may fail; then it is not memoised
+                return fn(*args, **kwargs)
+            owner = getattr(self._local, "owner", None)
+            with self._lock:
+                artifact = self._artifacts.setdefault(key, _Artifact())
+                if owner is None:
+                    artifact.pinned = True
+                else:
+                    artifact.owners.add(owner)
+            with artifact.lock:
+                if artifact.value is _MISSING:
+                    before = rss_bytes()
+                    artifact.value = fn(*args, **kwargs)
+                    artifact.size = max(0, rss_bytes() - before)
+                    logger.info(f"Built shared artifact {path}{key[1]} (~{artifact.size / 2**20:.1f} MB)")
+                else:
+                    logger.info(f"Reusing shared artifact {path}{key[1]}")
+                artifact.uses += 1
+                return artifact.value
+        wrapper._pyterrier_server_memoized = True
+        return wrapper
+
+    @contextmanager
+    def patched(self):
+        """Memoise the target constructors for the duration of the block (re-entrant and thread-safe)."""
+        with self._patch_lock:
+            if self._patch_depth == 0:
+                for path in self.targets:
+                    resolved = _resolve(path)
+                    if resolved is None:
+                        logger.debug(f"Not memoising {path}: not importable")
+                        continue
+                    owner, attr = resolved
+                    current = getattr(owner, attr)
+                    fn = getattr(current, "__func__", current)
+                    if getattr(fn, "_pyterrier_server_memoized", False):
+                        continue # inherited from a class that is already patched
+                    if isinstance(owner, type):
+                        original = owner.__dict__.get(attr, _MISSING)
+                        if inspect.ismethod(current):
+                            # classmethod: keep it bound to the class it is called on
+                            wrapped = classmethod(self.memoize(path, current.__func__))
+                        else:
+                            wrapped = staticmethod(self.memoize(path, current))
+                    else:
+                        original = current
+                        wrapped = self.memoize(path, current)
+                    setattr(owner, attr, wrapped)
+                    self._originals.append((owner, attr, original))
+            self._patch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._patch_lock:
+                self._patch_depth -= 1
+                if self._patch_depth == 0:
+                    for owner, attr, original in reversed(self._originals):
+                        if original is _MISSING:
+                            delattr(owner, attr)
+                        else:
+                            setattr(owner, attr, original)
+                    self._originals = []
+
+    def stats(self):
+        with self._lock:
+            artifacts = [a for a in self._artifacts.values() if a.value is not _MISSING]
+        return {
+            "artifacts": len(artifacts),
+            "reuses": sum(a.uses - 1 for a in artifacts),
+            "bytes_saved": sum(a.size * (a.uses - 1) for a in artifacts),
+        }
+
+    def report(self):
+        stats = self.stats()
+        logger.info(f"Shared artifacts: {stats['artifacts']} built, {stats['reuses']} reused, "
+                    f"~{stats['bytes_saved'] / 2**20:.1f} MB of memory saved")
+
+
+default_registry = ArtifactRegistry()
@@ -0,0 +1,71 @@
+# _asgi.py
+import logging
+
+from pyterrier_server._executors import get_executor
+from pyterrier_server._handler import PipelineCall
+from pyterrier_server._logging import AccessLogMiddleware
+from pyterrier_server._server import create_app
+
+logger = logging.getLogger(__name__)
+
+
+def create_asgi_app(app=None, mcp=False):
+    """
+    Create an ASGI app for serving the pipelines asynchronously.
+
+    ``POST /pipeline/<name>`` is served natively on the event loop: each request
+    is handed to the pipeline's bounded executor and awaited, so waiting
+    requests do not tie up a server thread. Requests that would overflow a
+    pipeline's queue are rejected immediately (503 + ``Retry-After``) and
+    requests that miss their deadline get a 504. All other routes are served by
+    the Flask ``app`` (created with :func:`create_app` if not given).
+
+    With ``mcp=True``, the MCP tools are served from the same process at
+    ``/mcp``, sharing the pipelines, runners, caches and executors of the REST
+    endpoints, so that nothing is loaded twice.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, Response, StreamingResponse
+    from starlette.routing import Mount, Route
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+    if app is None:
+        app = create_app(connect_mcp=not mcp)
+
+    async def pipeline_endpoint(request):
+        name = request.path_params["name"]
+        if "RESIDENCY" in app.config:
+            app.config["RESIDENCY"].start()
+        info = app.config["PIPELINES"].get(name)
+        if info is None:
+            return JSONResponse({"error": f"Unknown pipeline '{name}'"}, status_code=404)
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        call = PipelineCall(name, info, get_executor(name, info), request.query_params, request.headers, body)
+        reply = call.start() or await call.wait_async()
+        if reply.stream:
+            # the stages run on the executor; starlette iterates the events in its thread pool
+            return StreamingResponse(reply.body, status_code=reply.status, media_type=reply.mimetype, headers=reply.headers)
+        return Response(reply.body, status_code=reply.status, media_type=reply.mimetype, headers=reply.headers)
+
+    routes = [Route("/pipeline/{name}", pipeline_endpoint, methods=["POST"])]
+    lifespan = None
+    if mcp:
+        from pyterrier_server._mcp_server import build_mcp_server
+        server = build_mcp_server(app.config["PIPELINES"], metrics=False, reloader=app.config.get("RELOADER"))
+        mcp_app = server.http_app(path="/mcp", stateless_http=True)
+        # the MCP app is routed to as a whole, so that its own middleware applies
+        routes.append(Route("/mcp", mcp_app))
+        lifespan = mcp_app.lifespan
+        app.config["MCP_EXISTS"] = True
+        if not app.config.get("MCP_URL"):
+            logger.warning("PYTERRIER_MCP_URL is not set: /ai needs the public URL of this server's /mcp endpoint")
+    routes.append(Mount("/", app=WSGIMiddleware(app)))
+    asgi_app = Starlette(routes=routes, lifespan=lifespan)
+    asgi_app.state.flask_app = app
+    # every request (native, Flask or MCP) is logged once, by the middleware
+    app.config["ACCESS_LOG"] = False
+    asgi_app.add_middleware(AccessLogMiddleware)
+    return asgi_app
@@ -0,0 +1,164 @@
+# _batching.py
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+
+class MicroBatcher:
+    """
+    Collects the frames of concurrent requests for a single pipeline and runs
+    them through it as one DataFrame.
+
+    Each submitted frame is given unique internal ids (on ``qid``, or ``docno``
+    for document-side pipelines) so that rows from different callers cannot be
+    confused; the result is split on those ids and every caller receives only
+    its own rows, with its original ids restored.
+
+    A batch is dispatched as soon as it holds ``max_batch_size`` rows, or
+    ``max_wait_ms`` after its first request arrived, whichever comes first.
+    """
+
+    def __init__(self, pipeline, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, name=None):
+        self.pipeline = pipeline
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.
+        self.name = name or repr(pipeline)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.submit(df).result()
+
+    def submit(self, df: pd.DataFrame) -> Future:
+        """Queue ``df`` for the next batch and return a future for its rows of the result."""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((df, future))
+        return future
+
+    def _ensure_worker(self):
+        # the worker thread does not survive a fork(), so restart it in the child
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """Stop the worker thread once the requests queued so far have been dispatched."""
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            items = [item]
+            rows = len(items[0][0])
+            deadline = time.monotonic() + self.max_wait
+            closed = False
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                items.append(item)
+                rows += len(item[0])
+            self._dispatch(items)
+            if closed:
+                return
+
+    def _dispatch(self, items):
+        items = [(df, fut) for df, fut in items if fut.set_running_or_notify_cancel()]
+        if not items:
+            return
+        if len(items) == 1:
+            self._settle(*items[0])
+            return
+
+        logger.debug(f"Dispatching batch of {len(items)} requests to '{self.name}'")
+        try:
+            results = self._run_batch([df for df, _ in items])
+        except Exception:
+            # Don't let one bad request fail everyone else in the batch
+            logger.warning(f"Batch of {len(items)} failed for '{self.name}'; retrying requests individually", exc_info=True)
+            for df, fut in items:
+                self._settle(df, fut)
+            return
+        for (_, fut), result in zip(items, results):
+            fut.set_result(result)
+
+    def _settle(self, df, fut):
+        """Run one request's frame on its own, resolving its future with the result or the error."""
+        try:
+            fut.set_result(self.pipeline(df))
+        except Exception as e:  # noqa: BLE001 - the error is raised to the caller by the future
+            fut.set_exception(e)
+
+    def _run_batch(self, frames):
+        key = 'qid' if all('qid' in df.columns for df in frames) else 'docno'
+        mapping = {}
+        renamed = []
+        for i, df in enumerate(frames):
+            df = df.copy()
+            new_ids = [str(len(mapping) + j) for j in range(len(df))]
+            for new_id, orig in zip(new_ids, df[key]):
+                mapping[new_id] = (i, orig)
+            df[key] = new_ids
+            renamed.append(df)
+
+        result = self.pipeline(pd.concat(renamed, ignore_index=True))
+        if not isinstance(result, pd.DataFrame):
+            raise TypeError(f"Pipeline returned {type(result)}, cannot split a batched result")
+
+        owners = result[key].map(lambda v: mapping.get(v, (None, None))[0])
+        originals = result[key].map(lambda v: mapping.get(v, (None, None))[1])
+        if owners.isna().any():
+            logger.warning(f"Pipeline '{self.name}' returned rows with unknown {key}s; dropping them")
+        result = result.assign(**{key: originals})
+
+        splits = []
+        for i in range(len(frames)):
+            part = result[owners == i].reset_index(drop=True)
+            splits.append(part)
+        return splits
+
+
+def make_batcher(pipeline, config, name=None):
+    """
+    Builds a :class:`MicroBatcher` from a function's ``batching`` setting in the YAML file.
+    ``config`` may be ``true`` (defaults) or a dict with ``max_batch_size`` and ``max_wait_ms``.
+    Returns ``None`` if batching is not enabled.
+    """
+    if not config:
+        return None
+    if config is True:
+        config = {}
+    if not isinstance(config, dict):
+        raise TypeError(f"Invalid batching config for '{name}': {config!r}")
+    return MicroBatcher(
+        pipeline,
+        max_batch_size=config.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE),
+        max_wait_ms=config.get("max_wait_ms", DEFAULT_MAX_WAIT_MS),
+        name=name,
+    )
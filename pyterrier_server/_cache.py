@@ -0,0 +1,200 @@
+# _cache.py
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def id_column(df: pd.DataFrame) -> str:
+    """The column that identifies each input row: ``qid`` for queries, ``docno`` for document-side pipelines."""
+    return "qid" if "qid" in df.columns else "docno"
+
+
+def normalize_row(row: dict, key: str) -> dict:
+    """Drop the row id and normalise whitespace so equivalent inputs share a cache entry."""
+    out = {}
+    for k, v in row.items():
+        if k == key:
+            continue
+        if isinstance(v, str):
+            v = re.sub(r"\s+", " ", v).strip()
+        out[k] = v
+    return out
+
+
+class ResultCache:
+    """
+    Caches pipeline results per input row.
+
+    An in-memory LRU (bounded by ``max_size`` entries and ``ttl`` seconds) is
+    backed by an optional SQLite file at ``path`` that survives restarts.
+    Hits and misses are counted per pipeline.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600., path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        if path:
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL, value BLOB)")
+            self._db.commit()
+
+    @property
+    def _db(self):
+        # SQLite connections must not be shared with forked worker processes
+        if self.path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 or self.path is not None
+
+    @staticmethod
+    def make_key(name, version, row):
+        payload = json.dumps([name, version, row], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _expired(self, created):
+        return self.ttl is not None and self.ttl > 0 and time.time() - created > self.ttl
+
+    def get(self, name, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits[name] += 1
+                    return value
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT created, value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    created, blob = row
+                    if not self._expired(created):
+                        value = pickle.loads(blob)
+                        self._remember(key, created, value)
+                        self.hits[name] += 1
+                        return value
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+            self.misses[name] += 1
+            return None
+
+    def put(self, key, value):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, created, pickle.dumps(value)))
+                self._db.commit()
+
+    def _remember(self, key, created, value):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self):
+        names = sorted(set(self.hits) | set(self.misses))
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "path": self.path,
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "pipelines": {n: {"hits": self.hits[n], "misses": self.misses[n]} for n in names},
+        }
+
+
+class CachedPipeline:
+    """Wraps a pipeline callable so that rows already in the cache are not executed again."""
+
+    def __init__(self, pipeline, cache, name, version=None):
+        self.pipeline = pipeline
+        self.cache = cache
+        self.name = name
+        self.version = version
+
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        key = id_column(df)
+        rows = df.to_dict("records")
+        cache_keys = [self.cache.make_key(self.name, self.version, normalize_row(row, key)) for row in rows]
+        cached = [self.cache.get(self.name, k) for k in cache_keys]
+        missing = [i for i, c in enumerate(cached) if c is None]
+
+        if missing:
+            # give each missing row a unique id so its results can be told apart
+            inp = df.iloc[missing].reset_index(drop=True)
+            inp[key] = [str(j) for j in range(len(missing))]
+            result = self.pipeline(inp)
+            if not isinstance(result, pd.DataFrame):
+                # nothing to split per row; don't cache
+                return result
+            groups = {k: g for k, g in result.groupby(key, sort=False)} if len(result) else {}
+            for j, i in enumerate(missing):
+                part = groups.get(str(j), result.iloc[0:0]).reset_index(drop=True)
+                cached[i] = part
+                self.cache.put(cache_keys[i], part)
+
+        parts = [part.assign(**{key: row[key]}) if len(part) else part for part, row in zip(cached, rows)]
+        return pd.concat(parts, ignore_index=True)
+
+
+def _float_env(var, default):
+    try:
+        return float(os.environ.get(var, default))
+    except ValueError:
+        return float(default)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def default_cache():
+    """
+    The result cache shared by all pipelines in this process, configured from:
+      - PYTERRIER_SERVER_CACHE_SIZE (default: 1024 entries; 0 disables the in-memory tier)
+      - PYTERRIER_SERVER_CACHE_TTL  (default: 3600 seconds; 0 means never expire)
+      - PYTERRIER_SERVER_CACHE_PATH (optional SQLite file for the on-disk tier)
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache(
+                max_size=int(_float_env("PYTERRIER_SERVER_CACHE_SIZE", 1024)),
+                ttl=_float_env("PYTERRIER_SERVER_CACHE_TTL", 3600),
+                path=os.environ.get("PYTERRIER_SERVER_CACHE_PATH") or None,
+            )
+            logger.info(f"Result cache: max_size={_default_cache.max_size}, ttl={_default_cache.ttl}, path={_default_cache.path}")
+        return _default_cache
@@ -0,0 +1,270 @@
+# _cli.py
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from pyterrier_server._logging import stop_queue_logging
+
+logger = logging.getLogger(__name__)
+
+
+def _int_env(var, default):
+    try:
+        return int(os.environ.get(var, default))
+    except ValueError:
+        return default
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="pyterrier-server", description="Serve PyTerrier pipelines over HTTP.")
+    parser.add_argument("--host", default=os.environ.get("PYTERRIER_SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_int_env("PYTERRIER_SERVER_PORT", 8000))
+    parser.add_argument("--workers", type=int, default=_int_env("PYTERRIER_SERVER_WORKERS", 1),
+                        help="number of worker processes forked after the pipelines are loaded (default: 1)")
+    parser.add_argument("--graceful-timeout", type=float, default=_int_env("PYTERRIER_SERVER_GRACEFUL_TIMEOUT", 30),
+                        help="seconds a worker may spend finishing in-flight requests when stopping")
+    parser.add_argument("--asgi", action="store_true", default=os.environ.get("PYTERRIER_SERVER_ASGI", "").lower() in ['1', 'true', 'yes'],
+                        help="serve with uvicorn (ASGI), awaiting pipeline requests on the event loop")
+    parser.add_argument("--mcp", action="store_true", default=os.environ.get("PYTERRIER_SERVER_MCP", "").lower() in ['1', 'true', 'yes'],
+                        help="also serve the MCP tools at /mcp from the same process (implies --asgi)")
+    parser.add_argument("--dev", action="store_true",
+                        help="run the Flask development server (single process, debug mode)")
+    return parser.parse_args(argv)
+
+
+class PreforkServer:
+    """
+    A minimal pre-forking server. Pipelines are loaded once in the master
+    process; workers are then forked so that index structures and models are
+    shared copy-on-write (and memory-mapped index files stay in the shared
+    page cache) instead of being duplicated per worker.
+
+    Signals (sent to the master):
+      - SIGTERM / SIGINT: stop workers gracefully, then exit
+      - SIGHUP: graceful restart, i.e. start a fresh set of workers, then stop the old ones
+        (after reloading the functions YAML file, if there is a ``reloader``)
+      - SIGTTIN / SIGTTOU: add / remove one worker
+    """
+
+    def __init__(self, app, host, port, workers, graceful_timeout=30., asgi=False, reloader=None):
+        self.app = app
+        self.asgi = asgi
+        self.reloader = reloader
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, workers)
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}  # pid -> generation
+        self.generation = 0
+        self.stopping = False
+        self.sock = None
+
+    def bind(self):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        self.sock = socket.create_server((self.host, self.port), family=family, backlog=2048)
+        # accepted connections inherit this; asyncio only sets it itself for sockets it creates, and
+        # without it small responses written in two parts wait for the client's delayed ACK (~40ms)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.set_inheritable(True)
+        logger.info(f"Listening on {self.host}:{self.port}")
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = self.generation
+            return pid
+        # --- worker process ---
+        # lets /admin/reload ask the master to reload and restart the workers
+        os.environ["PYTERRIER_SERVER_MASTER_PID"] = str(os.getppid())
+        try:
+            self._serve_worker()
+        except BaseException:
+            logger.exception("Worker crashed")
+            stop_queue_logging()
+            os._exit(1)
+        stop_queue_logging()
+        os._exit(0)
+
+    def _serve_worker(self):
+        for sig in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, signal.SIG_IGN)
+        if self.asgi:
+            import uvicorn
+            # uvicorn installs its own SIGTERM/SIGINT handlers for a graceful shutdown
+            config = uvicorn.Config(self.app, timeout_graceful_shutdown=int(self.graceful_timeout), log_config=None)
+            uvicorn.Server(config).run(sockets=[self.sock])
+            return
+
+        from werkzeug.serving import make_server
+        server = make_server(self.host, self.port, self.app, threaded=True, fd=self.sock.fileno())
+        # let server_close() wait for in-flight requests rather than killing them
+        server.daemon_threads = False
+        server.block_on_close = True
+
+        def _stop(signum, frame):
+            threading.Thread(target=server.shutdown, daemon=True).start()
+            signal.alarm(int(self.graceful_timeout) or 1)
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        signal.signal(signal.SIGALRM, lambda *_: (stop_queue_logging(), os._exit(1)))
+        logger.info(f"Worker {os.getpid()} serving")
+        server.serve_forever()
+        server.server_close()
+
+    def stop_workers(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.time() + self.graceful_timeout
+        remaining = set(pids)
+        while remaining and time.time() < deadline:
+            for pid in list(remaining):
+                if self._reap(pid, block=False):
+                    remaining.discard(pid)
+            time.sleep(0.1)
+        for pid in remaining:
+            logger.warning(f"Worker {pid} did not stop within {self.graceful_timeout}s; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._reap(pid, block=True)
+
+    def _reap(self, pid, block):
+        try:
+            done, _ = os.waitpid(pid, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            done = pid
+        if done:
+            self.workers.pop(pid, None)
+        return bool(done)
+
+    def reload(self):
+        """Reload changed functions in the master, then restart the workers so that they serve them."""
+        try:
+            result = self.reloader.reload()
+        except Exception:
+            logger.exception("Reload failed; keeping the current workers")
+            return
+        if result["changed"] or result["removed"]:
+            self.freeze()
+            self.restart()
+
+    def restart(self):
+        logger.info("Graceful restart: starting new workers")
+        old = list(self.workers)
+        self.generation += 1
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        self.stop_workers(old)
+
+    @staticmethod
+    def freeze():
+        # Move everything loaded so far out of the GC's reach, so that collections in
+        # the workers don't write to (and therefore copy) the shared pages.
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+
+    def run(self):
+        self.bind()
+        self.freeze()
+
+        pending = []
+        def _on_signal(signum, frame):
+            pending.append(signum)
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, _on_signal)
+
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        logger.info(f"Started {self.num_workers} workers: {list(self.workers)}")
+        from pyterrier_server._reload import reload_interval
+        # the master polls the YAML file itself: a watcher thread would not survive into the workers
+        watch = reload_interval() if self.reloader is not None else 0
+        next_check = time.monotonic() + watch
+
+        while True:
+            while pending:
+                sig = pending.pop(0)
+                if sig in (signal.SIGTERM, signal.SIGINT):
+                    logger.info("Stopping workers")
+                    self.stopping = True
+                    self.stop_workers(list(self.workers))
+                    self.sock.close()
+                    return
+                if sig == signal.SIGHUP:
+                    if self.reloader is not None:
+                        self.reload()
+                    else:
+                        self.restart()
+                elif sig == signal.SIGTTIN:
+                    self.num_workers += 1
+                elif sig == signal.SIGTTOU and self.num_workers > 1:
+                    self.num_workers -= 1
+                    newest = max(self.workers, key=lambda p: self.workers[p])
+                    self.stop_workers([newest])
+
+            if watch and time.monotonic() >= next_check:
+                next_check = time.monotonic() + watch
+                if self.reloader.modified():
+                    self.reload()
+
+            # reap exited workers and replace them
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = 0, 0
+            if pid and pid in self.workers:
+                self.workers.pop(pid)
+                logger.warning(f"Worker {pid} exited with status {status}; replacing it")
+            while len(self.workers) < self.num_workers and not self.stopping:
+                self.spawn_worker()
+            time.sleep(0.2)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from pyterrier_server._server import create_app
+
+    if args.dev:
+        app = create_app()
+        if app.config.get("RELOADER") is not None:
+            app.config["RELOADER"].watch()
+        app.run(host=args.host, port=args.port, debug=True)
+        return
+
+    from pyterrier_server._loader import load_pipeline
+    # load everything before forking, so the workers share it
+    args.asgi = args.asgi or args.mcp
+    app = create_app(load_pipeline(), connect_mcp=not args.mcp)
+    reloader = app.config.get("RELOADER")
+    if args.asgi:
+        from pyterrier_server._asgi import create_asgi_app
+        app = create_asgi_app(app, mcp=args.mcp)
+
+    if not hasattr(os, "fork"):
+        if args.workers > 1:
+            logger.warning("fork() is not available on this platform; running a single process")
+        if reloader is not None:
+            reloader.watch()
+        if args.asgi:
+            import uvicorn
+            uvicorn.run(app, host=args.host, port=args.port, log_config=None)
+        else:
+            from werkzeug.serving import make_server
+            make_server(args.host, args.port, app, threaded=True).serve_forever()
+        return
+    PreforkServer(app, args.host, args.port, args.workers, args.graceful_timeout, asgi=args.asgi, reloader=reloader).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# _coalescing.py
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+
+import pandas as pd
+
+from pyterrier_server._cache import ResultCache, id_column, normalize_row
+
+logger = logging.getLogger(__name__)
+
+
+class Coalescer:
+    """
+    Tracks the input rows being run through each pipeline, so that concurrent requests for the
+    same pipeline and (normalised) input wait on one execution instead of running it again.
+    Counts, per pipeline, the rows that were executed and those that were ``coalesced`` (the
+    executions saved).
+    """
+
+    def __init__(self):
+        self._inflight = {}   # key -> Future of the row's result
+        self._lock = threading.Lock()
+        self.executed = defaultdict(int)
+        self.coalesced = defaultdict(int)
+
+    def claim(self, name, keys):
+        """
+        For each distinct key, either claim it (``(future, True)``: the caller must run it and
+        resolve the future) or get the future of the execution already under way (``(future, False)``).
+        """
+        claims = {}
+        with self._lock:
+            for key in keys:
+                if key in claims:
+                    continue
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    claims[key] = future, True
+                else:
+                    claims[key] = future, False
+            self.executed[name] += sum(1 for _, own in claims.values() if own)
+            self.coalesced[name] += sum(1 for _, own in claims.values() if not own)
+        return claims
+
+    def release(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self):
+        names = sorted(set(self.executed) | set(self.coalesced))
+        return {
+            "inflight": len(self._inflight),
+            "executed": sum(self.executed.values()),
+            "coalesced": sum(self.coalesced.values()),
+            "pipelines": {n: {"executed": self.executed[n], "coalesced": self.coalesced[n]} for n in names},
+        }
+
+
+class CoalescingPipeline:
+    """
+    Wraps a pipeline callable so that rows already being run by a concurrent call (e.g. the same
+    popular query arriving many times at once) are not executed again: the call waits for that
+    execution and shares its result, or its error.
+    """
+
+    def __init__(self, pipeline, coalescer, name, version=None):
+        self.pipeline = pipeline
+        self.coalescer = coalescer
+        self.name = name
+        self.version = version
+
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not len(df):
+            return self.pipeline(df)
+        key = id_column(df)
+        rows = df.to_dict("records")
+        keys = [ResultCache.make_key(self.name, self.version, normalize_row(row, key)) for row in rows]
+        claims = self.coalescer.claim(self.name, keys)
+        owned = [k for k, (_, own) in claims.items() if own]
+
+        results = {}
+        if owned:
+            first = {}
+            for i, k in enumerate(keys):
+                first.setdefault(k, i)
+            try:
+                # give each row a unique id so its results can be told apart
+                inp = df.iloc[[first[k] for k in owned]].reset_index(drop=True)
+                inp[key] = [str(j) for j in range(len(owned))]
+                result = self.pipeline(inp)
+                if isinstance(result, pd.DataFrame):
+                    groups = {g: part for g, part in result.groupby(key, sort=False)} if len(result) else {}
+                    for j, k in enumerate(owned):
+                        results[k] = groups.get(str(j), result.iloc[0:0]).reset_index(drop=True)
+                for k in owned:
+                    # nothing to split per row: the waiting calls run their rows themselves
+                    claims[k][0].set_result(results.get(k))
+            except BaseException as e:
+                for k in owned:
+                    if not claims[k][0].done():
+                        claims[k][0].set_exception(e)
+                raise
+            finally:
+                for k in owned:
+                    self.coalescer.release(k, claims[k][0])
+            if not isinstance(result, pd.DataFrame) and len(owned) == len(claims):
+                return result
+
+        for k, (future, own) in claims.items():
+            if not own:
+                results[k] = future.result()
+        if len(results) < len(claims) or any(part is None for part in results.values()):
+            # the pipeline's results cannot be split per row; run this call on its own
+            return self.pipeline(df)
+
+        parts = [results[k].assign(**{key: row[key]}) if len(results[k]) else results[k] for k, row in zip(keys, rows)]
+        return pd.concat(parts, ignore_index=True)
+
+
+_default_coalescer = Coalescer()
+
+def default_coalescer():
+    """The coalescer shared by all pipelines in this process."""
+    return _default_coalescer
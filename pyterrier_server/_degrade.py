@@ -0,0 +1,152 @@
+# _degrade.py
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# response header naming the tier that served a request
+TIER_HEADER = "X-Pipeline-Tier"
+# the options of a tier
+TIER_OPTIONS = ("name", "k", "fields", "prefix")
+# latencies kept for the percentile, and the fewest needed to act on it
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 10
+
+
+def degrade_interval():
+    """``PYTERRIER_SERVER_DEGRADE_INTERVAL``: the fewest seconds between two tier changes of a pipeline (default: 5)."""
+    try:
+        return max(0., float(os.environ.get("PYTERRIER_SERVER_DEGRADE_INTERVAL", "5")))
+    except ValueError:
+        return 5.
+
+
+def parse_tiers(tiers, name):
+    """The fallback tiers of the ``degrade`` option of ``name``, each a dict of ``k``, ``fields`` and ``prefix``."""
+    parsed = []
+    for i, tier in enumerate(tiers or [], start=1):
+        if not isinstance(tier, dict) or not tier or set(tier) - set(TIER_OPTIONS):
+            raise ValueError(f"Invalid degradation tier for '{name}': {tier!r} (expected some of {', '.join(TIER_OPTIONS)})")
+        fields = tier.get("fields")
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(",") if f.strip()]
+        parsed.append({
+            "name": str(tier.get("name") or f"tier{i}"),
+            "level": i,
+            "k": int(tier["k"]) if tier.get("k") is not None else None,
+            "fields": fields or None,
+            "prefix": int(tier["prefix"]) if tier.get("prefix") else None,
+        })
+    if not parsed:
+        raise ValueError(f"No degradation tiers given for '{name}'")
+    return parsed
+
+
+class DegradationPolicy:
+    """
+    Serves a pipeline through cheaper fallback tiers while it is overloaded (see ``degrade`` in
+    the README). Each request is served at the current tier; the policy steps down a tier when
+    ``queue`` requests are waiting on the pipeline's executor or the ``percentile`` (default:
+    95th) of recent latencies exceeds ``latency_ms``, and steps back up once both are below
+    half of that, at most once every ``interval`` seconds. Tiers push a smaller ``k`` or fewer
+    ``fields`` down into the pipeline (e.g. to skip a text loader), or run only its first
+    ``prefix`` stages (e.g. the retrieval stages of a RAG pipeline).
+
+    The time spent in each tier is recorded.
+    """
+
+    def __init__(self, name, config, interval=None):
+        if not isinstance(config, dict):
+            raise TypeError(f"Invalid degrade option for '{name}': {config!r}")
+        self.name = name
+        self.tiers = [{"name": "full", "level": 0, "k": None, "fields": None, "prefix": None}] + parse_tiers(config.get("tiers"), name)
+        self.queue = int(config.get("queue") or 0)
+        self.latency = float(config.get("latency_ms") or 0) / 1000
+        self.percentile = float(config.get("percentile", 95))
+        if not self.queue and not self.latency:
+            raise ValueError(f"Degradation for '{name}' needs a 'queue' or 'latency_ms' threshold")
+        self.interval = degrade_interval() if interval is None else float(interval)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.level = 0
+        self.changes = 0
+        self._changed = self._since = time.monotonic()
+        self._seconds = [0.] * len(self.tiers)
+
+    def recent_latency(self):
+        """The ``percentile`` of the latencies observed since the last tier change (``None`` if there are too few)."""
+        if len(self._latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def _account(self, now):
+        self._seconds[self.level] += now - self._since
+        self._since = now
+
+    def select(self, executor):
+        """The tier to serve the next request with, stepping down or up first if the load calls for it."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._changed >= self.interval:
+                queued = executor.queued
+                latency = self.recent_latency()
+                overloaded = ((self.queue and queued >= self.queue)
+                              or (self.latency and latency is not None and latency > self.latency))
+                relaxed = ((not self.queue or queued <= self.queue // 2)
+                           and (not self.latency or latency is None or latency <= self.latency / 2))
+                step = 1 if overloaded else -1 if relaxed else 0
+                if 0 <= self.level + step < len(self.tiers) and step:
+                    self._account(now)
+                    self.level += step
+                    self.changes += 1
+                    self._changed = now
+                    # latencies at the old tier say little about the new one
+                    self._latencies.clear()
+                    logger.warning(f"Serving '{self.name}' at tier '{self.tiers[self.level]['name']}' "
+                                   f"({queued} queued, p{self.percentile:g} latency "
+                                   f"{'n/a' if latency is None else f'{latency * 1000:.0f}ms'})")
+            return self.tiers[self.level]
+
+    def observe(self, tier, seconds):
+        """Record the latency of a request served at ``tier``."""
+        with self._lock:
+            if tier["level"] == self.level:
+                self._latencies.append(seconds)
+
+    @staticmethod
+    def options(tier, k=None, fields=None):
+        """The runner options (``k``, ``fields``, ``prefix``) for a request asking for ``k`` and ``fields``, served at ``tier``."""
+        if tier["k"] is not None:
+            k = tier["k"] if k is None else min(k, tier["k"])
+        return {"k": k, "fields": fields or tier["fields"], "prefix": tier["prefix"]}
+
+    def stats(self):
+        with self._lock:
+            self._account(time.monotonic())
+            latency = self.recent_latency()
+            return {
+                "tier": self.tiers[self.level]["name"],
+                "level": self.level,
+                "changes": self.changes,
+                "queue": self.queue,
+                "latency_ms": self.latency * 1000 or None,
+                "recent_latency_ms": round(latency * 1000, 3) if latency is not None else None,
+                "seconds": {tier["name"]: round(seconds, 3) for tier, seconds in zip(self.tiers, self._seconds)},
+            }
+
+
+def get_policy(name, info):
+    """The degradation policy of ``name``, from its ``degrade`` option (``None`` if it has none, or an invalid one)."""
+    if "degradation" not in info:
+        policy = None
+        if info.get("degrade"):
+            try:
+                policy = DegradationPolicy(name, info["degrade"])
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Not degrading '{name}': {e}")
+        info["degradation"] = policy
+    return info["degradation"]
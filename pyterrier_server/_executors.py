@@ -0,0 +1,201 @@
+# _executors.py
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(RuntimeError):
+    """Raised when a pipeline's queue is full and a request is rejected."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Pipeline '{name}' is overloaded; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised for requests whose deadline passed before (or while) they ran."""
+
+
+def _env(var, default, cast=int):
+    try:
+        return cast(os.environ.get(var, default))
+    except ValueError:
+        return cast(default)
+
+
+class PipelineExecutor:
+    """
+    A bounded executor for a single pipeline.
+
+    At most ``max_workers`` requests run at once and at most ``max_queue`` more
+    wait; anything beyond that is rejected immediately with :class:`Overloaded`,
+    so that a burst on one (expensive) pipeline cannot starve the others or
+    exhaust memory. Requests carry a deadline; queued work whose deadline has
+    passed is dropped rather than run.
+    """
+
+    def __init__(self, name, max_workers=4, max_queue=64, timeout=None):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout = float(timeout) if timeout else None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self._avg_time = 0.
+
+    def _executor(self):
+        # thread pools do not survive fork(); create one per process
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"pipeline-{self.name}")
+            self._pid = os.getpid()
+        return self._pool
+
+    @property
+    def depth(self):
+        """Number of requests currently running or waiting."""
+        return self.running + self.queued
+
+    def retry_after(self):
+        """A rough estimate (in whole seconds) of how long until there is room in the queue."""
+        backlog = self.depth / self.max_workers
+        return max(1, math.ceil(backlog * (self._avg_time or 1.)))
+
+    def deadline(self, timeout=None):
+        """The absolute deadline for a request that may take ``timeout`` seconds (capped by the configured timeout)."""
+        timeouts = [t for t in (timeout, self.timeout) if t]
+        return time.monotonic() + min(timeouts) if timeouts else None
+
+    def submit(self, fn, *args, deadline=None, **kwargs):
+        with self._lock:
+            if self.depth >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after())
+            self.queued += 1
+            executor = self._executor()
+        # set once the request has expired, whether the worker or the caller (see expire) finds out first
+        expired = [False]
+
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            start = time.monotonic()
+            try:
+                if deadline is not None and start >= deadline:
+                    self._expire(expired)
+                    raise DeadlineExceeded(f"Request for '{self.name}' expired while queued")
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    # only the requests that finished in time say how long requests take
+                    if not expired[0]:
+                        self._avg_time = 0.9 * self._avg_time + 0.1 * elapsed if self._avg_time else elapsed
+
+        future = executor.submit(run)
+        future.expired = expired
+
+        def _cancelled(f):
+            if f.cancelled():
+                with self._lock:
+                    self.queued -= 1
+        future.add_done_callback(_cancelled)
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Run ``fn`` on this executor and wait for it, giving up (and cancelling it if still queued) at the deadline."""
+        deadline = self.deadline(timeout)
+        future = self.submit(fn, *args, deadline=deadline, **kwargs)
+        wait = None if deadline is None else max(0., deadline - time.monotonic())
+        try:
+            return future.result(timeout=wait)
+        except FuturesTimeoutError as e:
+            if isinstance(e, DeadlineExceeded):
+                raise
+            self.expire(future)
+            raise DeadlineExceeded(f"Request for '{self.name}' did not finish within its deadline") from e
+
+    def expire(self, future):
+        """Give up on ``future`` (from :meth:`submit`) at its deadline, cancelling it if it is still queued."""
+        future.cancel()
+        self._expire(future.expired)
+
+    def _expire(self, expired):
+        # count each request once
+        with self._lock:
+            if not expired[0]:
+                expired[0] = True
+                self.expired += 1
+
+    def run_patiently(self, fn, *args, **kwargs):
+        """Like :meth:`run`, but wait for room in the queue instead of failing with :class:`Overloaded` (for bulk work)."""
+        while True:
+            try:
+                future = self.submit(fn, *args, **kwargs)
+            except Overloaded as e:
+                time.sleep(e.retry_after)
+                continue
+            return future.result()
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; with ``wait``, block until the running and queued requests have finished."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait=wait)
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "running": self.running,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
+
+
+def make_executor(name, config=None):
+    """
+    Builds the :class:`PipelineExecutor` for a function from its ``concurrency`` setting in the
+    YAML file (``max_workers``, ``max_queue``, ``timeout``), falling back to:
+      - PYTERRIER_SERVER_MAX_WORKERS     (default: 4)
+      - PYTERRIER_SERVER_MAX_QUEUE       (default: 64)
+      - PYTERRIER_SERVER_REQUEST_TIMEOUT (default: none, in seconds)
+    """
+    config = config or {}
+    return PipelineExecutor(
+        name,
+        max_workers=config.get("max_workers", _env("PYTERRIER_SERVER_MAX_WORKERS", 4)),
+        max_queue=config.get("max_queue", _env("PYTERRIER_SERVER_MAX_QUEUE", 64)),
+        timeout=config.get("timeout", _env("PYTERRIER_SERVER_REQUEST_TIMEOUT", 0, float)),
+    )
+
+
+def get_executor(name, info):
+    """Return the executor for ``name``, creating it on first use so that every entry point shares it."""
+    if "executor" not in info:
+        config = dict(info.get("concurrency") or {})
+        batching = info.get("batching")
+        if batching and "max_workers" not in config:
+            # workers mostly wait on the micro-batcher, so allow enough of them to fill a batch
+            batch_size = batching.get("max_batch_size", 32) if isinstance(batching, dict) else 32
+            config["max_workers"] = max(batch_size, _env("PYTERRIER_SERVER_MAX_WORKERS", 4))
+        info["executor"] = make_executor(name, config)
+    return info["executor"]
@@ -0,0 +1,227 @@
+# _federation.py
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
+
+import pandas as pd
+import pyterrier as pt
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# the most requests in flight to each shard
+MAX_CONNECTIONS = 16
+# seconds a shard's response may still be read after the deadline
+READ_GRACE = 1.
+
+
+def shard_timeout():
+    """``PYTERRIER_SERVER_SHARD_TIMEOUT``: seconds to wait for a shard before answering without it (default: 5)."""
+    try:
+        return max(0.001, float(os.environ.get("PYTERRIER_SERVER_SHARD_TIMEOUT", "5")))
+    except ValueError:
+        return 5.
+
+
+class ShardsUnavailable(RuntimeError):
+    """Raised when none of the shards of a federated pipeline answered in time."""
+
+
+class Shard:
+    """A pipeline served by a remote pyterrier-server, queried through its batch endpoint."""
+
+    def __init__(self, url, pipeline):
+        self.url = url.rstrip("/")
+        self.pipeline = pipeline
+        self.endpoint = f"{self.url}/pipeline/{pipeline}/batch"
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.seconds = 0.
+
+    def search(self, session, rows, k=None, timeout=None):
+        """The results of the shard for ``rows`` (asked through ``session``), as a dict of qid to result records."""
+        start = time.perf_counter()
+        try:
+            response = session.post(
+                self.endpoint,
+                params={"k": k} if k is not None else None,
+                data="\n".join(json.dumps(row, default=str) for row in rows),
+                headers={"Content-Type": "application/x-ndjson"},
+                # the caller gives up on the shard at the deadline; the grace period keeps
+                # the connection from being dropped just before it
+                timeout=None if timeout is None else (timeout, timeout + READ_GRACE))
+            response.raise_for_status()
+            results = {}
+            for line in response.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "error" in record:
+                    raise RuntimeError(record["error"])
+                results[str(record["qid"])] = record["results"]
+        finally:
+            with self._lock:
+                self.requests += 1
+                self.seconds += time.perf_counter() - start
+        return results
+
+    def record(self, outcome):
+        """Count a request that ``failed`` or ``timed_out``."""
+        with self._lock:
+            if outcome == "timed_out":
+                self.timeouts += 1
+            else:
+                self.failures += 1
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "pipeline": self.pipeline,
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "mean_ms": round(self.seconds / self.requests * 1000, 3) if self.requests else None,
+        }
+
+
+def parse_shards(shards, name):
+    """``(url, pipeline)`` pairs from the ``shards`` option: URLs, or dicts with a ``url`` and a ``pipeline`` (default: ``name``)."""
+    parsed = []
+    for shard in shards or []:
+        if isinstance(shard, str):
+            shard = {"url": shard}
+        if not isinstance(shard, dict) or not shard.get("url"):
+            raise ValueError(f"Invalid shard for '{name}': {shard!r} (expected a URL, or a dict with a 'url')")
+        parsed.append((shard["url"], shard.get("pipeline") or name))
+    if not parsed:
+        raise ValueError(f"No shards given for '{name}'")
+    return parsed
+
+
+def merge(inp, results, k=None):
+    """
+    Merge the per-shard ``results`` (dicts of qid to result records) for the queries of ``inp``
+    into one ranking per query, by descending score; a document returned by several shards is
+    kept once, with its best score. The queries keep the order of ``inp``.
+    """
+    columns = list(inp.columns) + [c for c in ["docno", "score", "rank"] if c not in inp.columns]
+    frames = [pd.DataFrame(records) for result in results for records in result.values() if records]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    merged = pd.concat(frames, ignore_index=True)
+    qids = {str(qid): qid for qid in inp["qid"]}
+    order = {qid: i for i, qid in enumerate(qids)}
+    merged["qid"] = merged["qid"].astype(str)
+    merged = merged[merged["qid"].isin(order)]
+    merged = (merged.assign(_order=merged["qid"].map(order))
+              .sort_values(["_order", "score"], ascending=[True, False], kind="stable")
+              .drop(columns="_order")
+              .drop_duplicates(["qid", "docno"]))
+    merged["rank"] = merged.groupby("qid", sort=False).cumcount()
+    if k is not None:
+        merged = merged[merged["rank"] < k]
+    merged["qid"] = merged["qid"].map(qids)
+    # input columns the shards did not return (e.g. query variants), from the input frame
+    missing = [c for c in inp.columns if c not in merged.columns]
+    if missing:
+        merged = merged.merge(inp[["qid"] + missing].drop_duplicates("qid"), on="qid", how="left")
+    return merged[[c for c in columns if c in merged.columns] + [c for c in merged.columns if c not in columns]].reset_index(drop=True)
+
+
+class Federation(pt.Transformer):
+    """
+    A retriever whose index is split over several remote pyterrier-servers (see ``shards`` in
+    the README). Each batch of queries is sent to every shard concurrently, over a pool of
+    keep-alive connections, and the per-shard rankings are merged by score, so the shards'
+    scores must be comparable (e.g. computed with global collection statistics).
+
+    A shard that fails, or does not answer within ``timeout`` seconds, is left out of the
+    results (which are then partial); :class:`ShardsUnavailable` is raised only if no shard
+    answered. A following rank cutoff is pushed down to the shards, which are asked for their
+    top ``k`` only.
+    """
+
+    def __init__(self, shards, name=None, k=None, timeout=None):
+        self.name = name
+        self.k = int(k) if k is not None else None
+        self.timeout = float(timeout) if timeout is not None else shard_timeout()
+        self.shards = [Shard(url, pipeline) for url, pipeline in parse_shards(shards, name)]
+        self._lock = threading.Lock()
+        # shared with the copies made by fuse_rank_cutoff
+        self.counters = {"partial": 0}
+        self._process = {}
+
+    def _connections(self):
+        """
+        The session (with its pooled connections) and the threads of this process: neither is
+        shared with forked processes (e.g. pre-forked workers), which make their own.
+        """
+        with self._lock:
+            if self._process.get("pid") != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(self.shards), pool_maxsize=MAX_CONNECTIONS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                pool = ThreadPoolExecutor(max_workers=len(self.shards) * MAX_CONNECTIONS,
+                                          thread_name_prefix=f"shards-{self.name}")
+                self._process.update(pid=os.getpid(), session=session, pool=pool)
+            return self._process["session"], self._process["pool"]
+
+    def __repr__(self):
+        return f"Federation({[shard.endpoint for shard in self.shards]!r}, k={self.k})"
+
+    def transform_inputs(self):
+        return [["qid", "query"]]
+
+    def transform_outputs(self, input_columns):
+        return list(input_columns) + [c for c in ["docno", "score", "rank"] if c not in input_columns]
+
+    def fuse_rank_cutoff(self, k):
+        if self.k is not None and self.k <= k:
+            return self
+        # shares the connections, threads and counters of this federation
+        fused = copy.copy(self)
+        fused.k = k
+        return fused
+
+    def transform(self, inp):
+        if not len(inp):
+            return merge(inp, [], self.k)
+        rows = inp.to_dict("records")
+        session, pool = self._connections()
+        futures = {pool.submit(shard.search, session, rows, self.k, self.timeout): shard for shard in self.shards}
+        done, _ = futures_wait(futures, timeout=self.timeout)
+        results, failed = [], {}
+        for future, shard in futures.items():
+            if future not in done:
+                shard.record("timed_out")
+                failed[shard.url] = f"no answer within {self.timeout:g}s"
+                continue
+            try:
+                results.append(future.result())
+            except Exception as e:  # noqa: BLE001 - a failed shard only makes the results partial
+                shard.record("failed")
+                failed[shard.url] = str(e)
+        if not results:
+            raise ShardsUnavailable(f"No shard of '{self.name}' answered: {failed}")
+        if failed:
+            with self._lock:
+                self.counters["partial"] += 1
+            logger.warning(f"Partial results for '{self.name}': {len(failed)}/{len(self.shards)} shards failed: {failed}")
+        return merge(inp, results, self.k)
+
+    def stats(self):
+        return {
+            "k": self.k,
+            "timeout": self.timeout,
+            "partial": self.counters["partial"],
+            "shards": [shard.stats() for shard in self.shards],
+        }
@@ -0,0 +1,251 @@
+# _handler.py
+import asyncio
+import concurrent.futures
+import functools
+import json
+import os
+import time
+
+import pandas as pd
+
+from pyterrier_server._degrade import TIER_HEADER, get_policy
+from pyterrier_server._executors import DeadlineExceeded, Overloaded
+from pyterrier_server._loader import PipelineNotReady
+from pyterrier_server._profiling import (
+    is_admin,
+    profile_pipeline,
+    profiling_enabled,
+    wants_profile,
+)
+from pyterrier_server._runner import get_pipeline, get_runner
+from pyterrier_server._serialize import (
+    NotAcceptable,
+    negotiate,
+    parse_fields,
+    parse_limit,
+    project,
+    serialize,
+)
+from pyterrier_server._streaming import SSE, stream_pipeline, wants_stream
+
+# tasks whose pipelines take documents rather than queries
+DOCUMENT_TASKS = ("doc2query", "indexing")
+
+
+def json_default(o):
+    # numpy scalars (e.g. int64 ranks) are not JSON serialisable by default
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+def document_side(info):
+    """Whether the pipeline of ``info`` takes documents (``docno``/``text``) rather than queries."""
+    if info.get("task") in DOCUMENT_TASKS:
+        return True
+    inputs = {p.get("phrase") or p.get("name") for p in info.get("properties") or [] if isinstance(p, dict)}
+    return "docno" in inputs and not inputs & {"qid", "query"}
+
+
+def input_row(info, body, default_id=1):
+    """Build the input row for the pipeline of ``info`` from a request body."""
+    if document_side(info):
+        return {
+            "docno": str(body.get("docno") or default_id),
+            "text": body.get("text") or body.get("q") or ""
+        }
+    return {
+        "qid": str(body.get("qid") or default_id),
+        "query": body.get("query") or body.get("q") or ""
+    }
+
+
+def json_object(body):
+    """
+    The JSON object a request carries, given its parsed body (``{}`` if it has none, or it is not
+    valid JSON). Raises ``TypeError`` for any other JSON value, such as an array.
+    """
+    if body is None:
+        return {}
+    if not isinstance(body, dict):
+        raise TypeError(f"The request body must be a JSON object, not {type(body).__name__}")
+    return body
+
+
+def response_options(args, headers, body):
+    """
+    The ``(fields, limit, k, mimetype)`` requested for a response: ``fields``, ``limit`` and ``k`` come from
+    the query string or the body, the format from ``?format=`` or the ``Accept`` header.
+    Raises ``ValueError`` (or :class:`NotAcceptable`) for invalid values.
+    """
+    def option(name):
+        # (a 0 in the body is given, and invalid, rather than missing)
+        value = args.get(name)
+        return body.get(name) if value in (None, "") else value
+    fields = parse_fields(option("fields"))
+    limit = parse_limit(option("limit"))
+    k = parse_limit(option("k"), "k")
+    mimetype = negotiate(headers.get("Accept"), args.get("format"))
+    return fields, limit, k, mimetype
+
+
+def request_timeout(headers, body):
+    """The per-request timeout in seconds, from the ``X-Request-Timeout`` header or a ``timeout`` field in the body."""
+    value = headers.get("X-Request-Timeout") or body.get("timeout")
+    try:
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+class Reply:
+    """
+    A response to send, which each front end (Flask or ASGI) turns into its own kind of response.
+    With ``stream``, ``body`` is an iterator of server-sent events.
+    """
+
+    def __init__(self, status, body, mimetype="application/json", headers=None, stream=False):
+        self.status = status
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        self.stream = stream
+
+    @classmethod
+    def json(cls, data, status=200, headers=None):
+        return cls(status, json.dumps(data, default=json_default), headers=headers)
+
+    @classmethod
+    def error(cls, message, status, headers=None):
+        return cls.json({"error": message}, status, headers)
+
+
+def error_reply(e, headers=None):
+    """The reply for a request to a pipeline that failed with ``e`` (``headers`` are sent with 500s and 504s)."""
+    if isinstance(e, PipelineNotReady):
+        return Reply.error(str(e), 503, {"Retry-After": os.environ.get("PYTERRIER_SERVER_RETRY_AFTER", "5")})
+    if isinstance(e, Overloaded):
+        return Reply.error(str(e), 503, {"Retry-After": str(e.retry_after)})
+    if isinstance(e, (TimeoutError, asyncio.TimeoutError, concurrent.futures.TimeoutError)):
+        return Reply.error(str(e) or "Request did not finish within its deadline", 504, headers)
+    return Reply.error(str(e), 500, headers)
+
+
+class PipelineCall:
+    """
+    One request to ``POST /pipeline/<name>``, from its body to its reply, shared by the Flask
+    endpoint and the native ASGI one. :meth:`start` parses the request and hands it to the
+    pipeline's executor; the front end then waits for it in its own way (:meth:`wait` blocks,
+    :meth:`wait_async` awaits) and gets the reply from :meth:`finish`.
+
+    Unless it is profiled, the request is served at the tier its pipeline's degradation policy
+    picks (see ``_degrade.py``), which is named in the ``X-Pipeline-Tier`` header.
+    """
+
+    def __init__(self, name, info, executor, args, headers, body):
+        self.name = name
+        self.info = info
+        self.executor = executor
+        self.args = args
+        self.headers = headers
+        self.body = body
+        self.profile = False
+        self.policy = self.tier = None
+        self.reply_headers = {}
+        self.future = self.deadline = None
+
+    def start(self):
+        """Parse the request and submit it, returning the reply to send straight away (e.g. a stream, or an error), if any."""
+        try:
+            body = self.body = json_object(self.body)
+        except TypeError as e:
+            return Reply.error(str(e), 400)
+        stream = wants_stream(self.args, self.headers, body)
+        try:
+            # a stream is always made of JSON events, whatever the Accept header says
+            self.fields, self.limit, k, self.mimetype = response_options(self.args, {} if stream else self.headers, body)
+        except NotAcceptable as e:
+            return Reply.error(str(e), 406)
+        except ValueError as e:
+            return Reply.error(str(e), 400)
+
+        timeout = request_timeout(self.headers, body)
+        df = pd.DataFrame([input_row(self.info, body)])
+        try:
+            if stream:
+                events = stream_pipeline(
+                    self.executor,
+                    get_pipeline(self.name, self.info, k=k, fields=self.fields),
+                    df,
+                    project=functools.partial(project, fields=self.fields, limit=self.limit),
+                    timeout=timeout)
+                # no-cache/no-buffering so that proxies pass each event on as soon as it is sent
+                return Reply(200, events, SSE, {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, stream=True)
+            self.profile = wants_profile(self.args, body)
+            if self.profile:
+                if not (profiling_enabled() or is_admin(self.headers)):
+                    return Reply.error("Profiling requires PYTERRIER_SERVER_PROFILING or an admin token", 403)
+                run = functools.partial(profile_pipeline, get_pipeline(self.name, self.info, k=k, fields=self.fields))
+            else:
+                # under load, a cheaper tier may serve the request
+                self.policy = get_policy(self.name, self.info)
+                self.tier = self.policy.select(self.executor) if self.policy is not None else None
+                options = {"k": k, "fields": self.fields}
+                if self.tier is not None:
+                    options = self.policy.options(self.tier, k, self.fields)
+                    self.reply_headers[TIER_HEADER] = self.tier["name"]
+                run = get_runner(self.name, self.info, **options)
+            self.deadline = self.executor.deadline(timeout)
+            self.future = self.executor.submit(run, df, deadline=self.deadline)
+        except (PipelineNotReady, Overloaded) as e:
+            return error_reply(e)
+        self.started = time.perf_counter()
+        return None
+
+    def remaining(self):
+        """Seconds left until the request's deadline (``None`` if it has none)."""
+        return None if self.deadline is None else max(0., self.deadline - time.monotonic())
+
+    def wait(self):
+        """Block until the request has finished or its deadline has passed, returning the reply."""
+        concurrent.futures.wait([self.future], timeout=self.remaining())
+        return self.finish()
+
+    async def wait_async(self):
+        """Like :meth:`wait`, but awaiting the request on the event loop."""
+        try:
+            await asyncio.wait([asyncio.wrap_future(self.future)], timeout=self.remaining())
+        except asyncio.CancelledError:
+            # the client went away: drop the work if it is still queued
+            self.future.cancel()
+            raise
+        return self.finish()
+
+    def finish(self):
+        """The reply for the submitted request, which has finished or run out of time."""
+        elapsed = time.perf_counter() - self.started
+        if not self.future.done() or self.future.cancelled():
+            self.executor.expire(self.future)
+            error = DeadlineExceeded(f"Request for '{self.name}' did not finish within its deadline")
+        else:
+            error = self.future.exception()
+        if self.tier is not None and (error is None or isinstance(error, DeadlineExceeded)):
+            self.policy.observe(self.tier, elapsed)
+        if error is not None:
+            return error_reply(error, self.reply_headers)
+
+        result = self.future.result()
+        try:
+            if self.profile:
+                result, profile = result
+                if isinstance(result, pd.DataFrame):
+                    result = json.loads(serialize(project(result, self.fields, self.limit))[0])
+                return Reply.json({"results": result, "profile": profile})
+            if not isinstance(result, pd.DataFrame):
+                return Reply.json(result, headers=self.reply_headers)
+            data, mimetype = serialize(project(result, self.fields, self.limit), self.mimetype)
+        except NotAcceptable as e:
+            return Reply.error(str(e), 406)
+        except ValueError as e:
+            return Reply.error(str(e), 400)
+        return Reply(200, data, mimetype, self.reply_headers)
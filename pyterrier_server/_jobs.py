@@ -0,0 +1,281 @@
+# _jobs.py
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from pyterrier_server._executors import get_executor
+from pyterrier_server._runner import LoadedPipeline
+from pyterrier_server._serialize import serialize
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("completed", "failed", "cancelled")
+# bytes read at a time when receiving a collection
+UPLOAD_BLOCK = 1 << 20
+
+
+def jobs_dir():
+    """``PYTERRIER_SERVER_JOBS_DIR``: where background jobs keep their input, results and checkpoints (default: ``./pyterrier_jobs``)."""
+    return os.environ.get("PYTERRIER_SERVER_JOBS_DIR", "./pyterrier_jobs")
+
+
+class JobNotFound(KeyError):
+    """Raised for an unknown job id."""
+
+
+class JobManager:
+    """
+    Runs large JSONL collections (e.g. documents for doc2query or indexing) through a pipeline
+    in the background.
+
+    Each job is a directory holding the uploaded ``input.jsonl``, the ``output.jsonl`` results
+    (one line per input row, appended as each chunk finishes) and ``job.json``, its state and
+    checkpoint: after every chunk, the results are flushed to disk and the input and output
+    offsets recorded, so that a job interrupted by a crash or a restart resumes from its last
+    chunk (see :meth:`start`). Chunks run on the pipeline's executor, so they share its
+    concurrency limits with online requests.
+
+    Jobs are run by one thread per process; a lock file makes sure that each job is only run by
+    one process (e.g. of several pre-forked workers) at a time. ``make_row`` builds a pipeline's
+    input row from a JSON record.
+    """
+
+    def __init__(self, pipelines, make_row, directory=None):
+        self.pipelines = pipelines
+        self.make_row = make_row
+        self.directory = directory or jobs_dir()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def path(self, job_id, filename=""):
+        if not job_id or not all(c.isalnum() for c in job_id):
+            raise JobNotFound(job_id)
+        return os.path.join(self.directory, job_id, filename)
+
+    def read(self, job_id):
+        """The state of job ``job_id``, with its progress."""
+        try:
+            with open(self.path(job_id, "job.json")) as f:
+                job = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise JobNotFound(job_id)
+        if job["status"] == "running" and os.path.exists(self.path(job_id, "cancel")):
+            job["status"] = "cancelling"
+        job["progress"] = round(job["checkpoint"]["line"] / job["total"], 4) if job["total"] else 1.
+        return job
+
+    def _write(self, job):
+        job["updated"] = time.time()
+        tmp = self.path(job["id"], "job.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({k: v for k, v in job.items() if k != "progress"}, f)
+        os.replace(tmp, self.path(job["id"], "job.json"))
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = []
+        for job_id in os.listdir(self.directory):
+            try:
+                jobs.append(self.read(job_id))
+            except JobNotFound:
+                pass
+        return sorted(jobs, key=lambda job: job["created"])
+
+    def submit(self, name, stream, chunk_size):
+        """Save the JSONL collection read from the file-like ``stream`` and queue it for pipeline ``name``."""
+        self.start()
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.path(job_id), exist_ok=True)
+        total = 0
+        last = b"\n"
+        with open(self.path(job_id, "input.jsonl"), "wb") as f:
+            while block := stream.read(UPLOAD_BLOCK):
+                f.write(block)
+                total += block.count(b"\n")
+                last = block[-1:]
+        if last != b"\n":
+            total += 1
+        job = {
+            "id": job_id,
+            "pipeline": name,
+            "version": self.pipelines[name].get("version"),
+            "status": "queued",
+            "chunk_size": chunk_size,
+            # lines, as blank lines are only skipped when they are read
+            "total": total,
+            "processed": 0,
+            "errors": 0,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "error": None,
+            "checkpoint": {"line": 0, "input_offset": 0, "output_offset": 0},
+        }
+        self._write(job)
+        logger.info(f"Queued job {job_id} for '{name}' ({total} lines)")
+        self._queue.put(job_id)
+        return self.read(job_id)
+
+    def cancel(self, job_id):
+        """Stop job ``job_id`` after its current chunk (the results so far are kept)."""
+        job = self.read(job_id)
+        if job["status"] in FINISHED:
+            return job
+        open(self.path(job_id, "cancel"), "w").close()
+        if job["status"] == "queued":
+            job.update(status="cancelled", finished=time.time())
+            self._write(job)
+        return self.read(job_id)
+
+    def resume(self, job_id):
+        """Queue a failed or cancelled job ``job_id`` again, to continue from its last checkpoint."""
+        self.start()
+        job = self.read(job_id)
+        if job["status"] == "completed":
+            return job
+        if os.path.exists(self.path(job_id, "cancel")):
+            os.remove(self.path(job_id, "cancel"))
+        if job["status"] in FINISHED:
+            job.update(status="queued", error=None, finished=None)
+            self._write(job)
+        self._queue.put(job_id)
+        return self.read(job_id)
+
+    def start(self):
+        """
+        Start running jobs in the background, resuming those left unfinished (once per process,
+        as threads do not survive a fork).
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            for job in self.list():
+                if job["status"] in ("queued", "running", "cancelling"):
+                    self._queue.put(job["id"])
+
+            def _work():
+                while True:
+                    job_id = self._queue.get()
+                    try:
+                        self.run(job_id)
+                    except Exception:
+                        logger.exception(f"Job {job_id} failed")
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=_work, name="jobs", daemon=True)
+            self._thread.start()
+
+    def run(self, job_id):
+        """Run job ``job_id`` from its last checkpoint, unless another process is running it."""
+        with open(self.path(job_id, "lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            job = self.read(job_id)
+            if job["status"] in FINISHED:
+                return
+            if os.path.exists(self.path(job_id, "cancel")):
+                job.update(status="cancelled", finished=time.time())
+                self._write(job)
+                return
+            name = job["pipeline"]
+            info = self.pipelines.get(name)
+            if info is None:
+                job.update(status="failed", error=f"Unknown pipeline '{name}'", finished=time.time())
+                self._write(job)
+                return
+            if job["version"] != info.get("version"):
+                logger.warning(f"Job {job_id} was started with another version of '{name}'")
+            job.update(status="running", started=job["started"] or time.time())
+            self._write(job)
+            try:
+                self._run_chunks(job, name, info)
+            except Exception as e:
+                logger.exception(f"Job {job_id} failed at line {job['checkpoint']['line']}; it can be resumed")
+                job.update(status="failed", error=str(e), finished=time.time())
+            self._write(job)
+
+    def _run_chunks(self, job, name, info):
+        executor = get_executor(name, info)
+        pipeline = LoadedPipeline(info, name=name)
+        checkpoint = job["checkpoint"]
+        output = self.path(job["id"], "output.jsonl")
+        if not os.path.exists(output):
+            open(output, "wb").close()
+        with open(self.path(job["id"], "input.jsonl"), "rb") as src, open(output, "r+b") as out:
+            # drop the results of a chunk that was not checkpointed
+            out.truncate(checkpoint["output_offset"])
+            out.seek(checkpoint["output_offset"])
+            src.seek(checkpoint["input_offset"])
+            line = checkpoint["line"]
+            while True:
+                if os.path.exists(self.path(job["id"], "cancel")):
+                    job.update(status="cancelled", finished=time.time())
+                    logger.info(f"Cancelled job {job['id']} at line {line}")
+                    return
+                # the input rows of the chunk, and the lines that are not valid rows
+                rows, entries, errors = [], [], 0
+                while len(rows) < job["chunk_size"]:
+                    raw = src.readline()
+                    if not raw:
+                        break
+                    line += 1
+                    if not raw.strip():
+                        continue
+                    try:
+                        record = json.loads(raw)
+                        if not isinstance(record, dict):
+                            raise TypeError("not a JSON object")
+                    except (ValueError, TypeError) as e:
+                        entries.append(json.dumps({"line": line, "error": f"Invalid JSON: {e}"}) + "\n")
+                        errors += 1
+                        continue
+                    rows.append(self.make_row(info, record, default_id=line))
+                    entries.append(rows[-1])
+                if not entries:
+                    break
+                results = iter(self._results(executor, pipeline, rows) if rows else [])
+                # in input order, one line per row
+                out.writelines((entry if isinstance(entry, str) else next(results)).encode() for entry in entries)
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.update(line=line, input_offset=src.tell(), output_offset=out.tell())
+                job["processed"] += len(entries)
+                job["errors"] += errors
+                self._write(job)
+        job.update(status="completed", finished=time.time())
+        logger.info(f"Completed job {job['id']} for '{name}': {job['processed']} rows in "
+                    f"{job['finished'] - job['started']:.1f}s")
+
+    @staticmethod
+    def _results(executor, pipeline, rows):
+        """
+        The output line of each of a chunk of input ``rows``, in order, with its qid (or docno) and results.
+        Rows are told apart by position, so rows sharing an id get a line each.
+        """
+        key = "docno" if "docno" in rows[0] and "qid" not in rows[0] else "qid"
+        ids = [row[key] for row in rows]
+        result = executor.run_patiently(pipeline, pd.DataFrame(rows).assign(**{key: [str(j) for j in range(len(rows))]}))
+        if not isinstance(result, pd.DataFrame):
+            raise TypeError(f"Pipeline returned {type(result).__name__}")
+        groups = {k: g for k, g in result.groupby(key, sort=False)} if len(result) else {}
+        lines = []
+        for j, i in enumerate(ids):
+            group = groups.get(str(j))
+            records = serialize(group.assign(**{key: i}))[0].decode() if group is not None else "[]"
+            lines.append(f'{{{json.dumps(key)}: {json.dumps(i, default=str)}, "results": {records}}}\n')
+        return lines
@@ -4,12 +4,266 @@ from pyterrier import inspect, model as pt_model
 from dotenv import load_dotenv
 import logging
 import json
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
+import pandas as pd
+from pyterrier_server._artifacts import default_registry, rss_bytes
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-def load_pipeline():
-    """Load one or more PyTerrier pipelines from the ``PYTERRIER_SERVER_PIPELINE`` environment variable."""
+# Per-function serving options that are passed through from the YAML file as-is
+SERVER_OPTIONS = ["batching", "batch_chunk_size", "cache", "coalesce", "warmup", "concurrency", "memory", "store", "degrade"]
+
+def parse_size(value):
+    """A memory size in bytes, from a number or a string such as ``512M``, ``8GB`` or ``1.5G``; ``None`` if unset."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().upper().rstrip("B").rstrip("I")
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+def function_version(function):
+    """A short hash of a function's YAML definition, used to tell apart results from different versions of it."""
+    payload = json.dumps(function, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+def result_version(function, shared_code=None):
+    """
+    A short hash of what determines a function's results: its definition without the serving
+    options, and the ``shared`` section it may use. Stored results are tied to it.
+    """
+    definition = {k: v for k, v in function.items() if k not in SERVER_OPTIONS}
+    return function_version({"function": definition, "shared": shared_code or ""})
+
+def load_shared(code):
+    """
+    Execute the optional top-level ``shared`` section of the YAML file once, returning
+    the variables it defines so that every function can use them.
+    """
+    if not code:
+        return {}
+    _globals = {'pt': pt}
+    _locals = {}
+    exec(code, _globals, _locals)  # noqa: S102 - like each function's pipeline, the shared section is code
+    shared = {k: v for k, v in _locals.items() if not k.startswith('_')}
+    logger.info(f"Loaded shared artifacts: {list(shared.keys())}")
+    return shared
+
+class PipelineNotReady(RuntimeError):
+    """Raised when a request arrives for a pipeline that has not finished loading (or failed to load)."""
+
+
+class FunctionLoader:
+    """
+    Builds the pipeline for a single function of the YAML file and records its
+    load state in the function's info dict: ``pending`` → ``loading`` →
+    ``ready`` (or ``failed``). Functions marked ``lazy: true`` stay ``lazy``
+    until their first request; functions that were unloaded to save memory
+    (``unloaded``) are built again on their next request.
+
+    A function with ``shards`` is federated: its ``pipeline`` (if any) can use them as the
+    ``shards`` retriever, e.g. ``p = shards >> pt.text.get_text(...)`` (see
+    :class:`~pyterrier_server._federation.Federation`).
+
+    ``listeners`` are called with ``(name, info)`` after each successful load.
+    """
+
+    def __init__(self, function, shared=None, registry=default_registry):
+        self.function = function
+        self.shared = shared or {}
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.federation = None
+
+    def build(self):
+        name = self.function.get("name")
+        shared = self.shared.result() if isinstance(self.shared, Future) else self.shared
+        _globals = {'pt': pt, **shared}
+        _locals = {}
+        if self.function.get("shards"):
+            from pyterrier_server._federation import Federation
+            self.federation = Federation(self.function["shards"], name=name, k=self.function.get("shard_k"),
+                                         timeout=self.function.get("shard_timeout"))
+            if not self.function.get("pipeline"):
+                return self.federation
+            _globals["shards"] = self.federation
+        with self.registry.patched(), self.registry.owned_by(name):
+            exec(self.function["pipeline"], _globals, _locals)
+        for key in ['pipeline', 'p']:
+            if key in _locals:
+                return _locals[key]
+        raise ValueError(f"Code for function '{name}' does not define 'p' or 'pipeline'")
+
+    def load(self, info):
+        """Build the pipeline into ``info`` (once), returning it."""
+        name = self.function.get("name")
+        with self.lock:
+            if info.get("state") == "ready":
+                return info["pipeline"]
+            info["state"] = "loading"
+            start = time.time()
+            rss_before = rss_bytes()
+            try:
+                pipeline = self.build()
+                info.update(describe_pipeline(name, self.function, pipeline))
+                warmup(name, pipeline, self.function.get("warmup"))
+            except Exception as e:
+                logger.exception(f"Error loading function '{name}': {e}")
+                info["state"] = "failed"
+                info["error"] = str(e)
+                raise
+            info["pipeline"] = pipeline
+            if self.federation is not None:
+                info["federation"] = self.federation
+            info["load_time"] = round(time.time() - start, 3)
+            # what loading it cost (approximate if other functions load at the same time),
+            # unless the YAML file says how much memory it needs
+            declared = parse_size(info.get("memory"))
+            info["footprint"] = declared if declared is not None else max(0, rss_bytes() - rss_before)
+            info["loads"] = info.get("loads", 0) + 1
+            info["last_used"] = time.monotonic()
+            info["state"] = "ready"
+            info.pop("error", None)
+            logger.info(f"Loaded pipeline '{name}' with task '{info['task']}' in {info['load_time']}s "
+                        f"(~{info['footprint'] / 2**20:.1f} MB)")
+        # outside the lock, as listeners may unload other functions
+        for listener in self.listeners:
+            listener(name, info)
+        return pipeline
+
+    def unload(self, info):
+        """
+        Drop the built pipeline of ``info`` (and the artifacts no other function uses) so that its
+        memory can be reclaimed; it is built again on its next request. Returns ``False`` if the
+        function is being loaded or is not loaded.
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if info.get("state") != "ready":
+                return False
+            name = self.function.get("name")
+            info["state"] = "unloaded"
+            info.pop("pipeline", None)
+            for loaded, _ in (info.get("variants") or {}).values():
+                loaded.release()
+            self.registry.release(name)
+            info["unloads"] = info.get("unloads", 0) + 1
+            logger.info(f"Unloaded pipeline '{name}' (~{info.get('footprint', 0) / 2**20:.1f} MB)")
+            return True
+        finally:
+            self.lock.release()
+
+
+def describe_pipeline(name, function, pipeline):
+    """Infer the input ``properties`` and ``outputs`` of a built pipeline (unless given in the YAML file)."""
+    extra = {}
+    if "properties" in function:
+        extra["properties"] = function["properties"]
+    else:
+        extra["properties"] = [{**pt_model.column_info(i),**{"phrase":i}} for i in inspect.transformer_inputs(pipeline)[0]]
+        logger.debug(f"Inferred properties of '{name}': {extra['properties']}")
+    try:
+        extra["outputs"] = [{**pt_model.column_info(i),**{"phrase":i}}
+                        for i in inspect.transformer_outputs(
+                            pipeline,
+                            inspect.transformer_inputs(pipeline)[0]
+                        )]
+    except Exception as e:
+        logger.warning(f"Warning creating outputs params for function '{name}': {e}. Skipping outputs param.")
+    return extra
+
+
+def warmup(name, pipeline, query):
+    """Run an optional warm-up query (a string, or a dict input row) through a freshly built pipeline."""
+    if not query:
+        return
+    row = query if isinstance(query, dict) else {"qid": "warmup", "query": str(query)}
+    start = time.time()
+    pipeline(pd.DataFrame([row]))
+    logger.info(f"Warmed up pipeline '{name}' in {time.time() - start:.3f}s")
+
+
+def ensure_loaded(info):
+    """
+    Return the pipeline for ``info``, building it now if the function is lazy (or was
+    unloaded), and record when it was last used. Raises :class:`PipelineNotReady` if it is still loading in the background or failed to load.
+    """
+    if info.get("state", "ready") == "ready":
+        info["last_used"] = time.monotonic()
+        pipeline = info.get("pipeline")
+        if pipeline is not None:
+            return pipeline
+        # unloaded since the state was read
+    on_demand = info.get("lazy") or info.get("unloads")
+    if info["state"] in ("lazy", "unloaded") or (info["state"] in ("loading", "failed") and on_demand):
+        # (waits for a load already under way)
+        try:
+            return info["loader"].load(info)
+        except Exception as e:
+            raise PipelineNotReady(f"Pipeline failed to load: {e}") from e
+    if info["state"] == "failed":
+        raise PipelineNotReady(f"Pipeline failed to load: {info.get('error')}")
+    raise PipelineNotReady(f"Pipeline is {info['state']}")
+
+
+def read_config(path):
+    """Read a functions YAML file."""
+    import yaml
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def pipeline_file():
+    """The functions YAML file named by ``PYTERRIER_SERVER_PIPELINE``, or ``None`` for a single inline pipeline."""
+    path = os.environ.get('PYTERRIER_SERVER_PIPELINE')
+    return path if path and os.path.isfile(path) else None
+
+
+def function_info(function, shared=None, registry=default_registry, shared_code=None):
+    """The (not yet loaded) info dict for a function of the YAML file, whose ``shared`` section is ``shared_code``."""
+    info = {
+        'task': function.get("task", "search").lower(),
+        "description": function.get("description", ""),
+        "version": function_version(function),
+        "result_version": result_version(function, shared_code),
+        "lazy": bool(function.get("lazy", False)),
+        "state": "lazy" if function.get("lazy") else "pending",
+        "loader": FunctionLoader(function, shared, registry),
+    }
+    for option in SERVER_OPTIONS:
+        if option in function:
+            info[option] = function[option]
+    if "properties" in function:
+        info["properties"] = function["properties"]
+    return info
+
+
+def load_workers():
+    try:
+        return max(1, int(os.environ.get("PYTERRIER_SERVER_LOAD_WORKERS", "4")))
+    except ValueError:
+        return 4
+
+def load_pipeline(wait=True):
+    """
+    Load one or more PyTerrier pipelines from the ``PYTERRIER_SERVER_PIPELINE`` environment variable.
+
+    Functions from a YAML file are built concurrently on a pool of
+    ``PYTERRIER_SERVER_LOAD_WORKERS`` threads. With ``wait=False`` this returns
+    immediately and the pipelines become available as they finish loading (see
+    ``state`` in each function's info); otherwise it blocks until all non-lazy
+    functions have loaded and drops those that failed.
+    """
     logger.debug("Starting load_pipeline()")
     pipeline_expr = os.environ.get('PYTERRIER_SERVER_PIPELINE')
     if not pipeline_expr:
@@ -19,55 +273,48 @@ def load_pipeline():
     logger.info(f"pipeline_expr: {pipeline_expr.strip().lower()}")
 
     if os.path.isfile(pipeline_expr):
-        import yaml
         logger.debug(f"Loading pipeline from YAML file: {pipeline_expr}")
-        with open(pipeline_expr, 'r') as f:
-            config = yaml.safe_load(f)
+        config = read_config(pipeline_expr)
 
         pipelines = {}
+        registry = default_registry
+        registry.add_targets(config.get("memoize"))
+        executor = ThreadPoolExecutor(max_workers=load_workers(), thread_name_prefix="load")
+
+        def _load_shared():
+            with registry.patched():
+                return load_shared(config.get("shared"))
+        # submitted first, so it is always running before any function waits on it
+        shared = executor.submit(_load_shared)
+
         for function in config["functions"]:
             name = function.get("name")
-            task = function.get("task", "search").lower()
-            pipeline = function.get("pipeline")
-            if not name or not pipeline:
+            if not name or not (function.get("pipeline") or function.get("shards")):
                 logger.warning(f"Skipping function with missing name or pipeline: {function}")
                 continue
+            pipelines[name] = function_info(function, shared, registry, config.get("shared"))
+
+        futures = {name: executor.submit(info["loader"].load, info)
+                   for name, info in pipelines.items() if not info["lazy"]}
+        executor.shutdown(wait=False)
+
+        if not wait:
+            def _report():
+                futures_wait(list(futures.values()))
+                registry.report()
+            threading.Thread(target=_report, name="load-report", daemon=True).start()
+            return pipelines
 
-            _globals = {'pt': pt}
-            _locals = {}
+        for name, future in futures.items():
             try:
-                exec(pipeline, _globals, _locals)
-            except Exception as e:
-                logger.exception(f"Error executing code for function '{name}': {e}")
-                continue
+                future.result()
+            except Exception:  # noqa: BLE001 - the loader has already logged the error
+                logger.warning(f"Skipping function '{name}' as it failed to load")
+                del pipelines[name]
+        registry.report()
 
-            for key in ['pipeline', 'p']:
-                if key in _locals:
-                    extra = {
-                        "description": function.get("description", "")
-                    }
-                    if "properties" in function:
-                        extra["properties"] = function["properties"]
-                    else:
-                        extra["properties"] = [{**pt_model.column_info(i),**{"phrase":i}} for i in inspect.transformer_inputs(_locals[key])[0]]
-                        print("extra['properties']",extra["properties"])
-                    try:
-                        extra["outputs"] = [{**pt_model.column_info(i),**{"phrase":i}}
-                                        for i in inspect.transformer_outputs(
-                                            _locals[key],
-                                            inspect.transformer_inputs(_locals[key])[0]
-                                        )]
-                    except Exception as e:
-                        logger.warning(f"Warning creating outputs params for function '{name}': {e}. Skipping outputs param.")
-                    pipelines[name] = {'pipeline': _locals[key], 'task': task, **extra}
-                    logger.info(f"Loaded pipeline '{name}' with task '{task}' and extra params {list(extra.keys())}")
-                    break
-            else:
-                logger.error("No 'pipelines' section found in YAML file")
-                raise ValueError("No 'pipelines' section found in YAML file")
-
-        logger.info("Loaded pipelines:")
-        logger.info(json.dumps(pipelines, indent=4, default=str))
+        logger.info(f"Loaded pipelines: {list(pipelines)}")
+        logger.debug(json.dumps(pipelines, indent=4, default=str))
         return pipelines
 
     else:
@@ -85,7 +332,7 @@ def load_pipeline():
             if key in _locals:
                 logger.info(f"Single pipeline loaded with key '{key}' and task '{task}'")
                 single_pipeline = {'pipeline': _locals[key], 'task': task}
-                logging.info(json.dumps(single_pipeline, indent=4, default=str))
+                logger.debug(json.dumps(single_pipeline, indent=4, default=str))
                 return single_pipeline
 
         logger.error("pipeline not set in PYTERRIER_SERVER_PIPELINE")
@@ -0,0 +1,205 @@
+# _logging.py
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+access_logger = logging.getLogger("pyterrier_server.access")
+payload_logger = logging.getLogger("pyterrier_server.payload")
+
+_listener = None
+_handler = None
+
+
+def _flag(var, default):
+    return os.environ.get(var, default).lower() in ['1', 'true', 'yes']
+
+
+def _rate(var, default):
+    try:
+        return min(1., max(0., float(os.environ.get(var, default))))
+    except ValueError:
+        return float(default)
+
+
+def queue_enabled():
+    """``PYTERRIER_SERVER_LOG_QUEUE``: write logs from a background thread (default: false)."""
+    return _flag("PYTERRIER_SERVER_LOG_QUEUE", "false")
+
+
+def queue_size():
+    """``PYTERRIER_SERVER_LOG_QUEUE_SIZE``: the most records waiting to be written (default: 10000)."""
+    try:
+        return max(1, int(os.environ.get("PYTERRIER_SERVER_LOG_QUEUE_SIZE", "10000")))
+    except ValueError:
+        return 10000
+
+
+def access_log_rate():
+    """``PYTERRIER_SERVER_ACCESS_LOG_RATE``: the fraction of requests with an access log record (default: 1; 0 disables them)."""
+    return _rate("PYTERRIER_SERVER_ACCESS_LOG_RATE", "1")
+
+
+def payload_log_rate():
+    """``PYTERRIER_SERVER_LOG_PAYLOAD_RATE``: the fraction of requests whose full payloads (e.g. LLM responses) are logged (default: 0)."""
+    return _rate("PYTERRIER_SERVER_LOG_PAYLOAD_RATE", "0")
+
+
+def sample_payload():
+    """Whether to log the verbose payloads of this request (see :func:`payload_log_rate`)."""
+    rate = payload_log_rate()
+    return rate > 0 and random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object; structured records (e.g. access logs) contribute their fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry["msg"] = record.getMessage()
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    A :class:`QueueHandler` that, rather than block when the queue is full, drops the records below
+    ``WARNING`` (and counts them), and hands warnings and errors straight to ``handlers`` (the ones
+    the queue is drained into), so that those are never lost.
+    """
+
+    def __init__(self, q, handlers=()):
+        super().__init__(q)
+        self.handlers = list(handlers)
+        self.dropped = 0
+        self.synchronous = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            self.synchronous += 1
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+def start_queue_logging(logger, maxsize=None):
+    """
+    Move the handlers of ``logger`` (e.g. the root logger) behind a bounded queue, so that a
+    request thread only enqueues its records and a background thread formats and writes them
+    (to files, stdout, ...); see :class:`DroppingQueueHandler` for when the queue is full. The
+    thread is restarted in forked processes, and the queue is drained at exit (see
+    :func:`stop_queue_logging`).
+    """
+    global _handler
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    _handler = DroppingQueueHandler(queue.Queue(maxsize or queue_size()), handlers)
+    logger.addHandler(_handler)
+
+    def _start():
+        global _listener
+        _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+    def _restart_in_child():
+        # the listener thread does not survive a fork, and the queue's lock may have been held
+        _handler.queue = queue.Queue(_handler.queue.maxsize)
+        _start()
+
+    _start()
+    os.register_at_fork(after_in_child=_restart_in_child)
+    atexit.register(stop_queue_logging)
+    return _handler
+
+
+def stop_queue_logging():
+    """Write out the records still queued and stop the background thread (e.g. before ``os._exit``)."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def log_access(method, path, status, seconds, bytes_in=None, bytes_out=None, pipeline=None):
+    """Emit a compact, structured access log record for a request (for a sample of requests, see :func:`access_log_rate`)."""
+    rate = access_log_rate()
+    if rate <= 0 or (rate < 1 and random.random() >= rate) or not access_logger.isEnabledFor(logging.INFO):
+        return
+    fields = {
+        "method": method,
+        "path": path,
+        "status": status,
+        "ms": round(seconds * 1000, 3),
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "pid": os.getpid(),
+    }
+    if pipeline:
+        fields["pipeline"] = pipeline
+    access_logger.info(json.dumps(fields), extra={"fields": fields})
+
+
+def pipeline_of(path):
+    """The pipeline a request path is for (``/pipeline/<name>...``), if any."""
+    parts = path.split("/")
+    return parts[2] if len(parts) > 2 and parts[1] == "pipeline" else None
+
+
+class AccessLogMiddleware:
+    """ASGI middleware emitting an access log record (see :func:`log_access`) when each HTTP response has been sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        response = {"status": None, "bytes": 0}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body"):
+                    _log()
+            await send(message)
+
+        def _log():
+            headers = dict(scope.get("headers") or [])
+            length = headers.get(b"content-length")
+            log_access(scope["method"], scope["path"], response["status"], time.perf_counter() - start,
+                       int(length) if length and length.isdigit() else None, response["bytes"], pipeline_of(scope["path"]))
+
+        await self.app(scope, receive, _send)
+
+
+def stats():
+    return {
+        "queue": _handler is not None,
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+        "synchronous": _handler.synchronous if _handler is not None else 0,
+        "access_log_rate": access_log_rate(),
+        "payload_log_rate": payload_log_rate(),
+    }
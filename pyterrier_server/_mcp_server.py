@@ -1,10 +1,27 @@
 # _mcp_server.py
-import os
+import asyncio
+import functools
 import logging
-from fastmcp import FastMCP
-import pandas as pd
-from pydantic import BaseModel, create_model, ValidationError
+import os
 import re
+import time
+from typing import Annotated
+
+import pandas as pd
+from fastmcp import FastMCP
+from fastmcp.server.dependencies import get_http_request
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+
+from pyterrier_server._cache import id_column
+from pyterrier_server._executors import DeadlineExceeded, get_executor
+from pyterrier_server._metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from pyterrier_server._metrics import default_metrics, server_collectors
+from pyterrier_server._prefix import PrefixPlanner
+from pyterrier_server._profiling import is_admin, profile_pipeline, profiling_enabled
+from pyterrier_server._reload import make_reloader
+from pyterrier_server._residency import Residency
+from pyterrier_server._runner import get_pipeline, get_runner
+from pyterrier_server._serialize import project
 
 logger = logging.getLogger(__name__)
 logging.getLogger("uvicorn.access").setLevel(logging.INFO)
@@ -19,6 +36,11 @@ TYPE_MAP = {
     "dict": dict,
 }
 
+# the most inputs a batch tool takes in one call
+MAX_BATCH_INPUTS = 1000
+# the type of the limit and k arguments of the tools
+Positive = Annotated[int, Field(ge=1)]
+
 def schema_to_pydantic(name: str, schema) -> BaseModel:
     """
     Converts schema (dict or list) to a Pydantic model.
@@ -56,15 +78,41 @@ def schema_to_pydantic(name: str, schema) -> BaseModel:
     else:
         raise TypeError(f"Schema for {name} must be dict or list, got {type(schema)}")
     
-    return create_model(name, **fields)
+    # ids are often given as numbers
+    return create_model(name, __config__=ConfigDict(coerce_numbers_to_str=True), **fields)
 
 
 
 # ---------------------------
 # Utility to wrap pipeline function with input/output validation
 # ---------------------------
-def wrap_pipeline(pipeline_func, input_schema, output_schema):
+def to_records(result, fields=None, limit=None):
+    """The records a tool returns for a pipeline ``result``."""
+    if isinstance(result, pd.DataFrame):
+        return project(result, fields, limit).to_dict('records')
+    if isinstance(result, dict):
+        return [result]
+    return result
+
+
+def input_validator(InputModel):
+    """Validate (and cast) a tool's arguments into an input row with ``InputModel``, whose validator is compiled once."""
+    def validate(arguments):
+        try:
+            return InputModel.model_validate(arguments).model_dump()
+        except ValidationError as e:
+            raise ValueError(f"Invalid arguments: {e}") from e
+    return validate
+
+
+def wrap_pipeline(pipeline_func, input_schema, output_schema, variant_func=None, profile_func=None, offload=None):
+    """
+    Build the async tool function for a pipeline: its arguments are the pipeline's inputs (plus the
+    optional ``fields``, ``limit``, ``k`` and ``profile``). The pipeline runs through ``offload(fn, *args)``
+    (by default, in a thread), so that slow pipelines do not block the MCP server's event loop.
+    """
     InputModel = schema_to_pydantic("InputModel", input_schema)
+    offload = offload or asyncio.to_thread
 
     # --- extract argument names from schema ---
     def get_arg_names(schema):
@@ -92,49 +140,135 @@ def wrap_pipeline(pipeline_func, input_schema, output_schema):
 
     arg_names = get_arg_names(input_schema)
     arg_str = ", ".join(arg_names)
+    # optional projection arguments, unless they clash with a pipeline input
+    projection = [p for p in ["fields", "limit", "k", "profile"] if p not in arg_names]
+    if "fields" in projection:
+        arg_str += ", fields: list[str] | None = None"
+    if "limit" in projection:
+        arg_str += ", limit: Positive | None = None"
+    if "k" in projection and variant_func is not None:
+        arg_str += ", k: Positive | None = None"
+    fields_arg = "fields" if "fields" in projection else "None"
+    limit_arg = "limit" if "limit" in projection else "None"
+    k_arg = "k" if "k" in projection and variant_func is not None else "None"
+    # optional per-stage profile (see may_profile)
+    if "profile" in projection and profile_func is not None:
+        arg_str += ", profile: bool = False"
+    profile_arg = "profile" if "profile" in projection and profile_func is not None else "False"
+    returns = "list[dict] | dict" if profile_arg != "False" else "list[dict]"
+    row = "{" + ", ".join(f"{name!r}: {name}" for name in arg_names) + "}"
 
     # --- dynamically build the function source ---
     code = f"""
-def tool_func({arg_str}) -> list[dict]:
-    # Cast inputs to the expected types
-    input_kwargs = {{}}
-    for field, value in locals().items():
-        if field in arg_names:
-            field_type = InputModel.model_fields[field].annotation
-            try:
-                # Only cast if type does not match
-                if not isinstance(value, field_type):
-                    value = field_type(value)
-            except Exception as e:
-                raise ValueError(f"Cannot cast '{{field}}'={{value}} to {{field_type}}: {{e}}")
-            input_kwargs[field] = value
-
-    input_obj = InputModel(**input_kwargs)
-    df = pd.DataFrame([input_obj.dict()])
-    result = pipeline_func(df)
-    
-    if isinstance(result, pd.DataFrame):
-        records = result.to_dict('records')
-    elif isinstance(result, dict):
-        records = [result]
-    elif isinstance(result, list):
-        records = result
+async def tool_func({arg_str}) -> {returns}:
+    df = pd.DataFrame([validate({row})])
+    if {profile_arg}:
+        if not may_profile():
+            raise PermissionError("Profiling requires PYTERRIER_SERVER_PROFILING or an admin token")
+        result, stage_profile = await offload(profile_func, df, {k_arg}, {fields_arg})
+    elif variant_func is not None and ({k_arg} is not None or {fields_arg}):
+        # push k and fields down into the pipeline
+        result = await offload(variant_func({k_arg}, {fields_arg}), df)
+    else:
+        result = await offload(pipeline_func, df)
+    records = to_records(result, {fields_arg}, {limit_arg})
 
+    if {profile_arg}:
+        return {{"results": records, "profile": stage_profile}}
     return records
 """
     ns = {
-        "InputModel": InputModel,
+        "validate": input_validator(InputModel),
         "pipeline_func": pipeline_func,
+        "variant_func": variant_func,
+        "profile_func": profile_func,
+        "may_profile": may_profile,
+        "offload": offload,
         "pd": pd,
-        "ValidationError": ValidationError,
-        "re": re,
-        "arg_names": arg_names
+        "to_records": to_records,
+        "Positive": Positive,
     }
     exec(code, ns)
-    print("Created tool_func:", ns["tool_func"])
+    logger.debug(f"Created tool_func: {ns['tool_func']}")
     return ns["tool_func"]
 
 
+def wrap_batch(pipeline_func, input_schema, variant_func=None, offload=None):
+    """
+    Build the async batch tool function for a pipeline: it takes a list of ``inputs`` (each like the
+    arguments of the single tool), runs them through the pipeline as one DataFrame, and returns the
+    results of each input, in order, as ``{"qid": ..., "results": [...]}`` (``docno`` for documents).
+    """
+    InputModel = schema_to_pydantic("InputModel", input_schema)
+    offload = offload or asyncio.to_thread
+
+    async def batch_func(
+        inputs: Annotated[list[InputModel], Field(min_length=1, max_length=MAX_BATCH_INPUTS)],
+        fields: list[str] | None = None,
+        limit: Positive | None = None,
+        k: Positive | None = None,
+    ) -> list[dict]:
+        df = pd.DataFrame([i.model_dump() if isinstance(i, BaseModel) else InputModel.model_validate(i).model_dump()
+                           for i in inputs])
+        key = id_column(df) if {"qid", "docno"} & set(df.columns) else "qid"
+        ids = list(df[key]) if key in df.columns else [str(i) for i in range(len(df))]
+        # tell the inputs apart by position, even if their ids are missing or repeated
+        df[key] = [str(i) for i in range(len(df))]
+        run = variant_func(k, fields) if variant_func is not None and (k is not None or fields) else pipeline_func
+        result = await offload(run, df)
+        if not isinstance(result, pd.DataFrame):
+            return [{key: ids[0], "results": to_records(result)}]
+        groups = {g: group for g, group in result.groupby(key, sort=False)} if len(result) else {}
+        batch = []
+        for i, original in enumerate(ids):
+            group = groups.get(str(i), result.iloc[0:0])
+            records = to_records(group.assign(**{key: original}), fields, limit)
+            batch.append({key: original, "results": records})
+        return batch
+
+    return batch_func
+
+
+def tool_runner(name, info, k=None, fields=None):
+    """The runner for a tool: the same runner (and cache) as the REST endpoint."""
+    return get_runner(name, info, k=k, fields=fields)
+
+def may_profile():
+    """
+    Whether the current tool call may ask for a ``profile``: as with ``?profile=1`` on the REST
+    endpoint, anyone may if ``PYTERRIER_SERVER_PROFILING`` is set, and otherwise only HTTP requests
+    carrying the admin token.
+    """
+    if profiling_enabled():
+        return True
+    try:
+        headers = get_http_request().headers
+    except RuntimeError:
+        # not over HTTP (e.g. stdio): there is no token
+        return False
+    return is_admin(headers)
+
+def profile_tool(name, info, df, k=None, fields=None):
+    """Run a tool's pipeline stage by stage, returning ``(result, profile)``."""
+    return profile_pipeline(get_pipeline(name, info, k=k, fields=fields), df)
+
+def offloader(name, info):
+    """
+    ``offload(fn, *args)`` for the tools of pipeline ``name``: runs ``fn`` on the pipeline's bounded
+    executor (shared with the REST endpoints) and awaits it, without blocking the event loop.
+    """
+    async def offload(fn, *args):
+        executor = get_executor(name, info)
+        deadline = executor.deadline()
+        future = executor.submit(fn, *args, deadline=deadline)
+        wait = None if deadline is None else max(0., deadline - time.monotonic())
+        try:
+            # cancelling the wrapper also cancels the queued work
+            return await asyncio.wait_for(asyncio.wrap_future(future), wait)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Pipeline '{name}' did not finish within its deadline") from None
+    return offload
+
 
 # ---------------------------
 # Create FastMCP server
@@ -147,32 +281,83 @@ def mcp_port():
         port = 8000
     return port
 
-def create_mcp_server(pipelines=None):
+def add_pipeline_tool(mcp, name, info):
+    """
+    Register the tools for pipeline ``name`` on ``mcp``: ``<name>``, and ``<name>_batch`` for many
+    inputs at once. Returns their names (none if the pipeline has not loaded).
+    """
+    if not (callable(info.get("pipeline")) or info.get("lazy") or info.get("state") == "unloaded"):
+        return []
+    pipeline_func = tool_runner(name, info)
+    offload = offloader(name, info)
+
+    input_schema = info.get("properties") or [{"phrase": "query", "type": str}]
+    output_schema = info.get("outputs") or "list[dict]"
+    logger.debug(f"Tool '{name}' outputs: {output_schema}")
+    description = info.get("description", f"Pipeline {name}")
+
+    variant_func = functools.partial(tool_runner, name, info)
+    profile_func = functools.partial(profile_tool, name, info)
+    tool_func = wrap_pipeline(pipeline_func, input_schema, output_schema, variant_func, profile_func, offload)
+    batch_func = wrap_batch(pipeline_func, input_schema, variant_func, offload)
+    mcp.tool(name=name, description=description)(tool_func)
+    mcp.tool(name=f"{name}_batch", description=f"{description} Batch version: takes a list of inputs "
+             f"(up to {MAX_BATCH_INPUTS}) and returns the results for each, in order.")(batch_func)
+    return [name, f"{name}_batch"]
+
 
+def build_mcp_server(pipelines=None, metrics=True, reloader=None):
+    """
+    Build the FastMCP server with a tool for each pipeline, without starting it.
+    With ``metrics``, it also serves ``/metrics``. With a ``reloader`` (see
+    :class:`~pyterrier_server._reload.Reloader`), the tools of reloaded functions are replaced.
+    """
     # mcp = FastMCP("PYTERRIER_MCP",auth=auth)
-    mcp = FastMCP("PYTERRIER_MCP",stateless_http=True)
+    mcp = FastMCP("PYTERRIER_MCP")
     tools = {}
 
     if pipelines:
         if isinstance(pipelines, dict):
             for name, info in pipelines.items():
-                pipeline_func = info.get("pipeline")
-                if not callable(pipeline_func):
-                    continue
+                tools[name] = add_pipeline_tool(mcp, name, info)
 
-                input_schema = info.get("properties") or [{"phrase": "query", "type": str}]
-                output_schema = info.get("outputs") or "list[dict]"
-                print("info",info)
-                print("output_schema",output_schema)
-                description = info.get("description", f"Pipeline {name}")
+    if reloader is not None:
+        def update_tools(changed, removed):
+            for name in list(changed) + list(removed):
+                for tool in tools.pop(name, []):
+                    mcp.local_provider.remove_tool(tool)
+            for name in changed:
+                tools[name] = add_pipeline_tool(mcp, name, pipelines[name])
+            logger.info(f"Updated MCP tools: {[tool for added in tools.values() for tool in added]}")
+        reloader.add_listener(update_tools)
 
-                tool_func = wrap_pipeline(pipeline_func, input_schema, output_schema)
-                tools[name] = mcp.tool(name=name, description=description)(tool_func)
+    if metrics:
+        @mcp.custom_route("/metrics", methods=["GET"])
+        async def metrics_route(request):
+            from starlette.responses import Response
+            return Response(default_metrics.render(server_collectors(pipelines if isinstance(pipelines, dict) else {})), media_type=METRICS_CONTENT_TYPE)
 
+    logger.info(f"Created MCP tools: {[tool for added in tools.values() for tool in added]}")
+    return mcp
+
+def create_mcp_server(pipelines=None):
+    reloader = make_reloader(pipelines)
+    if reloader is not None:
+        reloader.watch()
+    if isinstance(pipelines, dict):
+        residency = Residency(pipelines)
+        residency.enforce()
+        residency.start()
+        planner = PrefixPlanner(pipelines)
+        planner.plan()
+        if reloader is not None:
+            reloader.add_listener(lambda changed, removed: residency.attach())
+            reloader.add_listener(lambda changed, removed: (planner.attach(), planner.plan()))
+    mcp = build_mcp_server(pipelines, reloader=reloader)
     port = mcp_port()
     host = os.environ.get("PYTERRIER_MCP_HOST", "0.0.0.0")
-    logger.info(f"Starting MCP on {host}:{port} with tools: {list(tools.keys())}")
-    mcp.run(transport="http", port=port, host=host)
+    logger.info(f"Starting MCP on {host}:{port}")
+    mcp.run(transport="http", port=port, host=host, stateless_http=True)
 
 def main():
     from pyterrier_server._loader import load_pipeline
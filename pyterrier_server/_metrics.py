@@ -0,0 +1,221 @@
+# _metrics.py
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from pyterrier_server._cache import default_cache
+from pyterrier_server._coalescing import default_coalescer
+from pyterrier_server._pushdown import stages
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+# rows per call
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Histogram:
+    """A cumulative histogram in the Prometheus style: bucket counts, sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """``(le, cumulative count)`` pairs, ending with ``+Inf``."""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f"{bound:g}", total
+        yield "+Inf", self.count
+
+
+def _labels(labels):
+    def escape(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+
+
+class Metrics:
+    """
+    Request and per-stage counters for the served pipelines, rendered in the
+    Prometheus text format by :meth:`render`. Numbers owned by other components
+    (cache, executors) are pulled in at render time from ``collectors``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}                # (metric, labels) -> Histogram
+        self.counters = defaultdict(float)  # (metric, labels) -> value
+
+    def _observe(self, metric, labels, value, buckets=LATENCY_BUCKETS):
+        key = (metric, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram(buckets)
+        hist.observe(value)
+
+    def observe_request(self, name, seconds, rows_in, rows_out, error=False):
+        labels = (("pipeline", name),)
+        with self._lock:
+            self._observe("pyterrier_server_pipeline_seconds", labels, seconds)
+            self._observe("pyterrier_server_pipeline_batch_size", labels, rows_in, SIZE_BUCKETS)
+            self.counters[("pyterrier_server_pipeline_calls_total", labels)] += 1
+            self.counters[("pyterrier_server_pipeline_rows_in_total", labels)] += rows_in
+            self.counters[("pyterrier_server_pipeline_rows_out_total", labels)] += rows_out
+            if error:
+                self.counters[("pyterrier_server_pipeline_errors_total", labels)] += 1
+
+    def observe_stage(self, name, index, stage, seconds, rows_in, rows_out, error=False):
+        labels = (("pipeline", name), ("stage", index), ("transformer", type(stage).__name__))
+        with self._lock:
+            self._observe("pyterrier_server_stage_seconds", labels, seconds)
+            self.counters[("pyterrier_server_stage_rows_in_total", labels)] += rows_in
+            self.counters[("pyterrier_server_stage_rows_out_total", labels)] += rows_out
+            if error:
+                self.counters[("pyterrier_server_stage_errors_total", labels)] += 1
+
+    def render(self, collectors=()):
+        """
+        The metrics in the Prometheus text exposition format, followed by the
+        ``(metric, type, labels, value)`` samples returned by each of ``collectors``.
+        """
+        lines = []
+        with self._lock:
+            # sort by the key's repr, as label values may be of mixed types
+            histograms = sorted(self.histograms.items(), key=lambda item: repr(item[0]))
+            counters = sorted(self.counters.items(), key=lambda item: repr(item[0]))
+            seen = set()
+            for (metric, labels), hist in histograms:
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} histogram")
+                    seen.add(metric)
+                for le, count in hist.samples():
+                    lines.append(f"{metric}_bucket{{{_labels(labels + (('le', le),))}}} {count}")
+                lines.append(f"{metric}_sum{{{_labels(labels)}}} {hist.sum:g}")
+                lines.append(f"{metric}_count{{{_labels(labels)}}} {hist.count}")
+            for (metric, labels), value in counters:
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} counter")
+                    seen.add(metric)
+                lines.append(f"{metric}{{{_labels(labels)}}} {value:g}")
+        for collector in collectors:
+            try:
+                samples = sorted(collector(), key=repr)
+            except Exception:
+                # a broken collector must not take the other metrics down with it
+                logger.warning(f"Metrics collector {collector} failed", exc_info=True)
+                continue
+            for metric, kind, labels, value in samples:
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} {kind}")
+                    seen.add(metric)
+                lines.append(f"{metric}{{{_labels(labels)}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+default_metrics = Metrics()
+
+
+def run_timed(name, pipeline, df, metrics=default_metrics):
+    """
+    Run ``pipeline`` on ``df`` one stage at a time (which is all ``>>`` does), recording
+    the latency and row counts of each stage, and of the pipeline as a whole.
+    """
+    start = time.perf_counter()
+    out = df
+    try:
+        for i, stage in enumerate(stages(pipeline)):
+            out = run_stage(name, i, stage, out, metrics)
+    except Exception:
+        metrics.observe_request(name, time.perf_counter() - start, len(df), 0, error=True)
+        raise
+    metrics.observe_request(name, time.perf_counter() - start, len(df), len(out) if hasattr(out, "__len__") else 0)
+    return out
+
+
+def run_stage(name, index, stage, df, metrics=default_metrics):
+    """Run a single ``stage`` of pipeline ``name`` on ``df``, recording its latency and row counts."""
+    start = time.perf_counter()
+    try:
+        out = stage(df)
+    except Exception:
+        metrics.observe_stage(name, index, stage, time.perf_counter() - start, len(df), 0, error=True)
+        raise
+    metrics.observe_stage(name, index, stage, time.perf_counter() - start, len(df), len(out) if hasattr(out, "__len__") else 0)
+    return out
+
+
+def cache_collector(cache):
+    """Hits and misses of the result ``cache``, per pipeline."""
+    def collect():
+        stats = cache.stats()
+        for name, counts in stats.get("pipelines", {}).items():
+            yield "pyterrier_server_cache_hits_total", "counter", (("pipeline", name),), counts["hits"]
+            yield "pyterrier_server_cache_misses_total", "counter", (("pipeline", name),), counts["misses"]
+    return collect
+
+
+def coalescing_collector(coalescer):
+    """Rows executed, and rows that waited on a concurrent execution instead (executions saved), per pipeline."""
+    def collect():
+        stats = coalescer.stats()
+        for name, counts in stats.get("pipelines", {}).items():
+            yield "pyterrier_server_coalesced_rows_total", "counter", (("pipeline", name),), counts["coalesced"]
+            yield "pyterrier_server_executed_rows_total", "counter", (("pipeline", name),), counts["executed"]
+    return collect
+
+
+def executor_collector(pipelines):
+    """Queue depth and request counts of each pipeline's executor."""
+    def collect():
+        for name, info in pipelines.items():
+            executor = info.get("executor")
+            if executor is None:
+                continue
+            labels = (("pipeline", name),)
+            stats = executor.stats()
+            yield "pyterrier_server_requests_running", "gauge", labels, stats["running"]
+            yield "pyterrier_server_requests_queued", "gauge", labels, stats["queued"]
+            yield "pyterrier_server_requests_completed_total", "counter", labels, stats["completed"]
+            yield "pyterrier_server_requests_rejected_total", "counter", labels, stats["rejected"]
+            yield "pyterrier_server_requests_expired_total", "counter", labels, stats["expired"]
+    return collect
+
+
+def degradation_collector(pipelines):
+    """The tier each degradable pipeline is served at, and the seconds spent in each tier."""
+    def collect():
+        for name, info in pipelines.items():
+            policy = info.get("degradation")
+            if policy is None:
+                continue
+            stats = policy.stats()
+            yield "pyterrier_server_degradation_level", "gauge", (("pipeline", name),), stats["level"]
+            for tier, seconds in stats["seconds"].items():
+                yield "pyterrier_server_degradation_seconds_total", "counter", (("pipeline", name), ("tier", tier)), seconds
+    return collect
+
+
+def server_collectors(pipelines):
+    """
+    The collectors behind ``/metrics`` (besides the stage timings of :data:`default_metrics`), the
+    same for the REST and the MCP server: the shared result cache and coalescer, and the executor
+    and degradation policy of each of ``pipelines``.
+    """
+    return [cache_collector(default_cache()), coalescing_collector(default_coalescer()),
+            executor_collector(pipelines), degradation_collector(pipelines)]
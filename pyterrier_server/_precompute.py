@@ -0,0 +1,124 @@
+# _precompute.py
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import Counter
+
+import pandas as pd
+
+from pyterrier_server._artifacts import default_registry
+from pyterrier_server._cache import ResultCache, id_column, normalize_row
+from pyterrier_server._handler import input_row
+from pyterrier_server._loader import (
+    function_info,
+    load_shared,
+    pipeline_file,
+    read_config,
+)
+from pyterrier_server._store import store_path, write_store
+
+logger = logging.getLogger(__name__)
+
+
+def read_log(path, name, info):
+    """
+    The input rows of a JSONL query log: one request body per line, e.g. ``{"query": "..."}``.
+    Lines naming another pipeline (in a ``pipeline`` field) are skipped, as are invalid lines.
+    """
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                body = json.loads(line)
+            except ValueError:
+                logger.warning(f"{path}:{number}: skipping invalid JSON")
+                continue
+            if not isinstance(body, dict) or body.get("pipeline", name) != name:
+                continue
+            yield input_row(info, body, default_id=number)
+
+
+def head(rows, name, version, top=None, min_count=1):
+    """
+    The distinct rows of a log, as ``(key, row)`` pairs, most frequent first; only the ``top``
+    most frequent and those seen at least ``min_count`` times are kept.
+    """
+    counts = Counter()
+    distinct = {}
+    for row in rows:
+        normalized = normalize_row(row, "qid" if "qid" in row else "docno")
+        key = ResultCache.make_key(name, version, normalized)
+        counts[key] += 1
+        distinct.setdefault(key, row)
+    ranked = [key for key, count in counts.most_common(top) if count >= min_count]
+    return [(key, distinct[key]) for key in ranked]
+
+
+def precompute(pipeline, rows, batch_size=100):
+    """Run ``(key, row)`` pairs through ``pipeline`` in batches, yielding ``(key, result)`` pairs."""
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        df = pd.DataFrame([row for _, row in batch])
+        key = id_column(df)
+        # like the result cache, tell the rows apart by position
+        df[key] = [str(j) for j in range(len(df))]
+        result = pipeline(df)
+        groups = {k: g for k, g in result.groupby(key, sort=False)} if len(result) else {}
+        for j, (cache_key, _) in enumerate(batch):
+            yield cache_key, groups.get(str(j), result.iloc[0:0]).reset_index(drop=True)
+        logger.info(f"Precomputed {min(start + batch_size, len(rows))}/{len(rows)} rows")
+
+
+def load_function(name, path):
+    """Load only function ``name`` from the YAML file at ``path`` (with its ``shared`` section), returning its info."""
+    config = read_config(path)
+    for function in config.get("functions") or []:
+        if function.get("name") == name:
+            break
+    else:
+        raise ValueError(f"No function named '{name}' in {path}")
+    default_registry.add_targets(config.get("memoize"))
+    with default_registry.patched():
+        shared = load_shared(config.get("shared"))
+    info = function_info(function, shared, default_registry, config.get("shared"))
+    info["loader"].load(info)
+    return info
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pyterrier-precompute",
+        description="Replay a JSONL query log through a pipeline and store its results for serving.")
+    parser.add_argument("pipeline", help="name of the function in PYTERRIER_SERVER_PIPELINE to run")
+    parser.add_argument("log", help="JSONL file with one request body per line")
+    parser.add_argument("--output", help="store file to write (default: the function's store, see the README)")
+    parser.add_argument("--top", type=int, help="only store the N most frequent distinct queries")
+    parser.add_argument("--min-count", type=int, default=1, help="only store queries seen at least this often")
+    parser.add_argument("--batch-size", type=int, default=100)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    path = pipeline_file()
+    if path is None:
+        sys.exit("PYTERRIER_SERVER_PIPELINE must name a functions YAML file")
+    info = load_function(args.pipeline, path)
+    output = args.output or store_path(args.pipeline, info)
+    if not output:
+        sys.exit("No --output given, and the function has no store (set 'store' or PYTERRIER_SERVER_STORE_DIR)")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    rows = head(read_log(args.log, args.pipeline, info), args.pipeline, info["result_version"], args.top, args.min_count)
+    logger.info(f"Precomputing {len(rows)} distinct rows from {args.log} with '{args.pipeline}'")
+    write_store(output, args.pipeline, info["result_version"], precompute(info["pipeline"], rows, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# _prefix.py
+import logging
+import os
+import threading
+
+import pyterrier as pt
+from pyterrier import inspect
+
+from pyterrier_server._cache import CachedPipeline, ResultCache
+from pyterrier_server._pushdown import commutes_with_cutoff, stages
+
+logger = logging.getLogger(__name__)
+
+# most input rows whose shared prefix output is kept
+PREFIX_CACHE_SIZE = 1024
+# attribute of a pipeline built by the planner, holding the pipeline it was built from
+SOURCE = "_pyterrier_server_unshared"
+
+
+def prefix_window():
+    """``PYTERRIER_SERVER_PREFIX_WINDOW``: seconds for which the output of a shared prefix is reused (default: 0, prefixes are not shared)."""
+    try:
+        return max(0., float(os.environ.get("PYTERRIER_SERVER_PREFIX_WINDOW", "0")))
+    except ValueError:
+        return 0.
+
+
+def _frozen(value):
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_frozen(v) for v in value))
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted((str(k), _frozen(v)) for k, v in value.items())))
+    return ("object", id(value))
+
+
+def signature(stage):
+    """
+    What ``stage`` computes, as a hashable value: its class and settings, where objects (e.g. an
+    index shared through the artifact registry) must be identical. Stages with the same
+    signature give the same results.
+    """
+    try:
+        settings = vars(stage)
+    except TypeError:
+        return ("object", id(stage))
+    return (type(stage), _frozen(settings))
+
+
+def same_stage(a, b):
+    """Whether stages ``a`` and ``b`` compute the same thing (see :func:`signature`)."""
+    return a is b or signature(a) == signature(b)
+
+
+def common_prefix(pipelines, key=signature):
+    """
+    The longest run of leading stages shared by all of ``pipelines`` (lists of stages, compared
+    by ``key``), as ``(prefix, cutoffs)``. Rank cutoffs of different depths are shared at the
+    deepest one, if the shared stages after it do not depend on it (e.g. text loaders);
+    ``cutoffs`` is then the depth each pipeline truncates the prefix to (otherwise ``None``).
+    """
+    prefix, cutoffs = [], None
+    for position in zip(*pipelines):
+        first = position[0]
+        if all(key(stage) == key(first) for stage in position[1:]):
+            if cutoffs is not None and not commutes_with_cutoff(first):
+                break
+            prefix.append(first)
+        elif cutoffs is None and all(isinstance(stage, pt.RankCutoff) for stage in position):
+            cutoffs = [stage.k for stage in position]
+            prefix.append(pt.RankCutoff(max(cutoffs)))
+        else:
+            break
+    # only worth sharing if there is more to it than cutoffs
+    if all(isinstance(stage, pt.RankCutoff) for stage in prefix):
+        return [], None
+    return prefix, cutoffs
+
+
+class SharedPrefix:
+    """
+    The leading stages that several pipelines share, run once per input row: their output is
+    kept for ``window`` seconds (see :func:`prefix_window`), so that the same query reaching
+    several of the pipelines close together in time is only run through them once.
+    """
+
+    def __init__(self, parts, names, window=None):
+        self.pipeline = pt.Compose(*parts) if len(parts) > 1 else parts[0]
+        self.names = list(names)
+        self.name = "+".join(self.names)
+        self.cache = ResultCache(max_size=PREFIX_CACHE_SIZE, ttl=prefix_window() if window is None else window)
+        self.runner = CachedPipeline(self.pipeline, self.cache, f"prefix:{self.name}")
+
+    def __call__(self, df):
+        return self.runner(df)
+
+    def stats(self):
+        return {
+            "pipelines": self.names,
+            "stages": repr(self.pipeline),
+            "hits": sum(self.cache.hits.values()),
+            "misses": sum(self.cache.misses.values()),
+        }
+
+
+class PrefixView(pt.Transformer):
+    """The first stage of a pipeline built by :class:`PrefixPlanner`: the output of its :class:`SharedPrefix`."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def __repr__(self):
+        return f"SharedPrefix({self.prefix.pipeline!r})"
+
+    def transform_inputs(self):
+        return inspect.transformer_inputs(self.prefix.pipeline)
+
+    def transform_outputs(self, input_columns):
+        return inspect.transformer_outputs(self.prefix.pipeline, input_columns)
+
+    def transform(self, inp):
+        return self.prefix(inp)
+
+
+class PrefixPlanner:
+    """
+    Finds pipelines that start with the same stages (e.g. the same retriever and text loader,
+    with cutoffs of different depths) and rebuilds them to run those stages as one
+    :class:`SharedPrefix`, followed by their own cutoff and remaining stages. The plan is made
+    again whenever a pipeline has loaded (including after an unload or a reload).
+    """
+
+    def __init__(self, pipelines, window=None):
+        self.pipelines = pipelines
+        self.window = prefix_window() if window is None else window
+        self._lock = threading.Lock()
+        self._planned = None
+        # the signature of each stage when it was first planned, as stages may keep state (e.g. counters)
+        self._signatures = {}
+        self.prefixes = []
+        self.attach()
+
+    def attach(self):
+        """Get notified when any of the pipelines (including ones added by a reload) has loaded."""
+        for info in self.pipelines.values():
+            loader = info.get("loader")
+            if loader is not None and self.loaded not in loader.listeners:
+                loader.listeners.append(self.loaded)
+
+    def loaded(self, name, info):
+        self.plan()
+
+    def _signature(self, stage):
+        if id(stage) not in self._signatures:
+            self._signatures[id(stage)] = stage, signature(stage)
+        return self._signatures[id(stage)][1]
+
+    @staticmethod
+    def source(pipeline):
+        """The pipeline as it was built from the YAML file (before it was made to share a prefix)."""
+        return getattr(pipeline, SOURCE, pipeline)
+
+    def plan(self):
+        """Share the common prefixes of the loaded pipelines, returning the :class:`SharedPrefix` of each group."""
+        if not self.window:
+            return []
+        with self._lock:
+            sources = {}
+            for name, info in list(self.pipelines.items()):
+                pipeline = info.get("pipeline")
+                if info.get("state", "ready") == "ready" and isinstance(pipeline, pt.Transformer):
+                    sources[name] = self.source(pipeline)
+            planned = {name: id(pipeline) for name, pipeline in sources.items()}
+            if planned == self._planned:
+                return self.prefixes
+            self._planned = planned
+
+            # group the pipelines by their first stage
+            groups = {}
+            for name, pipeline in sources.items():
+                parts = stages(pipeline)
+                groups.setdefault(self._signature(parts[0]), []).append((name, parts))
+            self._signatures = {id(stage): self._signatures[id(stage)]
+                                for _, group in groups.items() for _, parts in group for stage in parts
+                                if id(stage) in self._signatures}
+
+            prefixes, rebuilt = [], dict(sources)
+            for group in groups.values():
+                if len(group) < 2:
+                    continue
+                prefix, cutoffs = common_prefix([parts for _, parts in group], key=self._signature)
+                if not prefix:
+                    continue
+                shared = SharedPrefix(prefix, [name for name, _ in group], self.window)
+                prefixes.append(shared)
+                for i, (name, parts) in enumerate(group):
+                    rest = parts[len(prefix):]
+                    if cutoffs is not None and cutoffs[i] < max(cutoffs):
+                        # a deeper cutoff serves a shallower one by truncation
+                        rest = [pt.RankCutoff(cutoffs[i])] + rest
+                    pipeline = pt.Compose(PrefixView(shared), *rest) if rest else PrefixView(shared)
+                    setattr(pipeline, SOURCE, sources[name])
+                    rebuilt[name] = pipeline
+                logger.info(f"Sharing {shared.pipeline} between {shared.names}")
+
+            for name, pipeline in rebuilt.items():
+                info = self.pipelines.get(name)
+                if info is not None and info.get("pipeline") is not pipeline and info.get("state", "ready") == "ready":
+                    info["pipeline"] = pipeline
+            self.prefixes = prefixes
+            return prefixes
+
+    def stats(self):
+        return {
+            "window": self.window,
+            "prefixes": [prefix.stats() for prefix in self.prefixes],
+        }
@@ -0,0 +1,190 @@
+# _profiling.py
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from pyterrier_server._artifacts import rss_bytes
+from pyterrier_server._pushdown import stages
+
+logger = logging.getLogger(__name__)
+
+# profiled requests run one at a time, so that their memory numbers are not mixed up
+_profile_lock = threading.Lock()
+
+
+def _truthy(value):
+    return str(value or "").lower() in ['1', 'true', 'yes']
+
+
+def is_admin(headers):
+    """Whether ``headers`` carry the ``PYTERRIER_SERVER_ADMIN_TOKEN`` (as ``X-Admin-Token`` or a bearer token)."""
+    token = os.environ.get("PYTERRIER_SERVER_ADMIN_TOKEN")
+    if not token:
+        return False
+    given = headers.get("X-Admin-Token") or ""
+    auth = headers.get("Authorization") or ""
+    if not given and auth.startswith("Bearer "):
+        given = auth[len("Bearer "):]
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def profiling_enabled():
+    """Whether anyone may ask for ``profile=1`` (``PYTERRIER_SERVER_PROFILING``); otherwise only admins may."""
+    return _truthy(os.environ.get("PYTERRIER_SERVER_PROFILING"))
+
+
+def wants_profile(args, body):
+    return _truthy(args.get("profile")) or body.get("profile") is True
+
+
+def profile_pipeline(pipeline, df):
+    """
+    Run ``pipeline`` on ``df`` one stage at a time, returning ``(result, profile)``, where the
+    profile gives the wall-clock and CPU time, rows and memory (peak Python allocations, as
+    traced by ``tracemalloc``, and the change in RSS) of each stage.
+    """
+    with _profile_lock:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            profile = []
+            out = df
+            start = time.perf_counter()
+            for i, stage in enumerate(stages(pipeline)):
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                rss_before = rss_bytes()
+                wall, cpu = time.perf_counter(), time.thread_time()
+                rows_in = len(out)
+                out = stage(out)
+                profile.append({
+                    "stage": i,
+                    "transformer": repr(stage),
+                    "seconds": round(time.perf_counter() - wall, 6),
+                    "cpu_seconds": round(time.thread_time() - cpu, 6),
+                    "rows_in": rows_in,
+                    "rows_out": len(out) if hasattr(out, "__len__") else None,
+                    "peak_alloc_bytes": tracemalloc.get_traced_memory()[1] - before,
+                    "rss_delta_bytes": rss_bytes() - rss_before,
+                })
+            total = round(time.perf_counter() - start, 6)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+    return out, {"total_seconds": total, "stages": profile}
+
+
+class StackSampler:
+    """
+    A low-overhead sampling profiler for a single thread: while active, a helper thread
+    records the thread's Python stack every ``interval`` seconds. :meth:`folded` returns
+    the samples in the collapsed-stack format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class RequestSampler:
+    """
+    Profiles a ``rate`` fraction of pipeline calls with a :class:`StackSampler`, writing
+    each profile to ``directory`` as ``<pipeline>-<time>-<pid>.folded``.
+    """
+
+    def __init__(self, rate=0., directory="profiles", interval=0.005):
+        self.rate = rate
+        self.directory = directory
+        self.interval = interval
+        self.written = 0
+
+    def configure(self, rate=None, directory=None, interval=None):
+        if rate is not None:
+            rate = float(rate)
+            if not 0 <= rate <= 1:
+                raise ValueError("rate must be between 0 and 1")
+            self.rate = rate
+        if directory is not None:
+            self.directory = str(directory)
+        if interval is not None:
+            self.interval = max(0.0005, float(interval))
+
+    def status(self):
+        return {"rate": self.rate, "directory": os.path.abspath(self.directory),
+                "interval": self.interval, "written": self.written}
+
+    def __call__(self, name, fn, *args, **kwargs):
+        """Call ``fn(*args, **kwargs)``, profiling it if this call is sampled."""
+        if not self.rate or random.random() >= self.rate:
+            return fn(*args, **kwargs)
+        with StackSampler(interval=self.interval) as sampler:
+            start = time.time()
+            result = fn(*args, **kwargs)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{name}-{start:.6f}-{os.getpid()}.folded")
+            with open(path, "w") as f:
+                f.write(sampler.folded())
+            self.written += 1
+        except OSError as e:
+            logger.warning(f"Could not write profile for '{name}': {e}")
+        return result
+
+
+def _float_env(var, default):
+    try:
+        return float(os.environ.get(var, default))
+    except ValueError:
+        return float(default)
+
+
+_default_sampler = None
+_default_lock = threading.Lock()
+
+def default_sampler():
+    """
+    The request sampler of this process, configured from:
+      - PYTERRIER_SERVER_PROFILE_RATE (default: 0, i.e. no requests are sampled)
+      - PYTERRIER_SERVER_PROFILE_DIR  (default: profiles)
+    """
+    global _default_sampler
+    with _default_lock:
+        if _default_sampler is None:
+            _default_sampler = RequestSampler(
+                rate=_float_env("PYTERRIER_SERVER_PROFILE_RATE", 0),
+                directory=os.environ.get("PYTERRIER_SERVER_PROFILE_DIR", "profiles"),
+            )
+        return _default_sampler
@@ -0,0 +1,92 @@
+# _pushdown.py
+import logging
+
+import pyterrier as pt
+from pyterrier import inspect
+from pyterrier.transformer import SupportsFuseRankCutoff
+
+logger = logging.getLogger(__name__)
+
+
+def stages(pipeline):
+    """The stages of a (possibly nested) ``>>`` pipeline, in order."""
+    if isinstance(pipeline, pt.Compose):
+        return [s for t in pipeline._transformers for s in stages(t)]
+    return [pipeline]
+
+
+def commutes_with_cutoff(stage):
+    """
+    Whether ``stage`` neither reorders nor filters its input, i.e. applying a rank cutoff
+    before or after it gives the same result. Text loaders declare this by fusing a
+    following cutoff into ``RankCutoff(k) >> self``.
+    """
+    if not isinstance(stage, SupportsFuseRankCutoff):
+        return False
+    try:
+        fused = stage.fuse_rank_cutoff(1)
+    except (TypeError, AttributeError) as e:
+        logger.debug(f"Cannot tell whether {stage} commutes with a rank cutoff: {e}")
+        return False
+    return isinstance(fused, pt.Compose) and list(fused._transformers) == [pt.RankCutoff(1), stage]
+
+
+def _outputs(parts, input_columns):
+    try:
+        return inspect.transformer_outputs(pt.Compose(*parts) if len(parts) > 1 else parts[0], input_columns)
+    except (TypeError, AttributeError) as e:
+        # (inspect.InspectError is a TypeError)
+        logger.debug(f"Cannot infer the output columns of {parts}: {e}")
+        return None
+
+
+def rewrite(pipeline, k=None, fields=None):
+    """
+    Specialise ``pipeline`` for a request that only needs its top ``k`` results and the given ``fields``.
+
+    Trailing stages that only add columns (see :func:`commutes_with_cutoff`) are dropped if
+    none of ``fields`` needs them, and a cutoff of ``k`` is pushed down as far as it can go,
+    tightening any rank cutoff it meets. The result is compiled, so that retrievers supporting
+    a native rank cutoff retrieve only ``k`` results. Returns ``pipeline`` itself if nothing
+    could be pushed down.
+    """
+    try:
+        input_columns = inspect.transformer_inputs(pipeline)[0]
+    except (TypeError, AttributeError) as e:
+        logger.debug(f"Not rewriting {pipeline}, as its input columns cannot be inferred: {e}")
+        return pipeline
+    parts = stages(pipeline)
+    changed = False
+
+    if fields:
+        while len(parts) > 1 and commutes_with_cutoff(parts[-1]):
+            available = _outputs(parts[:-1], input_columns)
+            if available is None or not set(fields) <= set(available):
+                break
+            parts.pop()
+            changed = True
+
+    if k is not None and "rank" in (_outputs(parts, input_columns) or []):
+        i = len(parts)
+        while i > 0 and commutes_with_cutoff(parts[i - 1]):
+            i -= 1
+        if i > 0 and isinstance(parts[i - 1], pt.RankCutoff):
+            if k < parts[i - 1].k:
+                parts[i - 1] = pt.RankCutoff(k)
+                changed = True
+        elif "rank" in (_outputs(parts[:i], input_columns) or []):
+            parts.insert(i, pt.RankCutoff(k))
+            changed = True
+        else:
+            parts.append(pt.RankCutoff(k))
+            changed = True
+
+    if not changed:
+        return pipeline
+    rewritten = pt.Compose(*parts) if len(parts) > 1 else parts[0]
+    try:
+        rewritten = rewritten.compile()
+    except (TypeError, AttributeError) as e:
+        logger.debug(f"Could not compile rewritten pipeline {rewritten}: {e}")
+    logger.info(f"Rewrote {pipeline} for k={k}, fields={fields} as {rewritten}")
+    return rewritten
@@ -0,0 +1,207 @@
+# _reload.py
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pyterrier_server._artifacts import default_registry
+from pyterrier_server._loader import (
+    describe_pipeline,
+    function_info,
+    function_version,
+    load_shared,
+    load_workers,
+    pipeline_file,
+    read_config,
+)
+from pyterrier_server._runner import close_runners
+
+logger = logging.getLogger(__name__)
+
+# the parts of a function's definition its built pipeline depends on
+BUILD_KEYS = ["pipeline", "shards", "shard_k", "shard_timeout"]
+
+
+def reload_interval():
+    """``PYTERRIER_SERVER_RELOAD_INTERVAL``: seconds between checks of the YAML file for changes (default: 0, never)."""
+    try:
+        return max(0., float(os.environ.get("PYTERRIER_SERVER_RELOAD_INTERVAL", "0")))
+    except ValueError:
+        return 0.
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def retire(name, info, owner=None, registry=default_registry):
+    """
+    Let the requests still running on an old version of ``name`` finish, then release its executor
+    and batchers and, with ``owner``, the artifacts it owned that no other function uses.
+    """
+    def drain():
+        executor = info.get("executor")
+        if executor is not None:
+            executor.shutdown(wait=True)
+        close_runners(info)
+        if owner is not None:
+            registry.release(owner)
+        logger.info(f"Retired old version {info.get('version')} of '{name}'")
+    threading.Thread(target=drain, name=f"retire-{name}", daemon=True).start()
+
+
+class Reloader:
+    """
+    Reloads the functions YAML file at ``path`` into ``pipelines`` (the dict the server is
+    serving from) without a restart.
+
+    Only functions whose definition changed (or that failed to load) are rebuilt, in the background, while the old
+    versions keep serving; the artifact registry means that indexes and models that did not
+    change are reused rather than loaded again, and the ones that are no longer used are
+    released with the old versions. Once every changed function has loaded, each
+    is swapped into ``pipelines`` (a single dict assignment, so every request sees either the
+    old or the new version), removed functions are dropped, and the old versions are retired
+    once their in-flight requests have finished. A function that fails to load keeps serving
+    its old version.
+
+    ``listeners`` are called with ``(changed, removed)`` after each swap, e.g. to update the
+    MCP tools.
+    """
+
+    def __init__(self, pipelines, path, registry=default_registry):
+        self.pipelines = pipelines
+        self.path = path
+        self.registry = registry
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._mtime = _mtime(path)
+        self._config = read_config(path) or {}
+        # the shared section of the running functions, reused as long as it is unchanged
+        self._shared = next((info["loader"].shared for info in pipelines.values() if "loader" in info), None)
+        self._thread = None
+        self.last = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def modified(self):
+        """Whether the YAML file changed since it was last (re)loaded."""
+        return _mtime(self.path) != self._mtime
+
+    def reload(self):
+        """
+        Reload the YAML file, returning which functions were ``changed``, ``unchanged``,
+        ``removed`` and ``failed`` (with their errors).
+        """
+        with self._lock:
+            start = time.time()
+            self._mtime = _mtime(self.path)
+            config = read_config(self.path) or {}
+            self.registry.add_targets(config.get("memoize"))
+            shared_changed = config.get("shared") != self._config.get("shared")
+            if shared_changed or self._shared is None:
+                with self.registry.patched():
+                    self._shared = load_shared(config.get("shared"))
+            old_functions = {info["loader"].function.get("name"): info["loader"].function
+                             for info in self.pipelines.values() if "loader" in info}
+
+            changed, unchanged, failed = {}, [], {}
+            for function in config.get("functions") or []:
+                name = function.get("name")
+                if not name or not (function.get("pipeline") or function.get("shards")):
+                    logger.warning(f"Skipping function with missing name or pipeline: {function}")
+                    continue
+                old = self.pipelines.get(name)
+                if (old is not None and not shared_changed and old.get("state") != "failed"
+                        and old.get("version") == function_version(function)):
+                    unchanged.append(name)
+                    continue
+                info = function_info(function, self._shared, self.registry, config.get("shared"))
+                previous = old_functions.get(name) or {}
+                if (old is not None and not shared_changed and old.get("state") == "ready"
+                        and all(previous.get(key) == function.get(key) for key in BUILD_KEYS)):
+                    # only serving options changed: keep the built pipeline
+                    info.update(describe_pipeline(name, function, old["pipeline"]))
+                    info.update({"pipeline": old["pipeline"], "state": "ready", "load_time": 0.})
+                    info.update({key: old[key] for key in ("footprint", "loads", "last_used") if key in old})
+                    if "federation" in old:
+                        info["federation"] = old["federation"]
+                changed[name] = info
+
+            to_load = {name: info for name, info in changed.items() if info["state"] == "pending"}
+            # the old versions of rebuilt functions keep their artifacts under their own owner
+            # until they retire, so that the ones the new versions do not reuse are released then
+            owners = {name: (name, id(self.pipelines[name])) for name in to_load if name in self.pipelines}
+            for name, owner in owners.items():
+                self.registry.transfer(name, owner)
+            if to_load:
+                with ThreadPoolExecutor(max_workers=load_workers(), thread_name_prefix="reload") as pool:
+                    futures = {name: pool.submit(info["loader"].load, info) for name, info in to_load.items()}
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:  # noqa: BLE001 - the failure is reported for the pipeline
+                        failed[name] = str(e)
+                        del changed[name]
+                        if name in owners:
+                            # the old version keeps serving
+                            self.registry.transfer(owners.pop(name), name)
+
+            names = set(changed) | set(unchanged) | set(failed)
+            removed = [name for name in self.pipelines if name not in names]
+            for name, info in changed.items():
+                old = self.pipelines.get(name)
+                self.pipelines[name] = info
+                if old is not None:
+                    retire(name, old, owners.get(name), self.registry)
+            for name in removed:
+                retire(name, self.pipelines.pop(name), name, self.registry)
+            self._config = config
+
+            self.last = {
+                "changed": list(changed),
+                "unchanged": unchanged,
+                "removed": removed,
+                "failed": failed,
+                "seconds": round(time.time() - start, 3),
+            }
+            logger.info(f"Reloaded {self.path}: {self.last}")
+            for listener in self.listeners:
+                try:
+                    listener(list(changed), removed)
+                except Exception:
+                    logger.exception(f"Reload listener {listener} failed")
+            return self.last
+
+    def watch(self, interval=None):
+        """Check the YAML file every ``interval`` seconds (default: :func:`reload_interval`) and reload it when it changes."""
+        interval = reload_interval() if interval is None else interval
+        if not interval or self._thread is not None:
+            return
+
+        def _watch():
+            while True:
+                time.sleep(interval)
+                if self.modified():
+                    try:
+                        self.reload()
+                    except Exception:
+                        logger.exception(f"Reloading {self.path} failed")
+
+        self._thread = threading.Thread(target=_watch, name="reload-watch", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.path} for changes every {interval}s")
+
+
+def make_reloader(pipelines):
+    """A :class:`Reloader` for ``pipelines``, if they were loaded from a YAML file (otherwise ``None``)."""
+    path = pipeline_file()
+    if not isinstance(pipelines, dict) or path is None:
+        return None
+    if not all("loader" in info for info in pipelines.values()):
+        return None
+    return Reloader(pipelines, path)
@@ -0,0 +1,152 @@
+# _residency.py
+import gc
+import logging
+import os
+import threading
+import time
+
+from pyterrier_server._loader import parse_size
+
+logger = logging.getLogger(__name__)
+
+
+def memory_budget():
+    """``PYTERRIER_SERVER_MEMORY_BUDGET``: the most memory the loaded pipelines may take, e.g. ``16G`` (default: unlimited)."""
+    try:
+        return parse_size(os.environ.get("PYTERRIER_SERVER_MEMORY_BUDGET")) or 0
+    except ValueError:
+        logger.warning("Ignoring invalid PYTERRIER_SERVER_MEMORY_BUDGET")
+        return 0
+
+
+def idle_seconds():
+    """``PYTERRIER_SERVER_IDLE_TIMEOUT``: seconds after which an unused pipeline is unloaded (default: 0, never)."""
+    try:
+        return max(0., float(os.environ.get("PYTERRIER_SERVER_IDLE_TIMEOUT", "0")))
+    except ValueError:
+        return 0.
+
+
+class Residency:
+    """
+    Decides which pipelines stay loaded. Whenever a pipeline has loaded and the total
+    footprint of the loaded pipelines (measured at load time, see
+    :class:`~pyterrier_server._loader.FunctionLoader`) exceeds ``budget`` bytes, the least
+    recently used idle pipelines are unloaded until it fits. Pipelines unused for more than
+    ``idle_timeout`` seconds are unloaded too. Unloaded pipelines are loaded again on their
+    next request.
+
+    A pipeline is idle if none of its requests is running or queued on its executor.
+    """
+
+    def __init__(self, pipelines, budget=None, idle_timeout=None):
+        self.pipelines = pipelines
+        self.budget = memory_budget() if budget is None else budget
+        self.idle_timeout = idle_seconds() if idle_timeout is None else idle_timeout
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.attach()
+
+    def attach(self):
+        """Get notified when any of the pipelines (including ones added by a reload) has loaded."""
+        for info in self.pipelines.values():
+            loader = info.get("loader")
+            if loader is not None and self.loaded not in loader.listeners:
+                loader.listeners.append(self.loaded)
+
+    def loaded(self, name, info):
+        self.enforce(keep=name)
+
+    def resident_bytes(self):
+        return sum(info.get("footprint", 0) for info in list(self.pipelines.values()) if info.get("state") == "ready")
+
+    @staticmethod
+    def _idle(info):
+        if info.get("state") != "ready" or "loader" not in info:
+            return False
+        executor = info.get("executor")
+        return executor is None or executor.depth == 0
+
+    def _unload(self, names):
+        unloaded = [name for name in names if self.pipelines[name]["loader"].unload(self.pipelines[name])]
+        if unloaded:
+            # pipelines often hold reference cycles; free them now rather than at the next collection
+            gc.collect()
+        return unloaded
+
+    def enforce(self, keep=None):
+        """Unload least recently used idle pipelines (other than ``keep``) until the loaded ones fit the budget."""
+        if not self.budget:
+            return []
+        unloaded = []
+        with self._lock:
+            skipped = {keep}
+            while self.resident_bytes() > self.budget:
+                candidates = [(info.get("last_used", 0), name) for name, info in list(self.pipelines.items())
+                              if name not in skipped and self._idle(info)]
+                if not candidates:
+                    logger.warning(f"Loaded pipelines take ~{self.resident_bytes() / 2**20:.0f} MB, over the "
+                                   f"{self.budget / 2**20:.0f} MB budget, but none can be unloaded now")
+                    break
+                _, name = min(candidates)
+                skipped.add(name)
+                unloaded += self._unload([name])
+        if unloaded:
+            logger.info(f"Unloaded {unloaded} to stay within the {self.budget / 2**20:.0f} MB memory budget")
+        return unloaded
+
+    def sweep(self):
+        """Unload the pipelines that have been idle for longer than ``idle_timeout``."""
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            stale = [name for name, info in list(self.pipelines.items())
+                     if self._idle(info) and now - info.get("last_used", now) > self.idle_timeout]
+            unloaded = self._unload(stale)
+        if unloaded:
+            logger.info(f"Unloaded {unloaded} after {self.idle_timeout:g}s without requests")
+        return unloaded
+
+    def start(self):
+        """Start sweeping for idle pipelines in the background (once per process, as threads do not survive a fork)."""
+        if not self.idle_timeout or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            interval = min(self.idle_timeout / 2, 60.)
+
+            def _sweep():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.sweep()
+                    except Exception:
+                        logger.exception("Sweeping idle pipelines failed")
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=_sweep, name="residency-sweep", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        now = time.monotonic()
+        pipelines = {}
+        for name, info in list(self.pipelines.items()):
+            loads = info.get("loads", 0)
+            pipelines[name] = {
+                "state": info.get("state", "ready"),
+                "resident": info.get("state", "ready") == "ready",
+                "footprint": info.get("footprint"),
+                "loads": loads,
+                "reloads": max(0, loads - 1),
+                "unloads": info.get("unloads", 0),
+                "idle_seconds": round(now - info["last_used"], 1) if "last_used" in info else None,
+            }
+        return {
+            "budget": self.budget or None,
+            "idle_timeout": self.idle_timeout or None,
+            "resident_bytes": self.resident_bytes(),
+            "pipelines": pipelines,
+        }
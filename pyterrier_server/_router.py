@@ -0,0 +1,107 @@
+# _router.py
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "please", "the", "this", "to", "use", "what", "when", "where", "which",
+    "who", "why", "with", "you", "your", "function", "pipeline", "these", "those", "that",
+])
+
+# the name and task of a pipeline say more about what it is for than its description
+FIELD_WEIGHTS = {"name": 2., "task": 3., "description": 1., "properties": 1.}
+
+
+def tokenize(text):
+    """Lower-cased word tokens of ``text``, without stopwords and with a plural ``s`` removed."""
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", str(text or "").lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def pipeline_terms(name, info):
+    """Weighted term counts describing pipeline ``name`` (its name, ``task``, ``description`` and ``properties``)."""
+    fields = {
+        "name": name,
+        "task": info.get("task", ""),
+        "description": info.get("description", ""),
+        "properties": " ".join(f"{p.get('name', '')} {p.get('description', '')}"
+                               for p in info.get("properties") or [] if isinstance(p, dict)),
+    }
+    terms = Counter()
+    for field, text in fields.items():
+        for token in tokenize(text.replace("-", " ").replace("_", " ")):
+            terms[token] += FIELD_WEIGHTS[field]
+    return terms
+
+
+def router_mode():
+    """``PYTERRIER_SERVER_ROUTER``: ``llm`` (default) or ``local``."""
+    mode = os.environ.get("PYTERRIER_SERVER_ROUTER", "llm").lower()
+    return mode if mode in ("llm", "local") else "llm"
+
+
+def router_threshold():
+    """``PYTERRIER_SERVER_ROUTER_THRESHOLD``: the confidence below which a local router defers to the LLM (default: 0.1)."""
+    try:
+        return float(os.environ.get("PYTERRIER_SERVER_ROUTER_THRESHOLD", "0.1"))
+    except ValueError:
+        return 0.1
+
+
+class Router:
+    """
+    Picks the pipeline best suited to a free-text request without calling an LLM, by the
+    TF-IDF cosine similarity between the request and each pipeline's name, ``task``,
+    ``description`` and ``properties``. The pipeline vectors are computed once, when the
+    router is created.
+
+    The confidence of a decision is the margin by which the best pipeline beats the
+    runner-up (or its score, if there is only one pipeline), between 0 and 1.
+    """
+
+    def __init__(self, pipelines):
+        terms = {name: pipeline_terms(name, info) for name, info in pipelines.items()}
+        doc_freq = Counter(t for counts in terms.values() for t in counts)
+        n = len(terms)
+        self.idf = {t: math.log((n + 1) / (df + 1)) + 1. for t, df in doc_freq.items()}
+        self.vectors = {name: self._normalise({t: w * self.idf[t] for t, w in counts.items()})
+                        for name, counts in terms.items()}
+
+    @staticmethod
+    def _normalise(vector):
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {t: w / norm for t, w in vector.items()} if norm else {}
+
+    def scores(self, text):
+        """The similarity of ``text`` to each pipeline, best first."""
+        query = self._normalise({t: c * self.idf[t] for t, c in Counter(tokenize(text)).items() if t in self.idf})
+        scores = {name: sum(w * vector.get(t, 0.) for t, w in query.items()) for name, vector in self.vectors.items()}
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+
+    def route(self, text):
+        """
+        Returns the routing decision for ``text``: a dict with the chosen ``pipeline`` (``None`` if
+        no pipeline shares a term with it), its ``confidence`` and the ``scores`` of all pipelines.
+        """
+        scores = {name: round(score, 4) for name, score in self.scores(text).items()}
+        ranked = list(scores.items())
+        if not ranked or ranked[0][1] <= 0:
+            return {"pipeline": None, "confidence": 0., "scores": scores}
+        best, top = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.
+        return {
+            "pipeline": best,
+            "confidence": round(top - second, 4),
+            "scores": scores,
+        }
@@ -0,0 +1,148 @@
+# _runner.py
+import logging
+import threading
+from collections import OrderedDict
+
+import pyterrier as pt
+
+from pyterrier_server._batching import make_batcher
+from pyterrier_server._cache import CachedPipeline, default_cache
+from pyterrier_server._coalescing import CoalescingPipeline, default_coalescer
+from pyterrier_server._loader import ensure_loaded
+from pyterrier_server._metrics import run_timed
+from pyterrier_server._prefix import PrefixPlanner
+from pyterrier_server._profiling import default_sampler
+from pyterrier_server._pushdown import rewrite, stages
+from pyterrier_server._store import StoreTier, get_store
+
+logger = logging.getLogger(__name__)
+
+# most (k, fields) variants kept per pipeline
+MAX_VARIANTS = 32
+_variants_lock = threading.Lock()
+
+
+class LoadedPipeline:
+    """
+    Calls the pipeline currently loaded for a function, building lazy functions on first use.
+    If ``k`` or ``fields`` are given, the pipeline is first rewritten to push them down (see :func:`rewrite`);
+    with ``prefix``, only its first ``prefix`` stages are run (e.g. the retrieval stages of a RAG pipeline).
+    Each stage is timed (see :func:`run_timed`), and a sample of calls is profiled (see :func:`default_sampler`).
+    """
+
+    def __init__(self, info, k=None, fields=None, name=None, prefix=None):
+        self.info = info
+        self.name = name
+        self.k = k
+        self.fields = fields
+        self.prefix = prefix
+        self._source = None
+        self._rewritten = None
+
+    def resolve(self):
+        """The pipeline to run: the loaded one, cut to ``prefix`` and rewritten for ``k`` and ``fields`` (once per loaded pipeline)."""
+        pipeline = ensure_loaded(self.info)
+        if self.k is None and not self.fields and not self.prefix:
+            return pipeline
+        if self._source is not pipeline:
+            # count the stages as built, not as rebuilt to share a prefix with other pipelines
+            parts = stages(PrefixPlanner.source(pipeline))[:self.prefix] if self.prefix else [pipeline]
+            self._rewritten = rewrite(pt.Compose(*parts) if len(parts) > 1 else parts[0], self.k, self.fields)
+            self._source = pipeline
+        return self._rewritten
+
+    def release(self):
+        """Drop the references to the loaded (and rewritten) pipeline, e.g. when it is unloaded."""
+        self._source = self._rewritten = None
+
+    def __call__(self, df):
+        return default_sampler()(self.name, run_timed, self.name, self.resolve(), df)
+
+
+def build_runner(name, info, cache=None, k=None, fields=None, loaded=None, prefix=None):
+    """
+    Build the callable that serves requests for pipeline ``name``: the loaded
+    pipeline (specialised for ``k``, ``fields`` and ``prefix``, if given), behind the
+    micro-batcher (if ``batching`` is configured), single-flight coalescing of
+    concurrent identical rows (unless the function sets ``coalesce: false``),
+    the shared result cache (unless the function sets ``cache: false``) and the
+    function's store of precomputed results (if it has one, see :func:`get_store`).
+    """
+    runner = loaded or LoadedPipeline(info, k, fields, name=name, prefix=prefix)
+    version = info.get("version")
+    if k is not None or fields:
+        version = f"{version}:k={k}:fields={','.join(fields or [])}"
+    if prefix:
+        version = f"{version}:prefix={prefix}"
+
+    batcher = make_batcher(runner, info.get("batching"), name=name)
+    if batcher is not None:
+        logger.info(f"Micro-batching enabled for '{name}' (max_batch_size={batcher.max_batch_size}, max_wait_ms={batcher.max_wait * 1000:g})")
+        runner = batcher
+
+    if info.get("coalesce", True):
+        # concurrent requests for the same rows share one execution
+        runner = CoalescingPipeline(runner, default_coalescer(), name, version=version)
+
+    cache = cache or default_cache()
+    if info.get("cache", True) and cache.enabled:
+        runner = CachedPipeline(runner, cache, name, version=version)
+    else:
+        logger.info(f"Result cache disabled for '{name}'")
+
+    # (not for a prefix of the pipeline, which the stored results are not the output of)
+    store = get_store(name, info) if not prefix else None
+    if store is not None:
+        # stored results are complete, so requests for the top k or for some fields can use them too
+        runner = CachedPipeline(runner, StoreTier(store, k), name, version=info.get("result_version"))
+
+    return runner
+
+
+def get_runner(name, info, k=None, fields=None, prefix=None):
+    """
+    Return the runner for ``name``, building it on first use so that every entry point shares it.
+    Requests for only the top ``k`` results or only some ``fields`` (or for only the first
+    ``prefix`` stages) get their own runner (and cache entries), of which the ``MAX_VARIANTS``
+    most recently used are kept.
+    """
+    if k is None and not fields and not prefix:
+        if "runner" not in info:
+            info["runner"] = build_runner(name, info)
+        return info["runner"]
+
+    return _variant(name, info, k, fields, prefix)[1]
+
+
+def get_pipeline(name, info, k=None, fields=None, prefix=None):
+    """
+    The pipeline that serves ``name``, loaded (and rewritten for ``k``, ``fields`` and ``prefix``)
+    but not behind the micro-batcher or the cache, e.g. for running it stage by stage.
+    """
+    if k is None and not fields and not prefix:
+        return ensure_loaded(info)
+    return _variant(name, info, k, fields, prefix)[0].resolve()
+
+
+def _variant(name, info, k, fields, prefix=None):
+    key = (k, tuple(sorted(fields or [])), prefix or None)
+    with _variants_lock:
+        variants = info.setdefault("variants", OrderedDict())
+        if key in variants:
+            variants.move_to_end(key)
+            return variants[key]
+        loaded = LoadedPipeline(info, k, list(key[1]) or None, name=name, prefix=key[2])
+        variants[key] = loaded, build_runner(name, info, k=k, fields=loaded.fields, loaded=loaded, prefix=key[2])
+        while len(variants) > MAX_VARIANTS:
+            variants.popitem(last=False)
+        return variants[key]
+
+
+def close_runners(info):
+    """Stop the background threads (e.g. micro-batchers) behind the runners of ``info``, which is no longer served."""
+    runners = [info.get("runner")] + [runner for _, runner in (info.get("variants") or {}).values()]
+    for runner in runners:
+        while runner is not None:
+            if hasattr(runner, "close"):
+                runner.close()
+            runner = getattr(runner, "pipeline", None)
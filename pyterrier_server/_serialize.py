@@ -0,0 +1,148 @@
+# _serialize.py
+import json
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+
+# ?format= aliases
+FORMATS = {
+    "json": JSON,
+    "arrow": ARROW,
+    "msgpack": MSGPACK,
+}
+MIMETYPES = {
+    JSON: JSON,
+    "*/*": JSON,
+    "application/*": JSON,
+    ARROW: ARROW,
+    "application/vnd.apache.arrow.file": ARROW,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+}
+
+
+class NotAcceptable(ValueError):
+    """Raised when none of the requested response formats can be produced."""
+
+
+def parse_fields(value):
+    """Parse a ``fields`` parameter given as a comma-separated string or a list."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return [f.strip() for f in value if f and f.strip()]
+
+
+def parse_limit(value, name="limit"):
+    """Parse a ``limit`` (or ``k``) option: a whole number of at least 1, or ``None`` if not given."""
+    if value in (None, ""):
+        return None
+    try:
+        limit = int(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{name} must be a whole number, not {value!r}") from e
+    if limit < 1:
+        raise ValueError(f"{name} must be at least 1")
+    return limit
+
+
+def project(df: pd.DataFrame, fields=None, limit=None) -> pd.DataFrame:
+    """Keep only the requested ``fields`` and at most ``limit`` rows per query (or document)."""
+    if limit is not None:
+        key = "qid" if "qid" in df.columns else ("docno" if "docno" in df.columns else None)
+        df = df.groupby(key, sort=False).head(limit) if key else df.head(limit)
+    if fields:
+        missing = [f for f in fields if f not in df.columns]
+        if missing:
+            raise ValueError(f"Unknown fields {missing}; available: {list(df.columns)}")
+        df = df[fields]
+    return df
+
+
+def negotiate(accept=None, fmt=None):
+    """Pick the response mimetype from a ``?format=`` parameter or the ``Accept`` header."""
+    if fmt:
+        if fmt.lower() not in FORMATS:
+            raise NotAcceptable(f"Unknown format '{fmt}'; expected one of {list(FORMATS)}")
+        return FORMATS[fmt.lower()]
+    if not accept:
+        return JSON
+    # honour q-values, most preferred first
+    options = []
+    for i, part in enumerate(accept.split(",")):
+        mimetype, *params = [p.strip() for p in part.split(";")]
+        q = 1.
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    pass
+        options.append((-q, i, mimetype.lower()))
+    for q, _, mimetype in sorted(options):
+        if q < 0 and mimetype in MIMETYPES:
+            return MIMETYPES[mimetype]
+    raise NotAcceptable(f"Cannot produce any of: {accept}")
+
+
+def _json_default(o):
+    if hasattr(o, "isoformat"):
+        return o.isoformat()
+    # numpy scalars (e.g. int64 ranks) are not JSON serialisable by default
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+def _to_json(df):
+    floats = list(df.select_dtypes("floating").columns)
+    if not floats:
+        # pandas' C encoder skips building a list of dicts, which makes it several
+        # times faster than to_dict("records") + json.dumps for large result lists
+        return df.to_json(orient="records", date_format="iso").encode()
+    # but it rounds floats to 15 significant digits, while scores need all of theirs to
+    # round-trip (and to keep their ties and order); missing values become nulls
+    df = df.astype({c: object for c in floats})
+    df[floats] = df[floats].where(df[floats].notna(), None)
+    return json.dumps(df.to_dict("records"), separators=(",", ":"), default=_json_default).encode()
+
+
+def _to_arrow(df):
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise NotAcceptable("Arrow responses require pyarrow to be installed") from e
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _to_msgpack(df):
+    try:
+        import msgpack
+    except ImportError as e:
+        raise NotAcceptable("MessagePack responses require msgpack to be installed") from e
+    # columnar: {column: [values, ...]}
+    columns = {c: df[c].tolist() for c in df.columns}
+    return msgpack.packb(columns, default=str)
+
+
+SERIALIZERS = {
+    JSON: _to_json,
+    ARROW: _to_arrow,
+    MSGPACK: _to_msgpack,
+}
+
+
+def serialize(df: pd.DataFrame, mimetype=JSON):
+    """Serialise a result frame, returning ``(bytes, mimetype)``."""
+    return SERIALIZERS[mimetype](df), mimetype
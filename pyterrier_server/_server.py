@@ -1,12 +1,34 @@
 # server.py
 import asyncio
-from flask import Flask, request
-from flask import jsonify, render_template
-from pyterrier_server._loader import load_pipeline
+from flask import Flask, Response, g, request, stream_with_context
+from flask import jsonify, render_template, send_file
+from pyterrier_server._loader import load_pipeline, ensure_loaded, PipelineNotReady
+from pyterrier_server._reload import make_reloader
+from pyterrier_server._residency import Residency
+from pyterrier_server._prefix import PrefixPlanner
+from pyterrier_server._cache import default_cache
+from pyterrier_server._coalescing import default_coalescer
+from pyterrier_server._artifacts import default_registry
+from pyterrier_server._runner import get_runner, get_pipeline
+from pyterrier_server._handler import PipelineCall, input_row, json_default, json_object, request_timeout
+from pyterrier_server._executors import get_executor, Overloaded, DeadlineExceeded
+from pyterrier_server._degrade import get_policy
+from pyterrier_server._serialize import parse_fields, parse_limit, project, serialize
+from pyterrier_server._metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, default_metrics, server_collectors
+from pyterrier_server._profiling import default_sampler, is_admin
+from pyterrier_server._streaming import SSE, sse, stream_ai, stream_pipeline, wants_stream
+from pyterrier_server._router import Router, router_mode, router_threshold
+from pyterrier_server._jobs import JobManager, JobNotFound
+from pyterrier_server._logging import log_access, payload_logger, sample_payload, stats as logging_stats
 from fastmcp import Client
 from openai import OpenAI
 import os
+import json
+import signal
 import logging
+import time
+import functools
+import itertools
 import pandas as pd
 
 logger = logging.getLogger("pyterrier_server")
@@ -19,9 +41,131 @@ async def getMCP(mcp_url):
             flag = True
     return flag
 
-def create_app():
+def default_chunk_size():
+    try:
+        return max(1, int(os.environ.get("PYTERRIER_SERVER_BATCH_CHUNK_SIZE", "100")))
+    except ValueError:
+        return 100
+
+class InvalidLine(ValueError):
+    """An NDJSON line of a batch upload that is not a JSON object, given in place of its record."""
+
+    def __init__(self, lineno, message):
+        super().__init__(message)
+        self.lineno = lineno
+
+def read_batch_records(req):
+    """
+    Parse a batch upload: either a JSON array or NDJSON (one JSON object per line). Raises
+    ``ValueError`` for an invalid JSON array and ``TypeError`` for array entries that are not
+    objects; as NDJSON is parsed while the results stream, its invalid lines are given as
+    :class:`InvalidLine` errors in place of their records.
+    """
+    data = req.get_data(cache=False)
+    stripped = data.lstrip()
+    if stripped.startswith(b"["):
+        try:
+            records = json.loads(data)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON array: {e}") from e
+        if not all(isinstance(r, dict) for r in records):
+            raise TypeError("Batch entries must be JSON objects")
+        return records
+
+    def ndjson():
+        for lineno, line in enumerate(data.splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield InvalidLine(lineno, f"Invalid JSON: {e}")
+                continue
+            yield record if isinstance(record, dict) else InvalidLine(lineno, "Invalid JSON: not a JSON object")
+    return ndjson()
+
+def stream_batch(pipe, name, info, records, chunk_size, fields=None, limit=None):
+    """
+    Run ``records`` through ``pipe`` in chunks, yielding one NDJSON line per record (with its qid, or docno)
+    as each chunk finishes. Records are told apart by position, so records sharing an id get a line each.
+    An invalid record (see :class:`InvalidLine`) gets an error line in its place, and a failed chunk a
+    single error line in place of its first record.
+    """
+    def run_chunk(rows):
+        """The output line of each of ``rows``, in order, or an error line for all of them."""
+        key = "docno" if "docno" in rows[0] and "qid" not in rows[0] else "qid"
+        ids = [row[key] for row in rows]
+        try:
+            result = pipe(pd.DataFrame(rows).assign(**{key: [str(j) for j in range(len(rows))]}))
+        except Exception as e:
+            logger.exception(f"Batch chunk failed for '{name}'")
+            return json.dumps({"error": str(e), key + "s": ids}) + "\n"
+        if not isinstance(result, pd.DataFrame):
+            return json.dumps({"error": f"Pipeline returned {type(result).__name__}", key + "s": ids}) + "\n"
+        try:
+            result = project(result, limit=limit)
+            project(result.iloc[0:0], fields) # validate fields before streaming anything
+        except ValueError as e:
+            return json.dumps({"error": str(e), key + "s": ids}) + "\n"
+        groups = {k: g for k, g in result.groupby(key, sort=False)} if len(result) else {}
+        lines = []
+        for j, i in enumerate(ids):
+            group = groups.get(str(j))
+            records = serialize(project(group.assign(**{key: i}), fields))[0].decode() if group is not None else "[]"
+            lines.append(f'{{{json.dumps(key)}: {json.dumps(i, default=json_default)}, "results": {records}}}\n')
+        return lines
+
+    def flush(entries, rows):
+        # in input order: the invalid records' errors, and the results of the others
+        lines = run_chunk(rows) if rows else []
+        failed = isinstance(lines, str)
+        lines = iter([lines] if failed else lines)
+        for entry in entries:
+            if isinstance(entry, str):
+                yield entry
+            elif not failed or entry is rows[0]:
+                yield next(lines)
+
+    # the input rows of the current chunk, and the lines that are not valid rows
+    entries, rows = [], []
+    for i, record in enumerate(records, start=1):
+        if isinstance(record, InvalidLine):
+            entries.append(json.dumps({"line": record.lineno, "error": str(record)}) + "\n")
+            continue
+        rows.append(input_row(info, record, default_id=i))
+        entries.append(rows[-1])
+        if len(rows) >= chunk_size:
+            yield from flush(entries, rows)
+            entries, rows = [], []
+    if entries:
+        yield from flush(entries, rows)
+
+def not_ready(e):
+    return jsonify({"error": str(e)}), 503, {"Retry-After": os.environ.get("PYTERRIER_SERVER_RETRY_AFTER", "5")}
+
+def overloaded(e):
+    return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
+def stream_response(events):
+    # no-cache/no-buffering so that proxies pass each event on as soon as it is sent
+    return Response(stream_with_context(events), mimetype=SSE,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def pipeline_states(pipelines):
+    return {name: info.get("state", "ready") for name, info in pipelines.items()}
+
+def create_app(pipelines=None, connect_mcp=True):
+    """
+    Create the Flask app. If ``pipelines`` is not given, they are loaded in the
+    background and each one is served as soon as it is ready (see ``/ready``).
+    With ``connect_mcp=False``, the MCP server at ``PYTERRIER_MCP_URL`` is not
+    contacted on startup (e.g. because it is served by this process, see
+    :func:`~pyterrier_server._asgi.create_asgi_app`).
+    """
     app = Flask(__name__)
-    pipelines = load_pipeline()
+    if pipelines is None:
+        pipelines = load_pipeline(wait=False)
     app.config['PIPELINES'] = pipelines
     app.config['MCP_TOOLS'] = {}
     app.config["OPENAI_CLIENT"] = OpenAI(
@@ -30,56 +174,199 @@ def create_app():
         )
     app.json.sort_keys = False
 
+    # --- Access log (when served through ASGI, the middleware logs instead, see _asgi.py) ---
+    app.config.setdefault("ACCESS_LOG", True)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def access_log(response):
+        if app.config["ACCESS_LOG"] and "request_start" in g:
+            log_access(request.method, request.path, response.status_code, time.perf_counter() - g.request_start,
+                       request.content_length, response.content_length, (request.view_args or {}).get("name"))
+        return response
+
     # --- Detect MCP ---
     mcp_url = os.environ.get("PYTERRIER_MCP_URL")
-    if mcp_url:
-        mcp_url = os.environ.get("PYTERRIER_MCP_URL")
-        print(f"Connecting to MCP server at {mcp_url}")
+    app.config["MCP_URL"] = mcp_url
+    if mcp_url and connect_mcp:
+        logger.info(f"Connecting to MCP server at {mcp_url}")
         app.config["MCP_EXISTS"] = asyncio.run(getMCP(mcp_url))
 
     # --- Auto-create endpoints for each pipeline ---
-    def make_endpoint(pipe, name):
-        def endpoint_func():
-            body = request.get_json(force=True, silent=True) or {}
-            try:
-                # Determine input based on pipeline name
-                if name == "doc2query":
-                    df_input = pd.DataFrame([{
-                        "docno": str(body.get("docno") or 1),
-                        "text": body.get("text") or body.get("q") or ""
-                    }])
-                else:
-                    df_input = pd.DataFrame([{
-                        "qid": str(body.get("qid") or 1),
-                        "query": body.get("query") or body.get("q") or ""
-                    }])
-
-                result = pipe(df_input)
-
-                if isinstance(result, pd.DataFrame):
-                    return jsonify(result.to_dict("records"))
-                return jsonify(result)
-            except Exception as e:
-                return jsonify({"error": str(e)}), 500
-        return endpoint_func
+    def serve_pipeline(name, info, executor):
+        call = PipelineCall(name, info, executor, request.args, request.headers,
+                            request.get_json(force=True, silent=True))
+        reply = call.start() or call.wait()
+        body = stream_with_context(reply.body) if reply.stream else reply.body
+        return Response(body, status=reply.status, mimetype=reply.mimetype, headers=reply.headers)
+
+    def serve_batch(name, info, executor, chunk_size):
+        try:
+            ensure_loaded(info)
+        except PipelineNotReady as e:
+            return not_ready(e)
+        try:
+            fields = parse_fields(request.args.get("fields"))
+            limit = parse_limit(request.args.get("limit"))
+            k = parse_limit(request.args.get("k"), "k")
+            records = read_batch_records(request)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        size = request.args.get("chunk_size", type=int) or chunk_size
+        pipe = functools.partial(executor.run_patiently, get_runner(name, info, k=k, fields=fields))
+        return Response(stream_with_context(stream_batch(pipe, name, info, records, size, fields, limit)),
+                        mimetype="application/x-ndjson")
 
     # Register endpoints
+    # pipelines are looked up by name on every request, so that a reload (see /admin/reload)
+    # takes effect for new requests while in-flight ones finish on the version they started with
+    @app.route('/pipeline/<name>', methods=['POST'])
+    def pipeline_endpoint(name):
+        info = app.config['PIPELINES'].get(name)
+        if info is None:
+            return jsonify({"error": f"Unknown pipeline '{name}'"}), 404
+        return serve_pipeline(name, info, get_executor(name, info))
+
+    @app.route('/pipeline/<name>/batch', methods=['POST'])
+    def batch_endpoint(name):
+        info = app.config['PIPELINES'].get(name)
+        if info is None:
+            return jsonify({"error": f"Unknown pipeline '{name}'"}), 404
+        chunk_size = int(info.get("batch_chunk_size") or default_chunk_size())
+        return serve_batch(name, info, get_executor(name, info), chunk_size)
+
+    @app.route('/pipeline/<name>/jobs', methods=['POST'])
+    def submit_job(name):
+        """Run a JSONL collection (e.g. of documents) through pipeline ``name`` as a background job."""
+        info = app.config['PIPELINES'].get(name)
+        if info is None or "JOBS" not in app.config:
+            return jsonify({"error": f"Unknown pipeline '{name}'"}), 404
+        chunk_size = request.args.get("chunk_size", type=int) or int(info.get("batch_chunk_size") or default_chunk_size())
+        job = app.config["JOBS"].submit(name, request.stream, max(1, chunk_size))
+        return jsonify(job), 202, {"Location": f"/jobs/{job['id']}"}
+
+    @app.route('/jobs', methods=['GET'])
+    def list_jobs():
+        jobs = app.config.get("JOBS")
+        return jsonify({"jobs": jobs.list() if jobs is not None else []})
+
+    @app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+    def job_status(job_id):
+        """The progress of a job (GET), or cancel it after its current chunk (DELETE)."""
+        try:
+            jobs = app.config["JOBS"]
+            return jsonify(jobs.cancel(job_id) if request.method == 'DELETE' else jobs.read(job_id))
+        except (KeyError, JobNotFound):
+            return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+
+    @app.route('/jobs/<job_id>/resume', methods=['POST'])
+    def resume_job(job_id):
+        """Continue a failed or cancelled job from its last checkpoint."""
+        try:
+            return jsonify(app.config["JOBS"].resume(job_id)), 202
+        except (KeyError, JobNotFound):
+            return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+
+    @app.route('/jobs/<job_id>/results', methods=['GET'])
+    def job_results(job_id):
+        """The results of a job so far, as NDJSON (one line per input row)."""
+        try:
+            path = app.config["JOBS"].path(job_id, "output.jsonl")
+        except (KeyError, JobNotFound):
+            path = None
+        if path is None or not os.path.exists(path):
+            return jsonify({"error": f"No results for job '{job_id}'"}), 404
+        return send_file(os.path.abspath(path), mimetype="application/x-ndjson")
+
     if isinstance(pipelines, dict):
         for name, info in pipelines.items():
-            pipe = info.get("pipeline")
-            if not pipe:
-                continue
-            endpoint = f"/pipeline/{name}"
-            app.add_url_rule(endpoint, endpoint, make_endpoint(pipe, name), methods=["POST"])
-            logger.info(f"Registered pipeline endpoint: {endpoint}")
-
+            get_runner(name, info)
+            get_executor(name, info)
+            get_policy(name, info)
+            logger.info(f"Serving pipeline endpoints: /pipeline/{name}, /pipeline/{name}/batch")
+
+        # the pipeline vectors of the local /ai router are computed once, here (and again after a reload)
+        app.config["ROUTER"] = Router(pipelines)
+        # unload pipelines over the memory budget (or idle for too long); they are loaded again on demand
+        residency = Residency(pipelines)
+        residency.enforce()
+        app.config["RESIDENCY"] = residency
+        app.before_request(residency.start)
+        # pipelines that start with the same stages run them once for a query (see _prefix.py)
+        planner = PrefixPlanner(pipelines)
+        planner.plan()
+        app.config["PREFIXES"] = planner
+        # bulk jobs run in the background; unfinished ones resume once the process serves its first request
+        jobs = JobManager(pipelines, input_row)
+        app.config["JOBS"] = jobs
+        app.before_request(jobs.start)
+
+        reloader = make_reloader(pipelines)
+        if reloader is not None:
+            reloader.add_listener(lambda changed, removed: app.config.update(ROUTER=Router(pipelines)))
+            reloader.add_listener(lambda changed, removed: residency.attach())
+            reloader.add_listener(lambda changed, removed: (planner.attach(), planner.plan()))
+            app.config["RELOADER"] = reloader
+
+    def run_routed(decision, user_input, stream):
+        """Run the pipeline chosen by the local router in this process, reporting it like an MCP tool call."""
+        name = decision["pipeline"]
+        info = app.config['PIPELINES'][name]
+        executor = get_executor(name, info)
+        df_input = pd.DataFrame([input_row(info, {"query": user_input, "text": user_input})])
+        timeout = request_timeout(request.headers, {})
+        try:
+            if stream:
+                events = stream_pipeline(executor, get_pipeline(name, info), df_input, timeout=timeout)
+                return stream_response(itertools.chain([sse("route", decision)], events))
+            result = executor.run(get_runner(name, info), df_input, timeout=timeout)
+        except PipelineNotReady as e:
+            return not_ready(e)
+        except Overloaded as e:
+            return overloaded(e)
+        except DeadlineExceeded as e:
+            return jsonify({"error": str(e)}), 504
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        if isinstance(result, pd.DataFrame):
+            output = serialize(result)[0].decode()
+        else:
+            output = json.dumps(result, default=json_default)
+        return jsonify({"output": output, "tools_used": [{"name": name, "output": output, "routing": decision}]})
 
     # --- AI endpoint using MCP tools ---
     @app.route('/ai', methods=['POST'])
     def ai():
-        body = request.get_json(force=True, silent=True) or {}
+        """
+        Answer a free-text request with the most suitable pipeline. By default an LLM picks (and calls)
+        the pipeline through the MCP tools. With the local router (``PYTERRIER_SERVER_ROUTER=local``, or
+        ``"router": "local"`` in the body), the pipeline is picked by matching the request against the
+        pipelines' descriptions and run in this process; the LLM is only used when the router's confidence
+        is below ``PYTERRIER_SERVER_ROUTER_THRESHOLD``.
+        """
+        try:
+            body = json_object(request.get_json(force=True, silent=True))
+        except TypeError as e:
+            return jsonify({"error": str(e)}), 400
         user_input = body.get("input") or body.get("query") or body.get("text") or body.get("q") or ""
         mcp_tools = app.config.get("MCP_EXISTS", {})
+        stream = wants_stream(request.args, request.headers, body)
+
+        mode = str(body.get("router") or router_mode()).lower()
+        if mode not in ("llm", "local"):
+            return jsonify({"error": f"Unknown router '{mode}' (expected 'llm' or 'local')"}), 400
+        routing = None
+        if mode == "local" and app.config.get("ROUTER") is not None:
+            decision = app.config["ROUTER"].route(user_input)
+            threshold = router_threshold()
+            if decision["pipeline"] and (decision["confidence"] >= threshold or not mcp_tools):
+                return run_routed({"router": "local", "threshold": threshold, **decision}, user_input, stream)
+            routing = {"router": "llm", "threshold": threshold, **decision}
+            logger.info(f"Local router not confident ({decision['confidence']} < {threshold}), deferring to the LLM")
+
         if not mcp_tools:
             return jsonify({"error": "No MCP tools available"}), 400
 
@@ -92,7 +379,7 @@ def create_app():
                         "type": "mcp",
                         "server_label": "PYTERRIER_MCP",
                         "server_description": "An MCP server that contains multiple information retrieval pipelines",
-                        "server_url": f"{mcp_url}",
+                        "server_url": f"{app.config.get('MCP_URL')}",
                         "require_approval": "never",
                     }],
                 input=[
@@ -114,9 +401,16 @@ def create_app():
                     )},
                     {"role": "user", "content": user_input},
                 ],
+                stream=stream,
             )
+            if stream:
+                events = stream_ai(resp)
+                if routing is not None:
+                    events = itertools.chain([sse("route", routing)], events)
+                return stream_response(events)
 
-            logger.info("resp\n:"+str(resp))
+            if sample_payload():
+                payload_logger.info(f"/ai response: {resp}")
 
             # Log tools used (if the response has tool info)
             tools_used = getattr(resp, "tool_usage", None)
@@ -131,7 +425,11 @@ def create_app():
                                 "output": item.output
                             })
 
-            logger.info(f"Tools used: {tools_used}")
+            if routing is not None:
+                tools_used = [{**tool, "routing": routing} for tool in tools_used]
+            logger.info(f"Tools used: {[tool.get('name') for tool in tools_used]}")
+            if sample_payload():
+                payload_logger.info(f"/ai tools used: {tools_used}")
 
 
             return jsonify({"output": resp.output_text, "tools_used": tools_used or []})
@@ -155,23 +453,102 @@ def create_app():
             for name, info in pipelines.items():
                 available.append({
                     "name": name,              
-                    "task": info.get('task') or name 
+                    "task": info.get('task') or name,
+                    "state": info.get('state', 'ready'),
+                    "executor": get_executor(name, info).stats(),
                 })
 
         return jsonify({
             "available_pipelines": available,
-            "mcp_enabled": bool(app.config.get('MCP_EXISTS'))
+            "mcp_enabled": bool(app.config.get('MCP_EXISTS')),
+            "cache": default_cache().stats(),
+            "coalescing": default_coalescer().stats(),
+            "shared_artifacts": default_registry.stats(),
+            "residency": app.config["RESIDENCY"].stats() if "RESIDENCY" in app.config else None,
+            "shared_prefixes": app.config["PREFIXES"].stats() if "PREFIXES" in app.config else None,
+            "logging": logging_stats(),
+            "stores": {name: info["result_store"].stats() for name, info in pipelines.items()
+                       if info.get("result_store") is not None} if isinstance(pipelines, dict) else {},
+            "federation": {name: info["federation"].stats() for name, info in pipelines.items()
+                           if info.get("federation") is not None} if isinstance(pipelines, dict) else {},
+            "degradation": {name: info["degradation"].stats() for name, info in pipelines.items()
+                            if info.get("degradation") is not None} if isinstance(pipelines, dict) else {},
         })
 
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Per-pipeline and per-stage latency, throughput, errors, batch sizes and cache hits, for Prometheus."""
+        return Response(default_metrics.render(server_collectors(app.config['PIPELINES'])), mimetype=METRICS_CONTENT_TYPE)
+
+    @app.route('/admin/profiling', methods=['GET', 'POST'])
+    def admin_profiling():
+        """
+        Show (GET) or change (POST ``{"rate": 0.01, "directory": "...", "interval": 0.005}``) the fraction
+        of requests that are profiled in this process. Requires the admin token.
+        """
+        if not is_admin(request.headers):
+            return jsonify({"error": "Forbidden"}), 403
+        sampler = default_sampler()
+        if request.method == 'POST':
+            try:
+                body = json_object(request.get_json(force=True, silent=True))
+                sampler.configure(body.get("rate"), body.get("directory"), body.get("interval"))
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            logger.info(f"Request profiling: {sampler.status()}")
+        return jsonify(sampler.status())
+
+    @app.route('/admin/reload', methods=['GET', 'POST'])
+    def admin_reload():
+        """
+        Reload the functions YAML file (POST), rebuilding only the functions that changed, or show
+        the outcome of the last reload (GET). Requires the admin token.
+        """
+        if not is_admin(request.headers):
+            return jsonify({"error": "Forbidden"}), 403
+        master = os.environ.get("PYTERRIER_SERVER_MASTER_PID")
+        if request.method == 'POST' and master:
+            # pre-forked worker: the master reloads, then replaces the workers (see PreforkServer)
+            os.kill(int(master), signal.SIGHUP)
+            return jsonify({"status": "reloading"}), 202
+        reloader = app.config.get("RELOADER")
+        if reloader is None:
+            return jsonify({"error": "Reloading needs PYTERRIER_SERVER_PIPELINE to be a YAML file"}), 400
+        if request.method == 'GET':
+            return jsonify({"path": reloader.path, "last": reloader.last})
+        try:
+            return jsonify(reloader.reload())
+        except Exception as e:
+            logger.exception("Reload failed")
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({"status": "ok", "pipelines": pipeline_states(app.config['PIPELINES'])})
+
+    @app.route('/ready', methods=['GET'])
+    def ready():
+        """200 once the requested pipelines (``?pipelines=a,b``, default: all) can serve traffic, 503 before."""
+        states = pipeline_states(app.config['PIPELINES'])
+        wanted = request.args.get("pipelines")
+        if wanted:
+            wanted = [n.strip() for n in wanted.split(",") if n.strip()]
+            states = {n: states.get(n, "unknown") for n in wanted}
+        # lazy (and unloaded) pipelines can serve traffic: they load on their first request
+        is_ready = all(state in ("ready", "lazy", "unloaded") for state in states.values())
+        return jsonify({"ready": is_ready, "pipelines": states}), 200 if is_ready else 503
+
     for rule in app.url_map.iter_rules():
         methods = ",".join(rule.methods)
-        print(f"{rule.endpoint}: {rule} [{methods}]")
+        logger.debug(f"{rule.endpoint}: {rule} [{methods}]")
 
     return app
 
 
 if __name__ == "__main__":
     app = create_app()
-    port = int(os.environ.get("PYTERRIER_SERVER_PORT", 8000))
+    if app.config.get("RELOADER") is not None:
+        app.config["RELOADER"].watch()
+    port = int(os.environ.get("PYTERRIER_SERVER_PORT", "8000"))
     host = os.environ.get("PYTERRIER_SERVER_HOST", "0.0.0.0")
     app.run(host=host, port=port, debug=True)
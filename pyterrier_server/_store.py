@@ -0,0 +1,179 @@
+# _store.py
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+from pyterrier_server._cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PTSTORE1"
+# sha1 digest of the key, offset of the result in the data section, length of the result
+ENTRY = struct.Struct("<20sQI")
+HEADER_LENGTH = struct.Struct("<I")
+
+
+def write_store(path, name, version, entries):
+    """
+    Write precomputed results for pipeline ``name`` to a store file at ``path``.
+
+    ``entries`` are ``(key, result)`` pairs, where ``key`` is the result cache key of the
+    (normalised) input row (see :meth:`ResultCache.make_key`) and ``result`` its DataFrame.
+    The file is a small JSON header, then the keys' digests in sorted order (so that lookups
+    are a binary search over the memory-mapped file), then the zlib-compressed pickled
+    results. It is written to a temporary file first, so readers never see a partial store.
+    """
+    index = []
+    tmp = f"{path}.tmp-{os.getpid()}"
+    data_path = f"{tmp}.data"
+    offset = 0
+    with open(data_path, "wb") as data:
+        for key, result in entries:
+            blob = zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+            data.write(blob)
+            index.append((bytes.fromhex(key), offset, len(blob)))
+            offset += len(blob)
+    index.sort()
+    header = json.dumps({"pipeline": name, "version": version, "count": len(index), "created": time.time()}).encode()
+    try:
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            f.writelines(ENTRY.pack(*entry) for entry in index)
+            with open(data_path, "rb") as data:
+                while chunk := data.read(1 << 20):
+                    f.write(chunk)
+        os.replace(tmp, path)
+    finally:
+        for leftover in (tmp, data_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    logger.info(f"Wrote {len(index)} precomputed results for '{name}' to {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+    return len(index)
+
+
+class ResultStore:
+    """
+    A read-only, memory-mapped store of precomputed results (see :func:`write_store`).
+    Pages are shared between processes, including pre-forked workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a result store")
+        start = len(MAGIC) + HEADER_LENGTH.size
+        length, = HEADER_LENGTH.unpack(self._mmap[len(MAGIC):start])
+        self.header = json.loads(self._mmap[start:start + length])
+        self.name = self.header["pipeline"]
+        self.version = self.header["version"]
+        self.count = self.header["count"]
+        self._index = start + length
+        self._data = self._index + self.count * ENTRY.size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, digest):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self._index + mid * ENTRY.size
+            found = self._mmap[pos:pos + 20]
+            if found < digest:
+                lo = mid + 1
+            elif found > digest:
+                hi = mid
+            else:
+                return ENTRY.unpack(self._mmap[pos:pos + ENTRY.size])[1:]
+        return None
+
+    def get(self, key):
+        """The result stored for cache ``key``, or ``None``."""
+        entry = self._find(bytes.fromhex(key))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        offset, length = entry
+        start = self._data + offset
+        return pickle.loads(zlib.decompress(self._mmap[start:start + length]))
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "entries": self.count,
+            "bytes": len(self._mmap),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class StoreTier:
+    """
+    Lets a :class:`ResultStore` stand in for the result cache of a
+    :class:`~pyterrier_server._cache.CachedPipeline`, so that stored rows are served without
+    running the pipeline. It is read-only, and results are cut to the top ``k`` if given.
+    """
+
+    make_key = staticmethod(ResultCache.make_key)
+
+    def __init__(self, store, k=None):
+        self.store = store
+        self.k = k
+
+    def get(self, name, key):
+        result = self.store.get(key)
+        if result is not None and self.k is not None:
+            result = result[result["rank"] < self.k] if "rank" in result.columns else result.head(self.k)
+        return result
+
+    def put(self, key, value):
+        pass
+
+
+def store_path(name, info):
+    """Where the store for ``name`` is: its ``store`` option, or ``<name>.store`` in ``PYTERRIER_SERVER_STORE_DIR``."""
+    if info.get("store"):
+        return info["store"]
+    directory = os.environ.get("PYTERRIER_SERVER_STORE_DIR")
+    return os.path.join(directory, f"{name}.store") if directory else None
+
+
+def get_store(name, info):
+    """
+    The precomputed result store for ``name``, opened on first use. ``None`` if there is none,
+    or if it was computed for another version of the function, as its results may be stale.
+    """
+    if "result_store" not in info:
+        store = None
+        path = store_path(name, info)
+        if path and os.path.exists(path):
+            try:
+                store = ResultStore(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not open result store {path} for '{name}': {e}")
+            else:
+                if store.name != name or store.version != info.get("result_version"):
+                    logger.warning(f"Ignoring result store {path}: it was computed for another version of '{name}'")
+                    store = None
+                else:
+                    logger.info(f"Serving {len(store)} precomputed results for '{name}' from {path}")
+        elif info.get("store"):
+            logger.warning(f"Result store {path} for '{name}' does not exist")
+        info["result_store"] = store
+    return info["result_store"]
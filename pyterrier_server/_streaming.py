@@ -0,0 +1,136 @@
+# _streaming.py
+import json
+import logging
+import queue
+import time
+
+import pandas as pd
+import pyterrier as pt
+
+from pyterrier_server._metrics import run_stage
+from pyterrier_server._pushdown import stages
+from pyterrier_server._serialize import serialize
+
+logger = logging.getLogger(__name__)
+
+SSE = "text/event-stream"
+
+_DONE = object()
+
+
+def wants_stream(args, headers, body=None):
+    """
+    Whether a request asked for a server-sent event stream: ``?stream=1``, ``"stream": true``
+    in the body or ``Accept: text/event-stream``.
+    """
+    if args.get("stream", "").lower() in ['1', 'true', 'yes']:
+        return True
+    if isinstance(body, dict) and body.get("stream") is True:
+        return True
+    return SSE in (headers.get("Accept") or "")
+
+
+def sse(event, data):
+    """Format one server-sent event. ``data`` is JSON-encoded unless it already is (``bytes``)."""
+    if isinstance(data, bytes):
+        data = data.decode()
+    else:
+        data = json.dumps(data, default=str)
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def run_staged(pipeline, df, emit, name=None):
+    """
+    Run ``pipeline`` on ``df`` one stage at a time, calling ``emit(event, data)``:
+      - ``documents``: the retrieved documents, as soon as retrieval (and any rank cutoff) has finished
+        and the remaining stages have yet to run,
+      - ``answer`` (for results with a ``qanswer``) or ``result``: the final results,
+      - ``done``: timings in seconds.
+    """
+    parts = stages(pipeline)
+    timings = {}
+    start = time.monotonic()
+    out = df
+    sent_documents = False
+    for i, stage in enumerate(parts):
+        out = run_stage(name, i, stage, out)
+        remaining = parts[i + 1:]
+        if (not sent_documents and remaining and "docno" in out.columns
+                and not isinstance(remaining[0], pt.RankCutoff)):
+            timings["retrieval"] = round(time.monotonic() - start, 4)
+            emit("documents", serialize(out)[0])
+            sent_documents = True
+    timings["total"] = round(time.monotonic() - start, 4)
+    emit("answer" if "qanswer" in out.columns else "result", out)
+    emit("done", {"timings": timings})
+
+
+def stream_pipeline(executor, pipeline, df, project=None, timeout=None, name=None):
+    """
+    Run ``pipeline`` on ``executor`` (see :func:`run_staged`), yielding server-sent events as the
+    stages finish. ``project`` is applied to the final results. Raises
+    :class:`~pyterrier_server._executors.Overloaded` before anything is sent if the pipeline's
+    queue is full; later failures are reported as an ``error`` event.
+    """
+    events = queue.Queue()
+
+    def emit(event, data):
+        if event in ("answer", "result") and isinstance(data, pd.DataFrame):
+            data = serialize(project(data) if project else data)[0]
+        events.put((event, data))
+
+    def run():
+        try:
+            run_staged(pipeline, df, emit, name=name or executor.name)
+        finally:
+            events.put(_DONE)
+
+    deadline = executor.deadline(timeout)
+    future = executor.submit(run, deadline=deadline)
+
+    def generate():
+        while True:
+            wait = None if deadline is None else max(0., deadline - time.monotonic())
+            try:
+                item = events.get(timeout=wait)
+            except queue.Empty:
+                future.cancel()
+                yield sse("error", {"error": "Request did not finish within its deadline"})
+                return
+            if item is _DONE:
+                break
+            yield sse(*item)
+        try:
+            future.result()
+        except Exception as e:
+            logger.exception("Streaming request failed")
+            yield sse("error", {"error": str(e)})
+    return generate()
+
+
+def stream_ai(response_stream):
+    """
+    Translate a streamed OpenAI response into server-sent events:
+      - ``tool``: the name and output of each MCP tool call, as soon as it has finished,
+      - ``delta``: each chunk of generated text,
+      - ``answer``: the full generated text,
+      - ``done``: timings in seconds.
+    """
+    start = time.monotonic()
+    timings = {}
+    try:
+        for event in response_stream:
+            if event.type == "response.output_item.done" and getattr(event.item, "type", None) == "mcp_call":
+                timings.setdefault("first_tool", round(time.monotonic() - start, 4))
+                yield sse("tool", {"name": event.item.name, "output": event.item.output})
+            elif event.type == "response.output_text.delta":
+                timings.setdefault("first_token", round(time.monotonic() - start, 4))
+                yield sse("delta", {"text": event.delta})
+            elif event.type == "response.completed":
+                yield sse("answer", {"output": event.response.output_text})
+    except Exception as e:
+        logger.exception("Streaming /ai request failed")
+        yield sse("error", {"error": str(e)})
+        return
+    timings["total"] = round(time.monotonic() - start, 4)
+    yield sse("done", {"timings": timings})
@@ -0,0 +1,135 @@
+"""Small offline stand-in pipelines used by the tests."""
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyterrier as pt
+
+
+class StandInRetriever(pt.Transformer):
+    """Returns ``num_results`` documents per query, named after the query."""
+    def __init__(self, num_results=10):
+        self.num_results = num_results
+        self.calls = []
+
+    def transform_inputs(self):
+        return [["qid", "query"]]
+
+    def transform_outputs(self, input_columns):
+        return ["qid", "query", "docno", "score", "rank"]
+
+    def transform(self, inp):
+        self.calls.append(len(inp))
+        return pd.DataFrame([
+            {"qid": row.qid, "query": row.query, "docno": f"{row.query}-{i}", "score": float(self.num_results - i), "rank": i}
+            for row in inp.itertuples() for i in range(self.num_results)
+        ], columns=["qid", "query", "docno", "score", "rank"])
+
+
+class StandInShardRetriever(pt.Transformer):
+    """
+    Shard ``shard`` of ``num_shards`` of an index: together, the shards return ``{query}-{i}`` with
+    score ``100 - i``. Queries starting with ``slow`` take ``delay`` seconds.
+    """
+    def __init__(self, shard, num_shards, num_results=10, delay=0.):
+        self.shard = shard
+        self.num_shards = num_shards
+        self.num_results = num_results
+        self.delay = delay
+
+    def transform_inputs(self):
+        return [["qid", "query"]]
+
+    def transform_outputs(self, input_columns):
+        return ["qid", "query", "docno", "score", "rank"]
+
+    def transform(self, inp):
+        if self.delay and inp["query"].str.startswith("slow").any():
+            time.sleep(self.delay)
+        rows = []
+        for row in inp.itertuples():
+            for rank in range(self.num_results):
+                i = self.shard + rank * self.num_shards
+                rows.append({"qid": row.qid, "query": row.query, "docno": f"{row.query}-{i}", "score": 100. - i, "rank": rank})
+        return pd.DataFrame(rows, columns=["qid", "query", "docno", "score", "rank"])
+
+
+class StandInTextLoader(pt.Transformer):
+    """Adds a ``text`` column to each retrieved document."""
+    def transform_inputs(self):
+        return [["qid", "docno"]]
+
+    def transform_outputs(self, input_columns):
+        return list(input_columns) + ["text"]
+
+    def transform(self, inp):
+        self.calls = getattr(self, "calls", 0) + len(inp)
+        return inp.assign(text=[f"text of {d}" for d in inp["docno"]])
+
+    def fuse_rank_cutoff(self, k):
+        # like the real text loaders: a cutoff can be applied before loading text
+        return pt.RankCutoff(k) >> self
+
+
+class StandInReader(pt.Transformer):
+    """Produces one ``qanswer`` per query from its retrieved documents."""
+    def transform_inputs(self):
+        return [["qid", "query", "docno", "text"]]
+
+    def transform_outputs(self, input_columns):
+        return ["qid", "query", "qanswer"]
+
+    def transform(self, inp):
+        rows = []
+        for qid, group in inp.groupby("qid", sort=False):
+            rows.append({"qid": qid, "query": group["query"].iloc[0], "qanswer": " ".join(group["docno"])})
+        return pd.DataFrame(rows, columns=["qid", "query", "qanswer"])
+
+
+class StandInQueryGenerator(pt.Transformer):
+    """Adds a ``querygen`` column to each document, like doc2query; fails on documents whose text is in ``fail_on``."""
+    fail_on = frozenset()
+
+    def transform_inputs(self):
+        return [["docno", "text"]]
+
+    def transform_outputs(self, input_columns):
+        return list(input_columns) + ["querygen"]
+
+    def transform(self, inp):
+        failing = set(inp["text"]) & self.fail_on
+        if failing:
+            raise RuntimeError(f"cannot expand {sorted(failing)}")
+        return inp.assign(querygen=[f"{t} question" for t in inp["text"]])
+
+
+def open_index(path, num_results=10):
+    """Stands in for a constructor of a large artifact, such as an index (e.g. to memoise)."""
+    return StandInRetriever(num_results)
+
+
+FUNCTIONS_YAML = """
+functions:
+  - name: search
+    task: search
+    description: Search for documents about a topic.
+    pipeline: |
+      from tests._pipelines import StandInRetriever, StandInTextLoader
+      p = StandInRetriever() % 3 >> StandInTextLoader()
+
+  - name: rag
+    task: rag
+    description: Answer a question by generating text from retrieved documents.
+    pipeline: |
+      from tests._pipelines import StandInRetriever, StandInTextLoader, StandInReader
+      p = StandInRetriever() % 1 >> StandInTextLoader() >> StandInReader()
+"""
+
+
+def write_functions_yaml(extra="", body=FUNCTIONS_YAML):
+    """Write a functions.yaml for the stand-in pipelines and return its path."""
+    fd, path = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(fd, "w") as f:
+        f.write(body + extra)
+    return path
@@ -0,0 +1,90 @@
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+from pyterrier_server._artifacts import ArtifactRegistry
+from tests._pipelines import write_functions_yaml
+
+BUILT = []
+
+
+class Index:
+    def __init__(self, name):
+        self.name = name
+
+    @classmethod
+    def from_hf(cls, name):
+        BUILT.append((cls, name))
+        return cls(name)
+
+
+class SubIndex(Index):
+    pass
+
+
+class TestArtifactRegistry(unittest.TestCase):
+    def setUp(self):
+        self.module = types.ModuleType("fake_artifacts")
+        self.module.Index = Index
+        self.module.SubIndex = SubIndex
+        self.module.load = lambda name: object()
+        sys.modules["fake_artifacts"] = self.module
+        BUILT.clear()
+
+    def tearDown(self):
+        del sys.modules["fake_artifacts"]
+
+    def test_memoize(self):
+        registry = ArtifactRegistry(["fake_artifacts.load", "fake_artifacts.Index.from_hf", "fake_artifacts.SubIndex.from_hf"])
+        original = self.module.load
+        with registry.patched():
+            self.assertIs(self.module.load("a"), self.module.load("a"))
+            self.assertIsNot(self.module.load("a"), self.module.load("b"))
+            self.assertIs(Index.from_hf("x"), Index.from_hf("x"))
+            self.assertIsInstance(SubIndex.from_hf("x"), SubIndex)
+        self.assertEqual(BUILT, [(Index, "x"), (SubIndex, "x")])
+        self.assertIs(self.module.load, original)
+        self.assertNotIn("from_hf", SubIndex.__dict__)
+        stats = registry.stats()
+        self.assertEqual((stats["artifacts"], stats["reuses"]), (4, 3))
+
+    def test_release(self):
+        registry = ArtifactRegistry(["fake_artifacts.Index.from_hf"])
+        with registry.patched():
+            with registry.owned_by("a"):
+                index = Index.from_hf("x")
+                Index.from_hf("y")
+            with registry.owned_by("b"):
+                Index.from_hf("x")
+            Index.from_hf("z")  # e.g. in the shared section
+        registry.release("a")
+        self.assertEqual(registry.stats()["artifacts"], 2)  # x (still used by b) and z
+        registry.release("b")
+        with registry.patched(), registry.owned_by("a"):
+            self.assertIsNot(Index.from_hf("x"), index)
+            Index.from_hf("z")
+        self.assertEqual(BUILT, [(Index, "x"), (Index, "y"), (Index, "z"), (Index, "x")])
+
+    def test_shared_section(self):
+        from pyterrier_server._loader import load_pipeline
+        path = write_functions_yaml(body="""
+shared: |
+  from tests._pipelines import StandInRetriever
+  retriever = StandInRetriever()
+functions:
+  - name: a
+    pipeline: |
+      p = retriever % 1
+  - name: b
+    pipeline: |
+      p = retriever % 2
+""")
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PIPELINE": path}):
+            pipelines = load_pipeline()
+        self.assertIs(pipelines["a"]["pipeline"][0], pipelines["b"]["pipeline"][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+import pandas as pd
+import pyterrier as pt
+
+from pyterrier_server._batching import MicroBatcher, make_batcher
+
+
+def _retriever(calls):
+    def _transform(df):
+        calls.append(len(df))
+        return pd.DataFrame([
+            {"qid": row.qid, "query": row.query, "docno": f"{row.query}-{i}", "score": float(-i), "rank": i}
+            for row in df.itertuples() for i in range(2)
+        ])
+    return pt.apply.generic(_transform)
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_concurrent_requests_share_a_batch(self):
+        calls = []
+        batcher = MicroBatcher(_retriever(calls), max_batch_size=8, max_wait_ms=200)
+        results = {}
+
+        def worker(i):
+            results[i] = batcher(pd.DataFrame([{"qid": "1", "query": f"q{i}"}]))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertLess(len(calls), 8)
+        self.assertEqual(sum(calls), 8)
+        for i, res in results.items():
+            self.assertEqual(list(res["qid"]), ["1", "1"])
+            self.assertEqual(list(res["docno"]), [f"q{i}-0", f"q{i}-1"])
+
+    def test_failure_is_isolated(self):
+        def _transform(df):
+            if (df["query"] == "bad").any():
+                raise ValueError("bad query")
+            return df.assign(docno="d", score=1.0, rank=0)
+        batcher = MicroBatcher(pt.apply.generic(_transform), max_batch_size=2, max_wait_ms=200)
+        good = batcher.submit(pd.DataFrame([{"qid": "1", "query": "good"}]))
+        bad = batcher.submit(pd.DataFrame([{"qid": "1", "query": "bad"}]))
+        self.assertEqual(list(good.result()["query"]), ["good"])
+        with self.assertRaises(ValueError):
+            bad.result()
+
+    def test_make_batcher(self):
+        self.assertIsNone(make_batcher(None, None))
+        batcher = make_batcher(None, {"max_batch_size": 4, "max_wait_ms": 1})
+        self.assertEqual(batcher.max_batch_size, 4)
+        self.assertIsInstance(make_batcher(None, True), MicroBatcher)
+        with self.assertRaises(TypeError):
+            make_batcher(None, "yes")
+
+
+if __name__ == "__main__":
+    unittest.main()
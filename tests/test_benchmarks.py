@@ -0,0 +1,43 @@
+import unittest
+
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.run import compare, percentile, summarise
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3.], 99), 3.)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarise(self):
+        summary = summarise([0.01] * 10, errors=1, seconds=0.5, items_per_request=100)
+        self.assertEqual(summary["throughput"], 20.)
+        self.assertEqual(summary["items_per_second"], 2000.)
+        self.assertEqual(summary["p99_ms"], 10.)
+
+    def test_compare(self):
+        baseline = [{"mode": "asgi", "target": "search", "concurrency": 8, "throughput": 100., "p95_ms": 50.}]
+        ok = [{"mode": "asgi", "target": "search", "concurrency": 8, "throughput": 95., "p95_ms": 54.}]
+        slow = [{"mode": "asgi", "target": "search", "concurrency": 8, "throughput": 80., "p95_ms": 70.}]
+        self.assertEqual(compare(ok, baseline, 0.1), [])
+        self.assertEqual(len(compare(slow, baseline, 0.1)), 2)
+
+    def test_fake_openai(self):
+        server = FakeOpenAIServer(delay=0).start()
+        try:
+            client = OpenAI(api_key="bench", base_url=server.base_url)
+            resp = client.responses.create(model="bench", input=[{"role": "user", "content": "goldfish"}])
+            self.assertEqual(resp.output_text, "An answer to goldfish")
+            self.assertEqual(resp.output[0].__class__.__name__, "McpCall")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+from pyterrier_server._cache import CachedPipeline, ResultCache
+from tests._pipelines import StandInRetriever
+
+
+class TestResultCache(unittest.TestCase):
+    def test_cached_pipeline(self):
+        retriever = StandInRetriever(num_results=2)
+        cached = CachedPipeline(retriever, ResultCache(max_size=10), "search")
+        first = cached(pd.DataFrame([{"qid": "1", "query": "a"}, {"qid": "2", "query": "b"}]))
+        second = cached(pd.DataFrame([{"qid": "7", "query": " a  "}, {"qid": "8", "query": "c"}]))
+        self.assertEqual(retriever.calls, [2, 1])
+        self.assertEqual(list(first["docno"]), ["a-0", "a-1", "b-0", "b-1"])
+        self.assertEqual(list(second["qid"]), ["7", "7", "8", "8"])
+        self.assertEqual(list(second["docno"]), ["a-0", "a-1", "c-0", "c-1"])
+        stats = cached.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 3))
+
+    def test_lru_and_ttl(self):
+        cache = ResultCache(max_size=2, ttl=0.05)
+        for k in ["a", "b", "c"]:
+            cache.put(k, k)
+        self.assertIsNone(cache.get("p", "a"))
+        self.assertEqual(cache.get("p", "c"), "c")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("p", "c"))
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "cache.sqlite")
+            ResultCache(max_size=0, path=path).put("k", pd.DataFrame([{"docno": "d"}]))
+            value = ResultCache(max_size=0, path=path).get("p", "k")
+            self.assertEqual(list(value["docno"]), ["d"])
+
+
+if __name__ == "__main__":
+    unittest.main()
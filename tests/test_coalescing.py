@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+
+from tests._pipelines import write_functions_yaml
+
+SLOW = """
+  - name: popular
+    cache: false
+    pipeline: |
+      from tests._pipelines import StandInShardRetriever
+      p = StandInShardRetriever(0, 1, num_results=2, delay=0.5)
+"""
+
+
+class GatedPipeline:
+    """Returns one row per input row once ``gate`` is set; fails if ``error`` is set."""
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = []
+        self.error = None
+
+    def __call__(self, df):
+        self.calls.append(list(df["query"]))
+        self.gate.wait(5)
+        if self.error:
+            raise self.error
+        return df.assign(docno=[f"{q}-0" for q in df["query"]], score=1., rank=0)
+
+
+class TestCoalescingPipeline(unittest.TestCase):
+    def run_concurrently(self, coalesced, frames):
+        with ThreadPoolExecutor(len(frames)) as pool:
+            futures = [pool.submit(coalesced, frame) for frame in frames]
+            # all calls are waiting on the first one
+            for _ in range(100):
+                if coalesced.coalescer.stats()["coalesced"] >= len(frames) - 1:
+                    break
+                threading.Event().wait(0.01)
+            coalesced.pipeline.gate.set()
+            return [f.exception() or f.result() for f in futures]
+
+    def test_coalesce(self):
+        from pyterrier_server._coalescing import Coalescer, CoalescingPipeline
+        coalesced = CoalescingPipeline(GatedPipeline(), Coalescer(), "search")
+        frames = [pd.DataFrame([{"qid": str(i), "query": "popular  query"}]) for i in range(4)]
+        results = self.run_concurrently(coalesced, frames)
+        self.assertEqual(coalesced.pipeline.calls, [["popular  query"]])
+        self.assertEqual([list(r["qid"]) for r in results], [["0"], ["1"], ["2"], ["3"]])
+        self.assertEqual(coalesced.coalescer.stats()["pipelines"]["search"], {"executed": 1, "coalesced": 3})
+        self.assertEqual(coalesced.coalescer.stats()["inflight"], 0)
+
+    def test_mixed(self):
+        from pyterrier_server._coalescing import Coalescer, CoalescingPipeline
+        coalesced = CoalescingPipeline(GatedPipeline(), Coalescer(), "search")
+        frames = [pd.DataFrame([{"qid": "1", "query": "a"}]),
+                  pd.DataFrame([{"qid": "1", "query": "a"}, {"qid": "2", "query": "b"}])]
+        results = self.run_concurrently(coalesced, frames)
+        self.assertEqual(sorted(q for call in coalesced.pipeline.calls for q in call), ["a", "b"])
+        self.assertEqual(list(results[1]["docno"]), ["a-0", "b-0"])
+
+    def test_error(self):
+        from pyterrier_server._coalescing import Coalescer, CoalescingPipeline
+        coalesced = CoalescingPipeline(GatedPipeline(), Coalescer(), "search")
+        coalesced.pipeline.error = RuntimeError("no index")
+        frames = [pd.DataFrame([{"qid": "1", "query": "a"}]) for _ in range(3)]
+        errors = self.run_concurrently(coalesced, frames)
+        self.assertEqual([str(e) for e in errors], ["no index"] * 3)
+        self.assertEqual(len(coalesced.pipeline.calls), 1)
+        # a later call runs again
+        coalesced.pipeline.error = None
+        self.assertEqual(list(coalesced(frames[0])["docno"]), ["a-0"])
+
+
+class TestCoalescingEndpoints(unittest.TestCase):
+    def popular(self):
+        from pyterrier_server._coalescing import default_coalescer
+        return default_coalescer().stats()["pipelines"].get("popular", {"executed": 0, "coalesced": 0})
+
+    def test_flask(self):
+        from tests.test_server import make_app
+        app = make_app(SLOW)
+        before = self.popular()
+
+        def search(i):
+            return app.test_client().post("/pipeline/popular", json={"qid": str(i), "query": "slow popular"})
+        with ThreadPoolExecutor(4) as pool:
+            responses = list(pool.map(search, range(4)))
+        self.assertEqual([[r["qid"] for r in res.json] for res in responses], [[str(i)] * 2 for i in range(4)])
+        after = self.popular()
+        self.assertEqual(after["executed"] - before["executed"], 1)
+        self.assertEqual(after["coalesced"] - before["coalesced"], 3)
+        self.assertIn('pyterrier_server_coalesced_rows_total{pipeline="popular"}', app.test_client().get("/metrics").data.decode())
+
+    def test_mcp(self):
+        from fastmcp import Client
+
+        from pyterrier_server._loader import load_pipeline
+        from pyterrier_server._mcp_server import build_mcp_server
+        path = write_functions_yaml(SLOW)
+        self.addCleanup(os.remove, path)
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PIPELINE": path}):
+            pipelines = load_pipeline()
+        mcp = build_mcp_server(pipelines, metrics=False)
+        before = self.popular()
+
+        async def calls():
+            async with Client(mcp) as client:
+                return await asyncio.gather(*[
+                    client.call_tool("popular", {"qid": str(i), "query": "slow from agents"}) for i in range(3)])
+        results = asyncio.run(calls())
+        self.assertEqual([len(r.structured_content["result"]) for r in results], [2, 2, 2])
+        after = self.popular()
+        self.assertEqual(after["executed"] - before["executed"], 1)
+        self.assertEqual(after["coalesced"] - before["coalesced"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
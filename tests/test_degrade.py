@@ -0,0 +1,113 @@
+import os
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+DEGRADED = """
+  - name: answer
+    cache: false
+    degrade:
+      latency_ms: 1
+      tiers:
+        - name: retrieval
+          prefix: 2
+    pipeline: |
+      from tests._pipelines import StandInRetriever, StandInTextLoader, StandInReader
+      p = StandInRetriever() % 2 >> StandInTextLoader() >> StandInReader()
+"""
+
+
+class TestDegradationPolicy(unittest.TestCase):
+    def policy(self, **config):
+        from pyterrier_server._degrade import DegradationPolicy
+        config.setdefault("tiers", [{"name": "shallow", "k": 10}, {"name": "ids", "k": 5, "fields": "docno,score"}])
+        return DegradationPolicy("search", config, interval=0)
+
+    def test_queue(self):
+        policy = self.policy(queue=4)
+        executor = SimpleNamespace(queued=0)
+        self.assertEqual(policy.select(executor)["name"], "full")
+        executor.queued = 4
+        self.assertEqual([policy.select(executor)["name"] for _ in range(3)], ["shallow", "ids", "ids"])
+        # held while between the thresholds, relaxed below half of the queue
+        executor.queued = 3
+        self.assertEqual(policy.select(executor)["name"], "ids")
+        executor.queued = 2
+        self.assertEqual([policy.select(executor)["name"] for _ in range(3)], ["shallow", "full", "full"])
+        stats = policy.stats()
+        self.assertEqual((stats["tier"], stats["changes"]), ("full", 4))
+        self.assertEqual(set(stats["seconds"]), {"full", "shallow", "ids"})
+
+    def test_latency(self):
+        from pyterrier_server._degrade import MIN_SAMPLES
+        policy = self.policy(latency_ms=100)
+        executor = SimpleNamespace(queued=0)
+        tier = policy.select(executor)
+        for _ in range(MIN_SAMPLES):
+            policy.observe(tier, 0.2)
+        self.assertEqual(policy.select(executor)["name"], "shallow")
+        # latencies from before the change do not count at the new tier
+        self.assertIsNone(policy.stats()["recent_latency_ms"])
+        self.assertEqual(policy.select(executor)["name"], "full")
+
+    def test_interval(self):
+        from pyterrier_server._degrade import DegradationPolicy
+        policy = DegradationPolicy("search", {"queue": 1, "tiers": [{"k": 10}]}, interval=60)
+        self.assertEqual(policy.select(SimpleNamespace(queued=5))["name"], "full")
+
+    def test_options(self):
+        from pyterrier_server._degrade import DegradationPolicy
+        policy = self.policy(queue=1)
+        shallow, ids = policy.tiers[1:]
+        self.assertEqual(DegradationPolicy.options(shallow), {"k": 10, "fields": None, "prefix": None})
+        self.assertEqual(DegradationPolicy.options(shallow, k=3)["k"], 3)
+        self.assertEqual(DegradationPolicy.options(ids, k=50, fields=["text"]), {"k": 5, "fields": ["text"], "prefix": None})
+        self.assertEqual(ids["fields"], ["docno", "score"])
+
+    def test_invalid(self):
+        from pyterrier_server._degrade import DegradationPolicy, get_policy
+        with self.assertRaises(ValueError):
+            DegradationPolicy("search", {"tiers": [{"k": 10}]})
+        with self.assertRaises(ValueError):
+            DegradationPolicy("search", {"queue": 1, "tiers": [{"depth": 10}]})
+        with self.assertRaises(TypeError):
+            DegradationPolicy("search", ["queue"])
+        self.assertIsNone(get_policy("search", {"degrade": "fast"}))
+        self.assertIsNone(get_policy("search", {"degrade": {"queue": 1}}))
+        self.assertIsNone(get_policy("search", {}))
+
+
+class TestDegradedEndpoints(unittest.TestCase):
+    def test_flask(self):
+        from tests.test_server import make_app
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_DEGRADE_INTERVAL": "0"}):
+            app = make_app(DEGRADED)
+        client = app.test_client()
+        self.assertNotIn("X-Pipeline-Tier", client.post("/pipeline/search", json={"query": "a"}).headers)
+
+        policy = app.config["PIPELINES"]["answer"]["degradation"]
+        tier = policy.tiers[0]
+        for _ in range(20):
+            policy.observe(tier, 0.01)
+        res = client.post("/pipeline/answer", json={"query": "degraded"})
+        self.assertEqual(res.headers["X-Pipeline-Tier"], "retrieval")
+        # the retrieval stages only: documents, without an answer
+        self.assertEqual([r["docno"] for r in res.json], ["degraded-0", "degraded-1"])
+        self.assertNotIn("qanswer", res.json[0])
+
+        self.assertEqual(client.get("/config").json["degradation"]["answer"]["tier"], "retrieval")
+        text = client.get("/metrics").data.decode()
+        self.assertIn('pyterrier_server_degradation_level{pipeline="answer"} 1', text)
+        self.assertIn('pyterrier_server_degradation_seconds_total{pipeline="answer",tier="retrieval"}', text)
+
+        # back to the full pipeline once fast enough
+        policy.latency = 60.
+        time.sleep(0.01)
+        res = client.post("/pipeline/answer", json={"query": "degraded"})
+        self.assertEqual(res.headers["X-Pipeline-Tier"], "full")
+        self.assertIn("qanswer", res.json[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+
+from pyterrier_server._executors import (
+    DeadlineExceeded,
+    Overloaded,
+    PipelineExecutor,
+    make_executor,
+)
+
+
+class TestPipelineExecutor(unittest.TestCase):
+    def test_rejects_when_full(self):
+        executor = PipelineExecutor("slow", max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = executor.submit(release.wait)
+        queued = executor.submit(lambda: "queued")
+        with self.assertRaises(Overloaded) as ctx:
+            executor.submit(lambda: "rejected")
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        release.set()
+        running.result()
+        self.assertEqual(queued.result(), "queued")
+        self.assertEqual(executor.stats()["rejected"], 1)
+        self.assertEqual(executor.depth, 0)
+
+    def test_deadline(self):
+        executor = PipelineExecutor("slow", max_workers=1, max_queue=4)
+        release = threading.Event()
+        executor.submit(release.wait)
+        with self.assertRaises(DeadlineExceeded):
+            executor.run(lambda: "late", timeout=0.05)
+        release.set()
+        # the timed-out request was cancelled while queued, so it never runs
+        time.sleep(0.05)
+        self.assertEqual(executor.stats()["queued"], 0)
+        self.assertEqual(executor.run(lambda: "ok", timeout=1), "ok")
+
+    def test_expired_once(self):
+        executor = PipelineExecutor("slow", max_workers=1, max_queue=4)
+        started, release = threading.Event(), threading.Event()
+        executor.run(lambda: time.sleep(0.01))
+        average = executor._avg_time
+        # given up on while running: counted once, and its time is not an estimate of how long requests take
+        running = executor.submit(lambda: started.set() or release.wait(), deadline=time.monotonic() + 5)
+        started.wait()
+        executor.expire(running)
+        # expired while queued, then given up on
+        queued = executor.submit(lambda: "late", deadline=time.monotonic())
+        release.set()
+        with self.assertRaises(DeadlineExceeded):
+            queued.result()
+        executor.expire(queued)
+        running.result()
+        self.assertEqual(executor.stats()["expired"], 2)
+        self.assertEqual(executor._avg_time, average)
+
+    def test_config(self):
+        executor = make_executor("p", {"max_workers": 2, "max_queue": 3, "timeout": 10})
+        self.assertEqual((executor.max_workers, executor.max_queue, executor.timeout), (2, 3, 10.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import unittest
+import urllib.request
+from unittest import mock
+
+import pandas as pd
+
+from tests._pipelines import write_functions_yaml
+
+SHARD_YAML = """
+functions:
+  - name: search
+    pipeline: |
+      from tests._pipelines import StandInShardRetriever
+      p = StandInShardRetriever({shard}, 2, delay={delay})
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestMerge(unittest.TestCase):
+    def test_merge(self):
+        from pyterrier_server._federation import merge
+        inp = pd.DataFrame([{"qid": "2", "query": "b"}, {"qid": "1", "query": "a"}])
+        shard0 = {"1": [{"qid": "1", "docno": "a-0", "score": 9.}, {"qid": "1", "docno": "x", "score": 1.}],
+                  "2": [{"qid": "2", "docno": "b-0", "score": 5.}]}
+        shard1 = {"1": [{"qid": "1", "docno": "a-1", "score": 7.}, {"qid": "1", "docno": "x", "score": 3.}]}
+        merged = merge(inp, [shard0, shard1], k=3)
+        self.assertEqual(list(merged["qid"]), ["2", "1", "1", "1"])
+        self.assertEqual(list(merged["docno"]), ["b-0", "a-0", "a-1", "x"])
+        self.assertEqual(list(merged["rank"]), [0, 0, 1, 2])
+        self.assertEqual(list(merged["query"]), ["b", "a", "a", "a"])
+        self.assertEqual(merged["score"].iloc[-1], 3.)
+
+    def test_invalid_shards(self):
+        from pyterrier_server._federation import parse_shards
+        self.assertEqual(parse_shards(["http://a", {"url": "http://b", "pipeline": "bm25"}], "search"),
+                         [("http://a", "search"), ("http://b", "bm25")])
+        with self.assertRaises(ValueError):
+            parse_shards([], "search")
+        with self.assertRaises(ValueError):
+            parse_shards([{"pipeline": "bm25"}], "search")
+
+    def test_connections_per_process(self):
+        from pyterrier_server._federation import Federation
+        federation = Federation(["http://a", "http://b"], name="search")
+        session, pool = federation._connections()
+        # shared with the rank-cutoff variants, but not with forked processes
+        self.assertEqual(federation.fuse_rank_cutoff(5)._connections(), (session, pool))
+        with mock.patch("os.getpid", return_value=os.getpid() + 1):
+            forked, forked_pool = federation._connections()
+        self.assertIsNot(forked, session)
+        self.assertIsNot(forked_pool, pool)
+
+
+class TestFederation(unittest.TestCase):
+    """A front server federating two shard servers, each running in its own process."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.processes = []
+        cls.urls = []
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for shard in range(2):
+            port = free_port()
+            env = {**os.environ, "PYTERRIER_SERVER_PIPELINE": write_functions_yaml(body=SHARD_YAML.format(shard=shard, delay=3 * shard)),
+                   "PYTERRIER_SERVER_CACHE_SIZE": "0", "PYTERRIER_MCP_URL": "", "OPENAI_API_KEY": "test", "PYTHONPATH": root}
+            cls.processes.append(subprocess.Popen(
+                [sys.executable, "-m", "pyterrier_server._cli", "--host", "127.0.0.1", "--port", str(port)],
+                env=env, cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            cls.urls.append(f"http://127.0.0.1:{port}")
+        deadline = time.time() + 60
+        for url in cls.urls:
+            while True:
+                try:
+                    with urllib.request.urlopen(f"{url}/ready", timeout=1) as res:
+                        if json.loads(res.read())["ready"]:
+                            break
+                except OSError:
+                    pass
+                if time.time() > deadline:
+                    cls.tearDownClass()
+                    raise unittest.SkipTest("shard servers did not start")
+                time.sleep(0.2)
+
+    @classmethod
+    def tearDownClass(cls):
+        for process in cls.processes:
+            process.terminate()
+        for process in cls.processes:
+            process.wait(timeout=30)
+
+    def make_app(self, extra_shards=()):
+        from pyterrier_server._loader import load_pipeline
+        from pyterrier_server._server import create_app
+        shards = "".join(f"\n      - url: {url}\n        pipeline: search" for url in [*self.urls, *extra_shards])
+        body = f"""
+functions:
+  - name: search
+    shard_timeout: 1
+    shards:{shards}
+    pipeline: |
+      from tests._pipelines import StandInTextLoader
+      p = shards >> StandInTextLoader()
+"""
+        env = {"PYTERRIER_SERVER_PIPELINE": write_functions_yaml(body=body), "OPENAI_API_KEY": "test"}
+        with mock.patch.dict(os.environ, env):
+            os.environ.pop("PYTERRIER_MCP_URL", None)
+            return create_app(load_pipeline())
+
+    def test_scatter_gather(self):
+        app = self.make_app()
+        client = app.test_client()
+        results = client.post("/pipeline/search?k=4", json={"query": "goldfish"}).get_json()
+        self.assertEqual([r["docno"] for r in results], ["goldfish-0", "goldfish-1", "goldfish-2", "goldfish-3"])
+        self.assertEqual([r["rank"] for r in results], [0, 1, 2, 3])
+        self.assertEqual(results[0]["text"], "text of goldfish-0")  # the downstream stage ran locally
+
+        lines = client.post("/pipeline/search/batch", data='{"qid": "a", "query": "cats"}\n{"qid": "b", "query": "dogs"}\n')
+        lines = [json.loads(line) for line in lines.get_data(as_text=True).splitlines()]
+        self.assertEqual([line["qid"] for line in lines], ["a", "b"])
+        self.assertEqual(len(lines[1]["results"]), 20)
+
+        stats = client.get("/config").get_json()["federation"]["search"]
+        self.assertEqual([shard["failures"] for shard in stats["shards"]], [0, 0])
+        self.assertEqual(stats["partial"], 0)
+
+    def test_partial_results(self):
+        app = self.make_app(extra_shards=[f"http://127.0.0.1:{free_port()}"])  # nothing listens there
+        client = app.test_client()
+        start = time.time()
+        results = client.post("/pipeline/search", json={"query": "slow goldfish"}).get_json()
+        self.assertLess(time.time() - start, 2.5)
+        # only the first shard answered in time
+        self.assertEqual([r["docno"] for r in results][:3], ["slow goldfish-0", "slow goldfish-2", "slow goldfish-4"])
+        stats = client.get("/config").get_json()["federation"]["search"]
+        self.assertEqual(stats["partial"], 1)
+        self.assertEqual(stats["shards"][1]["timeouts"], 1)
+        self.assertEqual(stats["shards"][2]["failures"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
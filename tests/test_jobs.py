@@ -0,0 +1,111 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from tests._pipelines import StandInQueryGenerator
+from tests.test_server import make_app
+
+EXPANSION_YAML = """
+  - name: expand
+    task: doc2query
+    pipeline: |
+      from tests._pipelines import StandInQueryGenerator
+      p = StandInQueryGenerator()
+"""
+
+
+def collection(n, texts=None):
+    lines = [json.dumps({"docno": f"d{i}", "text": (texts or {}).get(i, f"doc {i}")}) for i in range(n)]
+    return "\n".join(lines) + "\n"
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_JOBS_DIR": self.dir}):
+            self.app = make_app(EXPANSION_YAML)
+        self.client = self.app.test_client()
+        self.jobs = self.app.config["JOBS"]
+        StandInQueryGenerator.fail_on = set()
+
+    def wait(self, job_id):
+        for _ in range(200):
+            job = self.client.get(f"/jobs/{job_id}").get_json()
+            if job["status"] in ("completed", "failed", "cancelled"):
+                return job
+            time.sleep(0.02)
+        self.fail(f"job {job_id} did not finish")
+
+    def results(self, job_id):
+        res = self.client.get(f"/jobs/{job_id}/results")
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        return [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+
+    def test_document_job(self):
+        res = self.client.post("/pipeline/expand/jobs?chunk_size=7", data=collection(20) + "\nnot json\n[1, 2]\n")
+        self.assertEqual(res.status_code, 202)
+        job_id = res.get_json()["id"]
+        self.assertEqual(res.headers["Location"], f"/jobs/{job_id}")
+        job = self.wait(job_id)
+        self.assertEqual((job["status"], job["processed"], job["errors"], job["progress"]), ("completed", 22, 2, 1.))
+        lines = self.results(job_id)
+        self.assertEqual([line.get("docno") for line in lines[:20]], [f"d{i}" for i in range(20)])
+        self.assertEqual(lines[3]["results"][0]["querygen"], "doc 3 question")
+        self.assertEqual(lines[20]["line"], 22)
+        self.assertEqual(lines[21], {"line": 23, "error": "Invalid JSON: not a JSON object"})
+        self.assertIn(job_id, [j["id"] for j in self.client.get("/jobs").get_json()["jobs"]])
+
+    def test_duplicate_ids(self):
+        data = "\n".join(json.dumps({"docno": "d", "text": text}) for text in ["one", "two", "three"]) + "\n"
+        job_id = self.client.post("/pipeline/expand/jobs?chunk_size=2", data=data).get_json()["id"]
+        self.assertEqual(self.wait(job_id)["processed"], 3)
+        lines = self.results(job_id)
+        self.assertEqual([line["docno"] for line in lines], ["d", "d", "d"])
+        self.assertEqual([line["results"][0]["querygen"] for line in lines], ["one question", "two question", "three question"])
+        self.assertEqual({line["results"][0]["docno"] for line in lines}, {"d"})
+
+    def test_resume_from_checkpoint(self):
+        StandInQueryGenerator.fail_on = {"boom"}
+        job_id = self.client.post("/pipeline/expand/jobs?chunk_size=5", data=collection(12, {7: "boom"})).get_json()["id"]
+        job = self.wait(job_id)
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("boom", job["error"])
+        self.assertEqual(job["checkpoint"]["line"], 5)
+        # as if the process crashed while writing the failed chunk's results
+        with open(self.jobs.path(job_id, "output.jsonl"), "ab") as f:
+            f.write(b'{"docno": "d5", "resu')
+
+        StandInQueryGenerator.fail_on = set()
+        self.assertEqual(self.client.post(f"/jobs/{job_id}/resume").status_code, 202)
+        job = self.wait(job_id)
+        self.assertEqual((job["status"], job["processed"]), ("completed", 12))
+        self.assertEqual([line["docno"] for line in self.results(job_id)], [f"d{i}" for i in range(12)])
+
+    def test_resume_after_restart(self):
+        # a job left running by a process that died is picked up by the next one
+        job = self.jobs.submit("expand", io.BytesIO(collection(3).encode()), 2)
+        self.wait(job["id"])
+        state = self.jobs.read(job["id"])
+        state.update(status="running", processed=0, checkpoint={"line": 0, "input_offset": 0, "output_offset": 0})
+        self.jobs._write(state)
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_JOBS_DIR": self.dir}):
+            client = make_app(EXPANSION_YAML).test_client()
+        client.get("/healthz")
+        self.assertEqual(self.wait(job["id"])["status"], "completed")
+        self.assertEqual(len(self.results(job["id"])), 3)
+
+    def test_cancel_and_unknown(self):
+        self.assertEqual(self.client.get("/jobs/nope").status_code, 404)
+        self.assertEqual(self.client.get("/jobs/../etc/results").status_code, 404)
+        self.assertEqual(self.client.post("/pipeline/missing/jobs", data="{}").status_code, 404)
+        job_id = self.client.post("/pipeline/expand/jobs", data=collection(2)).get_json()["id"]
+        self.wait(job_id)
+        self.assertEqual(self.client.delete(f"/jobs/{job_id}").get_json()["status"], "completed")
+
+
+if __name__ == "__main__":
+    unittest.main()
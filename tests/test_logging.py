@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import queue
+import time
+import unittest
+from unittest import mock
+
+from tests.test_server import make_app
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        time.sleep(0.05)
+        self.messages.append(self.format(record))
+
+
+class TestQueueLogging(unittest.TestCase):
+    def test_io_happens_in_the_background(self):
+        from logging.handlers import QueueListener
+
+        from pyterrier_server._logging import DroppingQueueHandler
+        slow = SlowHandler()
+        handler = DroppingQueueHandler(queue.Queue(3))
+        listener = QueueListener(handler.queue, slow)
+        logger = logging.getLogger("tests.queue_logging")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        try:
+            start = time.perf_counter()
+            for i in range(10):
+                logger.info(f"message {i}")
+            # neither waits for the slow handler nor blocks on the full queue
+            self.assertLess(time.perf_counter() - start, 0.05)
+            self.assertEqual(handler.dropped, 7)
+            listener.start()
+            listener.stop()
+            self.assertEqual(slow.messages, ["message 0", "message 1", "message 2"])
+        finally:
+            logger.removeHandler(handler)
+
+    def test_warnings_are_not_dropped(self):
+        from pyterrier_server._logging import DroppingQueueHandler
+        slow = SlowHandler()
+        handler = DroppingQueueHandler(queue.Queue(1), [slow])
+        logger = logging.getLogger("tests.queue_logging_warnings")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            logger.warning("queued")
+            logger.warning("written")
+            logger.error("also written")
+            # the queue is full: warnings and errors are written in the logging thread instead
+            self.assertEqual(slow.messages, ["written", "also written"])
+            self.assertEqual((handler.dropped, handler.synchronous), (0, 2))
+        finally:
+            logger.removeHandler(handler)
+
+    def test_json_formatter(self):
+        from pyterrier_server._logging import JsonFormatter
+        record = logging.LogRecord("pyterrier_server.access", logging.INFO, __file__, 1, "ignored", None, None)
+        record.fields = {"path": "/x", "status": 200}
+        self.assertEqual(json.loads(JsonFormatter().format(record))["status"], 200)
+        record = logging.LogRecord("x", logging.INFO, __file__, 1, "hello %s", ("you",), None)
+        self.assertEqual(json.loads(JsonFormatter().format(record))["msg"], "hello you")
+
+
+class TestAccessLog(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = make_app().test_client()
+
+    def test_access_record(self):
+        with self.assertLogs("pyterrier_server.access", level="INFO") as logs:
+            self.client.post("/pipeline/search", json={"query": "goldfish"})
+        record = logs.records[-1].fields
+        self.assertEqual((record["method"], record["path"], record["status"], record["pipeline"]),
+                         ("POST", "/pipeline/search", 200, "search"))
+        self.assertGreater(record["bytes_out"], 0)
+        self.assertGreater(record["bytes_in"], 0)
+        self.assertGreaterEqual(record["ms"], 0)
+        self.assertEqual(json.loads(logs.records[-1].getMessage()), record)
+
+    def test_sampling(self):
+        logger = logging.getLogger("pyterrier_server.access")
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_ACCESS_LOG_RATE": "0"}), \
+                mock.patch.object(logger, "info") as info:
+            self.client.get("/healthz")
+        info.assert_not_called()
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_ACCESS_LOG_RATE": "0.5"}), \
+                mock.patch.object(logger, "info") as info:
+            for _ in range(200):
+                self.client.get("/healthz")
+        self.assertTrue(50 < info.call_count < 150)
+
+    def test_payload_sampling(self):
+        from pyterrier_server._logging import sample_payload
+        self.assertFalse(any(sample_payload() for _ in range(100)))
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_LOG_PAYLOAD_RATE": "1"}):
+            self.assertTrue(sample_payload())
+
+
+if __name__ == "__main__":
+    unittest.main()
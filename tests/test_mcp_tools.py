@@ -0,0 +1,113 @@
+import asyncio
+import inspect
+import os
+import unittest
+from unittest import mock
+
+from tests._pipelines import write_functions_yaml
+
+QIDS = """
+  - name: lookup
+    properties:
+      - phrase: qid
+        type: str
+      - phrase: query
+        type: str
+    pipeline: |
+      from tests._pipelines import StandInRetriever
+      p = StandInRetriever(num_results=2)
+
+  - name: topic
+    properties:
+      - phrase: query
+        type: str
+    pipeline: |
+      from tests._pipelines import StandInRetriever
+      p = StandInRetriever(num_results=2)
+"""
+
+
+class TestMCPTools(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from pyterrier_server._loader import load_pipeline
+        from pyterrier_server._mcp_server import build_mcp_server
+        cls.path = write_functions_yaml(QIDS)
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PIPELINE": cls.path}):
+            cls.pipelines = load_pipeline()
+        cls.mcp = build_mcp_server(cls.pipelines, metrics=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def call(self, tool, arguments, raise_on_error=True):
+        from fastmcp import Client
+
+        async def _call():
+            async with Client(self.mcp) as client:
+                return await client.call_tool(tool, arguments, raise_on_error=raise_on_error)
+        return asyncio.run(_call())
+
+    def test_async(self):
+        from pyterrier_server._mcp_server import wrap_batch, wrap_pipeline
+        schema = [{"phrase": "query", "type": str}]
+        self.assertTrue(inspect.iscoroutinefunction(wrap_pipeline(lambda df: df, schema, "list[dict]")))
+        self.assertTrue(inspect.iscoroutinefunction(wrap_batch(lambda df: df, schema)))
+
+    def test_tool(self):
+        result = self.call("search", {"qid": "1", "query": "chemical reactions", "fields": ["docno"]})
+        self.assertEqual([r["docno"] for r in result.structured_content["result"]],
+                         ["chemical reactions-0", "chemical reactions-1", "chemical reactions-2"])
+
+    def test_validation(self):
+        # numbers are cast to strings, as ids often are numbers
+        result = self.call("lookup", {"qid": 7, "query": "a"})
+        self.assertEqual({r["qid"] for r in result.structured_content["result"]}, {"7"})
+        result = self.call("lookup", {"qid": "7", "query": ["not", "a", "string"]}, raise_on_error=False)
+        self.assertTrue(result.is_error)
+
+    def test_invalid_depth(self):
+        self.assertTrue(self.call("search", {"qid": "1", "query": "a", "k": 0}, raise_on_error=False).is_error)
+        self.assertTrue(self.call("topic_batch", {"inputs": [{"query": "a"}], "limit": 0}, raise_on_error=False).is_error)
+
+    def test_profile(self):
+        arguments = {"qid": "1", "query": "a", "profile": True}
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PROFILING": "false", "PYTERRIER_SERVER_ADMIN_TOKEN": "secret"}):
+            self.assertTrue(self.call("search", arguments, raise_on_error=False).is_error)
+            request = mock.Mock(headers={"X-Admin-Token": "secret"})
+            with mock.patch("pyterrier_server._mcp_server.get_http_request", return_value=request):
+                result = self.call("search", arguments).structured_content["result"]
+        self.assertIn("profile", result)
+        self.assertEqual(len(result["results"]), 3)
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PROFILING": "true"}):
+            self.assertIn("profile", self.call("search", arguments).structured_content["result"])
+
+    def test_batch(self):
+        before = list(self.pipelines["lookup"]["pipeline"].calls)
+        inputs = [{"qid": "q1", "query": "a"}, {"qid": "q2", "query": "b"}, {"qid": "q1", "query": "c"}]
+        result = self.call("lookup_batch", {"inputs": inputs, "fields": ["qid", "docno"], "limit": 1})
+        batch = result.structured_content["result"]
+        # one result per input, in order, even with repeated ids
+        self.assertEqual(batch, [
+            {"qid": "q1", "results": [{"qid": "q1", "docno": "a-0"}]},
+            {"qid": "q2", "results": [{"qid": "q2", "docno": "b-0"}]},
+            {"qid": "q1", "results": [{"qid": "q1", "docno": "c-0"}]},
+        ])
+        # as one DataFrame
+        self.assertEqual(self.pipelines["lookup"]["pipeline"].calls[len(before):], [3])
+
+    def test_batch_without_ids(self):
+        result = self.call("topic_batch", {"inputs": [{"query": "a"}, {"query": "b"}], "k": 1})
+        batch = result.structured_content["result"]
+        self.assertEqual([entry["qid"] for entry in batch], ["0", "1"])
+        self.assertEqual([[r["docno"] for r in entry["results"]] for entry in batch], [["a-0"], ["b-0"]])
+
+    def test_batch_limit(self):
+        from pyterrier_server._mcp_server import MAX_BATCH_INPUTS
+        inputs = [{"query": "a"}] * (MAX_BATCH_INPUTS + 1)
+        self.assertTrue(self.call("topic_batch", {"inputs": inputs}, raise_on_error=False).is_error)
+
+
+if __name__ == "__main__":
+    unittest.main()
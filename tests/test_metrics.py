@@ -0,0 +1,64 @@
+import unittest
+
+import pandas as pd
+
+from pyterrier_server._metrics import Histogram, Metrics, run_timed
+from tests._pipelines import StandInRetriever, StandInTextLoader
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        hist = Histogram((1, 10))
+        for value in [0.5, 5, 50]:
+            hist.observe(value)
+        self.assertEqual(list(hist.samples()), [("1", 1), ("10", 2), ("+Inf", 3)])
+        self.assertEqual(hist.sum, 55.5)
+
+    def test_run_timed(self):
+        metrics = Metrics()
+        pipeline = StandInRetriever() % 3 >> StandInTextLoader()
+        out = run_timed("search", pipeline, pd.DataFrame([{"qid": "1", "query": "a"}]), metrics)
+        self.assertEqual(len(out), 3)
+        text = metrics.render()
+        self.assertIn('pyterrier_server_pipeline_calls_total{pipeline="search"} 1', text)
+        self.assertIn('pyterrier_server_stage_rows_out_total{pipeline="search",stage="0",transformer="StandInRetriever"} 10', text)
+        self.assertIn('pyterrier_server_stage_rows_in_total{pipeline="search",stage="2",transformer="StandInTextLoader"} 3', text)
+        self.assertIn('pyterrier_server_pipeline_batch_size_bucket{pipeline="search",le="1"} 1', text)
+        self.assertEqual(text.count("# TYPE pyterrier_server_stage_seconds histogram"), 1)
+
+    def test_errors(self):
+        metrics = Metrics()
+        with self.assertRaises(AttributeError):
+            run_timed("search", StandInRetriever(), pd.DataFrame([{"qid": "1"}]), metrics)
+        text = metrics.render()
+        self.assertIn('pyterrier_server_pipeline_errors_total{pipeline="search"} 1', text)
+        self.assertIn('pyterrier_server_stage_errors_total{pipeline="search",stage="0",transformer="StandInRetriever"} 1', text)
+
+    def test_collectors(self):
+        text = Metrics().render([lambda: [("queued", "gauge", (("pipeline", "a"),), 2)]])
+        self.assertEqual(text, '# TYPE queued gauge\nqueued{pipeline="a"} 2\n')
+
+
+
+class TestMetricsEndpoints(unittest.TestCase):
+    def test_same_metrics(self):
+        # the REST and the MCP server report the same metrics
+        from pyterrier_server._mcp_server import build_mcp_server
+        from tests.test_server import make_app, serve_asgi
+
+        def names(text):
+            return {line.split()[2] for line in text.splitlines() if line.startswith("# TYPE")}
+        app = make_app()
+        client = app.test_client()
+        client.post("/pipeline/search", json={"query": "metrics"})
+        rest = names(client.get("/metrics").data.decode())
+        with serve_asgi(build_mcp_server(app.config["PIPELINES"]).http_app(path="/mcp")) as request:
+            status, _, text = request("/metrics")
+        self.assertEqual(status, 200)
+        self.assertEqual(names(text), rest)
+        self.assertLessEqual({"pyterrier_server_stage_seconds", "pyterrier_server_requests_queued",
+                              "pyterrier_server_cache_hits_total"}, rest)
+
+
+if __name__ == "__main__":
+    unittest.main()
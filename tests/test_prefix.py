@@ -0,0 +1,74 @@
+import os
+import unittest
+from unittest import mock
+
+import pyterrier as pt
+
+from tests._pipelines import StandInReader, StandInRetriever, StandInTextLoader
+
+
+class TestCommonPrefix(unittest.TestCase):
+    def test_same_stage(self):
+        from pyterrier_server._prefix import same_stage
+        self.assertTrue(same_stage(StandInRetriever(5), StandInRetriever(5)))
+        self.assertFalse(same_stage(StandInRetriever(5), StandInRetriever(6)))
+        self.assertTrue(same_stage(pt.RankCutoff(3), pt.RankCutoff(3)))
+        self.assertFalse(same_stage(StandInRetriever(5), StandInTextLoader()))
+
+    def test_cutoffs(self):
+        from pyterrier_server._prefix import common_prefix
+        from pyterrier_server._pushdown import stages
+        retriever, loader = StandInRetriever(), StandInTextLoader()
+        prefix, cutoffs = common_prefix([
+            stages(retriever % 10 >> loader),
+            stages(retriever % 1 >> loader >> StandInReader()),
+        ])
+        self.assertEqual(prefix[:2], [retriever, pt.RankCutoff(10)])
+        self.assertIs(prefix[2], loader)
+        self.assertEqual(cutoffs, [10, 1])
+
+    def test_no_prefix(self):
+        from pyterrier_server._prefix import common_prefix
+        from pyterrier_server._pushdown import stages
+        self.assertEqual(common_prefix([stages(StandInRetriever(2)), stages(StandInRetriever(3))]), ([], None))
+        # a stage after the cutoff that depends on it is not shared
+        prefix, _ = common_prefix([
+            stages(StandInRetriever() % 10 >> StandInReader()),
+            stages(StandInRetriever() % 1 >> StandInReader()),
+        ])
+        self.assertEqual(len(prefix), 2)
+
+
+class TestSharedPrefixes(unittest.TestCase):
+    def setUp(self):
+        from tests.test_server import make_app
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PREFIX_WINDOW": "60"}):
+            self.app = make_app()
+        self.client = self.app.test_client()
+
+    def test_shared(self):
+        pipelines = self.app.config["PIPELINES"]
+        prefixes = self.app.config["PREFIXES"].prefixes
+        self.assertEqual([prefix.names for prefix in prefixes], [["search", "rag"]])
+        retriever = prefixes[0].pipeline._transformers[0]
+
+        search = self.client.post("/pipeline/search", json={"query": "prefix"})
+        self.assertEqual([r["docno"] for r in search.json], ["prefix-0", "prefix-1", "prefix-2"])
+        rag = self.client.post("/pipeline/rag", json={"query": "prefix"})
+        # the top 3 documents serve the top 1 by truncation
+        self.assertEqual(rag.json[0]["qanswer"], "prefix-0")
+        self.assertEqual(retriever.calls, [1])
+        self.assertEqual(self.client.get("/config").json["shared_prefixes"]["prefixes"][0]["hits"], 1)
+
+        # the pipelines as built are kept, and shared again when one is reloaded
+        from pyterrier_server._prefix import PrefixPlanner
+        source = PrefixPlanner.source(pipelines["rag"]["pipeline"])
+        self.assertEqual(len(source._transformers), 4)
+        pipelines["rag"]["loader"].unload(pipelines["rag"])
+        self.assertEqual(self.client.post("/pipeline/rag", json={"query": "again"}).json[0]["qanswer"], "again-0")
+        self.assertEqual(self.app.config["PREFIXES"].prefixes[0].names, ["search", "rag"])
+        self.assertIsNot(self.app.config["PREFIXES"].prefixes[0], prefixes[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from pyterrier_server._profiling import (
+    RequestSampler,
+    StackSampler,
+    is_admin,
+    profile_pipeline,
+)
+from tests._pipelines import StandInRetriever, StandInTextLoader
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+    return "done"
+
+
+class TestProfiling(unittest.TestCase):
+    def test_profile_pipeline(self):
+        pipeline = StandInRetriever() % 3 >> StandInTextLoader()
+        result, profile = profile_pipeline(pipeline, pd.DataFrame([{"qid": "1", "query": "a"}]))
+        self.assertEqual(len(result), 3)
+        self.assertEqual([s["rows_out"] for s in profile["stages"]], [10, 3, 3])
+        self.assertEqual(profile["stages"][1]["transformer"], "RankCutoff(3)")
+        for key in ["seconds", "cpu_seconds", "peak_alloc_bytes", "rss_delta_bytes"]:
+            self.assertIn(key, profile["stages"][0])
+
+    def test_stack_sampler(self):
+        with StackSampler(interval=0.001) as sampler:
+            busy(0.05)
+        self.assertTrue(any("busy (test_profiling.py" in stack for stack in sampler.samples))
+        self.assertRegex(sampler.folded().splitlines()[0], r" \d+$")
+
+    def test_request_sampler(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sampler = RequestSampler(rate=0., directory=directory)
+            self.assertEqual(sampler("search", busy, 0.01), "done")
+            self.assertEqual(os.listdir(directory), [])
+            sampler.configure(rate=1., interval=0.001)
+            self.assertEqual(sampler("search", busy, 0.02), "done")
+            files = os.listdir(directory)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].startswith("search-") and files[0].endswith(".folded"))
+            with self.assertRaises(ValueError):
+                sampler.configure(rate=2)
+
+    def test_is_admin(self):
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_ADMIN_TOKEN": "secret"}):
+            self.assertTrue(is_admin({"X-Admin-Token": "secret"}))
+            self.assertTrue(is_admin({"Authorization": "Bearer secret"}))
+            self.assertFalse(is_admin({"X-Admin-Token": "wrong"}))
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertFalse(is_admin({"X-Admin-Token": ""}))
+
+
+if __name__ == "__main__":
+    unittest.main()
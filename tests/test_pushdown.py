@@ -0,0 +1,51 @@
+import unittest
+
+import pandas as pd
+import pyterrier as pt
+
+from pyterrier_server._pushdown import commutes_with_cutoff, rewrite, stages
+from tests._pipelines import StandInReader, StandInRetriever, StandInTextLoader
+
+
+class TestRewrite(unittest.TestCase):
+    def setUp(self):
+        self.retriever = StandInRetriever()
+        self.loader = StandInTextLoader()
+        self.topics = pd.DataFrame([{"qid": "1", "query": "goldfish"}])
+
+    def test_commutes(self):
+        self.assertTrue(commutes_with_cutoff(self.loader))
+        self.assertFalse(commutes_with_cutoff(self.retriever))
+        self.assertFalse(commutes_with_cutoff(pt.RankCutoff(3)))
+
+    def test_tighten_cutoff(self):
+        pipeline = self.retriever % 10 >> self.loader
+        rewritten = rewrite(pipeline, k=3)
+        self.assertEqual(stages(rewritten), [self.retriever, pt.RankCutoff(3), self.loader])
+        result = rewritten(self.topics)
+        self.assertEqual(list(result["docno"]), ["goldfish-0", "goldfish-1", "goldfish-2"])
+        self.assertEqual(self.loader.calls, 3)
+
+    def test_never_relaxes_cutoff(self):
+        pipeline = self.retriever % 2 >> self.loader
+        self.assertIs(rewrite(pipeline, k=5), pipeline)
+
+    def test_adds_cutoff(self):
+        pipeline = self.retriever >> self.loader
+        self.assertEqual(stages(rewrite(pipeline, k=4)), [self.retriever, pt.RankCutoff(4), self.loader])
+
+    def test_drop_trailing_stages(self):
+        pipeline = self.retriever % 10 >> self.loader
+        self.assertEqual(stages(rewrite(pipeline, fields=["docno", "score"])), [self.retriever, pt.RankCutoff(10)])
+        self.assertIs(rewrite(pipeline, fields=["docno", "text"]), pipeline)
+        rewritten = rewrite(pipeline, k=2, fields=["docno"])
+        self.assertEqual(list(rewritten(self.topics)["docno"]), ["goldfish-0", "goldfish-1"])
+
+    def test_keeps_reordering_stages(self):
+        # the reader changes the results, so neither k nor fields can be pushed past it
+        pipeline = self.retriever % 1 >> self.loader >> StandInReader()
+        self.assertIs(rewrite(pipeline, k=1, fields=["qanswer"]), pipeline)
+
+
+if __name__ == "__main__":
+    unittest.main()
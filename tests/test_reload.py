@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest import mock
+
+from tests._pipelines import FUNCTIONS_YAML, write_functions_yaml
+
+FAILING = """
+  - name: broken
+    pipeline: |
+      raise RuntimeError("no index")
+"""
+
+
+class TestReloader(unittest.TestCase):
+    def setUp(self):
+        from pyterrier_server._loader import load_pipeline
+        self.path = write_functions_yaml()
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PIPELINE": self.path}):
+            self.pipelines = load_pipeline()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def rewrite(self, body):
+        with open(self.path, "w") as f:
+            f.write(body)
+        # make sure the modification time moves on, even on coarse filesystems
+        os.utime(self.path, ns=(time.time_ns(), time.time_ns() + 10**9))
+
+    def test_reload(self):
+        from pyterrier_server._executors import get_executor
+        from pyterrier_server._reload import Reloader
+        reloader = Reloader(self.pipelines, self.path)
+        search, rag = self.pipelines["search"], self.pipelines["rag"]
+        executor = get_executor("rag", rag)
+        executor.run(lambda: None)
+        self.assertFalse(reloader.modified())
+
+        body = FUNCTIONS_YAML.replace("StandInRetriever() % 1", "StandInRetriever() % 2")
+        body = body.replace("    task: search\n", "    task: search\n    cache: false\n")
+        body += """
+  - name: more
+    pipeline: |
+      from tests._pipelines import StandInRetriever
+      p = StandInRetriever()
+"""
+        self.rewrite(body)
+        self.assertTrue(reloader.modified())
+        result = reloader.reload()
+        self.assertEqual(sorted(result["changed"]), ["more", "rag", "search"])
+        self.assertEqual(result["failed"], {})
+        # only the serving options of search changed, so its pipeline was kept
+        self.assertIs(self.pipelines["search"]["pipeline"], search["pipeline"])
+        self.assertFalse(self.pipelines["search"]["cache"])
+        self.assertIsNot(self.pipelines["rag"]["pipeline"], rag["pipeline"])
+        self.assertEqual(self.pipelines["more"]["state"], "ready")
+
+        # the old executor drains and shuts down
+        for _ in range(100):
+            if executor._pool is None:
+                break
+            time.sleep(0.01)
+        self.assertIsNone(executor._pool)
+
+        self.rewrite(FUNCTIONS_YAML)
+        result = reloader.reload()
+        self.assertEqual(result["removed"], ["more"])
+        self.assertEqual(result["unchanged"], [])
+        self.assertEqual(list(self.pipelines), ["search", "rag"])
+        rag = self.pipelines["rag"]
+        self.assertEqual(reloader.reload()["unchanged"], ["search", "rag"])
+        self.assertIs(self.pipelines["rag"], rag)
+
+    def test_failed_function_keeps_old_version(self):
+        from pyterrier_server._reload import Reloader
+        reloader = Reloader(self.pipelines, self.path)
+        rag = self.pipelines["rag"]
+        self.rewrite(FUNCTIONS_YAML.replace("StandInReader()", "StandInReader(); raise RuntimeError('oops')") + FAILING)
+        result = reloader.reload()
+        self.assertEqual(sorted(result["failed"]), ["broken", "rag"])
+        self.assertIs(self.pipelines["rag"], rag)
+        self.assertNotIn("broken", self.pipelines)
+
+    def test_artifacts_released(self):
+        from pyterrier_server._artifacts import default_registry
+        from pyterrier_server._reload import Reloader
+        # fresh paths, so that no other test shares the artifacts
+        first, second, third = (f"{self.path}-{i}" for i in range(3))
+        body = f"""
+memoize:
+  - tests._pipelines.open_index
+functions:
+  - name: search
+    pipeline: |
+      from tests._pipelines import open_index
+      p = open_index({first!r}) % 3
+  - name: rag
+    pipeline: |
+      from tests._pipelines import open_index
+      p = open_index({second!r}) % 1
+"""
+        reloader = Reloader(self.pipelines, self.path)
+        before = default_registry.stats()["artifacts"]
+        self.rewrite(body)
+        reloader.reload()
+        self.assertEqual(default_registry.stats()["artifacts"], before + 2)
+
+        def artifacts_after_retiring(expected):
+            # the old versions are retired in the background
+            for _ in range(100):
+                if default_registry.stats()["artifacts"] == expected:
+                    break
+                time.sleep(0.01)
+            return default_registry.stats()["artifacts"]
+
+        # rebuilt: the old index is released once the old version retires
+        self.rewrite(body.replace(second, third))
+        reloader.reload()
+        self.assertEqual(artifacts_after_retiring(before + 2), before + 2)
+        # removed
+        self.rewrite(body.replace(second, third).split("  - name: rag")[0])
+        self.assertEqual(reloader.reload()["removed"], ["rag"])
+        self.assertEqual(artifacts_after_retiring(before + 1), before + 1)
+
+    def test_serving_options_keep_footprint(self):
+        from pyterrier_server._reload import Reloader
+        reloader = Reloader(self.pipelines, self.path)
+        search = self.pipelines["search"]
+        self.rewrite(FUNCTIONS_YAML.replace("    task: search\n", "    task: search\n    cache: false\n"))
+        reloader.reload()
+        self.assertIs(self.pipelines["search"]["pipeline"], search["pipeline"])
+        for key in ("footprint", "loads", "last_used"):
+            self.assertEqual(self.pipelines["search"][key], search[key])
+
+    def test_mcp_tools(self):
+        from fastmcp import Client
+
+        from pyterrier_server._mcp_server import build_mcp_server
+        from pyterrier_server._reload import Reloader
+        reloader = Reloader(self.pipelines, self.path)
+        mcp = build_mcp_server(self.pipelines, metrics=False, reloader=reloader)
+        self.rewrite(FUNCTIONS_YAML.replace("  - name: rag", "  - name: answer"))
+        reloader.reload()
+
+        async def tool_names():
+            async with Client(mcp) as client:
+                return sorted(tool.name for tool in await client.list_tools())
+        self.assertEqual(asyncio.run(tool_names()), ["answer", "answer_batch", "search", "search_batch"])
+
+
+class TestAdminReload(unittest.TestCase):
+    def test_admin_reload(self):
+        from tests.test_server import make_app
+        app = make_app()
+        client = app.test_client()
+        path = app.config["RELOADER"].path
+        with open(path, "a") as f:
+            f.write("""
+  - name: more
+    pipeline: |
+      from tests._pipelines import StandInRetriever
+      p = StandInRetriever(num_results=2)
+""")
+        self.assertEqual(client.post("/pipeline/more", json={"query": "a"}).status_code, 404)
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_ADMIN_TOKEN": "secret"}):
+            self.assertEqual(client.post("/admin/reload").status_code, 403)
+            res = client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(res.json["changed"], ["more"])
+        res = client.post("/pipeline/more", json={"query": "a"})
+        self.assertEqual([r["docno"] for r in res.json], ["a-0", "a-1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
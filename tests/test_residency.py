@@ -0,0 +1,74 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+from tests._pipelines import write_functions_yaml
+
+FUNCTIONS = """
+functions:
+""" + "".join(f"""
+  - name: {name}
+    memory: 100M
+    pipeline: |
+      from tests._pipelines import StandInRetriever
+      p = StandInRetriever()
+""" for name in ["a", "b", "c"])
+
+
+class TestResidency(unittest.TestCase):
+    def setUp(self):
+        from pyterrier_server._loader import load_pipeline
+        path = write_functions_yaml(body=FUNCTIONS)
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PIPELINE": path}):
+            self.pipelines = load_pipeline()
+        os.remove(path)
+        # a was used longest ago, c most recently
+        for i, name in enumerate(["a", "b", "c"]):
+            self.pipelines[name]["last_used"] = i
+
+    def test_parse_size(self):
+        from pyterrier_server._loader import parse_size
+        self.assertEqual(parse_size("100M"), 100 * 2**20)
+        self.assertEqual(parse_size("1.5GB"), int(1.5 * 2**30))
+        self.assertEqual(parse_size("2GiB"), 2 * 2**30)
+        self.assertEqual(parse_size(1024), 1024)
+        self.assertIsNone(parse_size(None))
+
+    def test_budget(self):
+        from pyterrier_server._loader import ensure_loaded
+        from pyterrier_server._residency import Residency
+        residency = Residency(self.pipelines, budget=250 * 2**20, idle_timeout=0)
+        self.assertEqual(residency.enforce(), ["a"])
+        self.assertEqual(self.pipelines["a"]["state"], "unloaded")
+        self.assertNotIn("pipeline", self.pipelines["a"])
+
+        # using a again loads it, and unloads the least recently used of the others
+        ensure_loaded(self.pipelines["a"])
+        self.assertEqual(self.pipelines["a"]["state"], "ready")
+        self.assertEqual(self.pipelines["b"]["state"], "unloaded")
+        stats = residency.stats()
+        self.assertEqual(stats["resident_bytes"], 200 * 2**20)
+        self.assertEqual(stats["pipelines"]["a"]["reloads"], 1)
+        self.assertEqual(stats["pipelines"]["a"]["unloads"], 1)
+        self.assertFalse(stats["pipelines"]["b"]["resident"])
+
+    def test_busy_pipelines_stay(self):
+        from pyterrier_server._executors import get_executor
+        from pyterrier_server._residency import Residency
+        executor = get_executor("a", self.pipelines["a"])
+        executor.running = 1
+        residency = Residency(self.pipelines, budget=250 * 2**20, idle_timeout=0)
+        self.assertEqual(residency.enforce(), ["b"])
+        self.assertEqual(self.pipelines["a"]["state"], "ready")
+
+    def test_idle_timeout(self):
+        from pyterrier_server._residency import Residency
+        residency = Residency(self.pipelines, budget=0, idle_timeout=60)
+        self.pipelines["c"]["last_used"] = time.monotonic()
+        self.assertEqual(residency.sweep(), ["a", "b"])
+        self.assertEqual(self.pipelines["c"]["state"], "ready")
+
+
+if __name__ == "__main__":
+    unittest.main()
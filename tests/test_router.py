@@ -0,0 +1,37 @@
+import unittest
+
+from pyterrier_server._router import Router, tokenize
+
+PIPELINES = {
+    "MSMARCO-search": {"task": "search", "description": "Search for relevant documents in the MSMARCO passages."},
+    "ragwiki-rag": {"task": "rag", "description": "Answer a question by generating text from retrieved Wikipedia documents."},
+    "doc2query": {"task": "doc2query", "description": "Generate synthetic queries for documents.",
+                  "properties": [{"name": "docno", "type": "str"}, {"name": "text", "type": "str"}]},
+}
+
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = Router(PIPELINES)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Search the Documents, please!"), ["search", "document"])
+
+    def test_route(self):
+        self.assertEqual(self.router.route("search for passages about goldfish")["pipeline"], "MSMARCO-search")
+        self.assertEqual(self.router.route("answer this question about Wikipedia")["pipeline"], "ragwiki-rag")
+        self.assertEqual(self.router.route("generate queries for my documents")["pipeline"], "doc2query")
+
+    def test_confidence(self):
+        confident = self.router.route("search passages")
+        self.assertGreater(confident["confidence"], 0.3)
+        self.assertEqual(next(iter(confident["scores"])), "MSMARCO-search")
+        # shares a term with two pipelines equally
+        self.assertLess(self.router.route("documents")["confidence"], 0.1)
+        unknown = self.router.route("hello there")
+        self.assertIsNone(unknown["pipeline"])
+        self.assertEqual(unknown["confidence"], 0.)
+
+
+if __name__ == "__main__":
+    unittest.main()
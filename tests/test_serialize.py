@@ -0,0 +1,76 @@
+import importlib.util
+import json
+import unittest
+
+import pandas as pd
+
+from pyterrier_server._serialize import (
+    ARROW,
+    JSON,
+    MSGPACK,
+    NotAcceptable,
+    negotiate,
+    parse_fields,
+    parse_limit,
+    project,
+    serialize,
+)
+
+
+class TestSerialize(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "qid": ["1", "1", "1", "2"],
+            "docno": ["a", "b", "c", "d"],
+            "score": [3.5, 2.25, 1.0, 9.0],
+            "rank": [0, 1, 2, 0],
+        })
+
+    def test_project(self):
+        out = project(self.df, parse_fields("docno, score"), limit=2)
+        self.assertEqual(list(out.columns), ["docno", "score"])
+        self.assertEqual(list(out["docno"]), ["a", "b", "d"])
+        with self.assertRaises(ValueError):
+            project(self.df, ["missing"])
+
+    def test_parse_limit(self):
+        self.assertIsNone(parse_limit(None))
+        self.assertEqual(parse_limit("3"), 3)
+        for value in ["0", -1, "many"]:
+            with self.assertRaises(ValueError):
+                parse_limit(value, "k")
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate(None), JSON)
+        self.assertEqual(negotiate("*/*"), JSON)
+        self.assertEqual(negotiate("application/msgpack;q=0.5, application/vnd.apache.arrow.stream"), ARROW)
+        self.assertEqual(negotiate("text/html", fmt="msgpack"), MSGPACK)
+        with self.assertRaises(NotAcceptable):
+            negotiate("text/html")
+
+    def test_json(self):
+        data, mimetype = serialize(self.df)
+        self.assertEqual(mimetype, JSON)
+        self.assertEqual(json.loads(data), self.df.to_dict("records"))
+        # every digit of the scores, and nulls for missing values
+        df = pd.DataFrame({"docno": ["a", "b"], "score": [0.1 + 0.2, float("nan")]})
+        self.assertEqual(json.loads(serialize(df)[0]), [{"docno": "a", "score": 0.1 + 0.2}, {"docno": "b", "score": None}])
+        self.assertEqual(json.loads(serialize(df[["docno"]])[0]), [{"docno": "a"}, {"docno": "b"}])
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_arrow(self):
+        import pyarrow as pa
+        data, mimetype = serialize(self.df, ARROW)
+        self.assertEqual(mimetype, ARROW)
+        pd.testing.assert_frame_equal(pa.ipc.open_stream(data).read_all().to_pandas(), self.df)
+
+    @unittest.skipUnless(importlib.util.find_spec("msgpack"), "msgpack is not installed")
+    def test_msgpack(self):
+        import msgpack
+        data, mimetype = serialize(self.df, MSGPACK)
+        self.assertEqual(mimetype, MSGPACK)
+        self.assertEqual(msgpack.unpackb(data), self.df.to_dict("list"))
+
+
+if __name__ == "__main__":
+    unittest.main()
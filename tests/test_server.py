@@ -0,0 +1,295 @@
+import contextlib
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from tests._pipelines import write_functions_yaml
+
+
+def make_app(extra="", wait=True):
+    from pyterrier_server._server import create_app
+    path = write_functions_yaml(extra)
+    env = {"PYTERRIER_SERVER_PIPELINE": path, "OPENAI_API_KEY": "test"}
+    with mock.patch.dict(os.environ, env):
+        os.environ.pop("PYTERRIER_MCP_URL", None)
+        app = create_app()
+    if wait:
+        client = app.test_client()
+        for _ in range(100):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.05)
+    return app
+
+
+class TestPipelineEndpoints(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = make_app()
+        cls.client = cls.app.test_client()
+
+    def test_pipeline(self):
+        res = self.client.post("/pipeline/search", json={"query": "goldfish"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r["docno"] for r in res.json], ["goldfish-0", "goldfish-1", "goldfish-2"])
+
+    def test_projection(self):
+        res = self.client.post("/pipeline/search?fields=docno,score&limit=2", json={"query": "goldfish"})
+        self.assertEqual(res.json, [{"docno": "goldfish-0", "score": 10.0}, {"docno": "goldfish-1", "score": 9.0}])
+        res = self.client.post("/pipeline/search", json={"query": "goldfish", "fields": ["nope"]})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post("/pipeline/search", json={"query": "goldfish"}, headers={"Accept": "text/html"})
+        self.assertEqual(res.status_code, 406)
+
+    def test_pushdown(self):
+        res = self.client.post("/pipeline/search?k=2", json={"query": "goldfish"})
+        self.assertEqual([r["docno"] for r in res.json], ["goldfish-0", "goldfish-1"])
+        self.assertIn("text", res.json[0])
+        res = self.client.post("/pipeline/search", json={"query": "goldfish", "k": 1, "fields": ["docno"]})
+        self.assertEqual(res.json, [{"docno": "goldfish-0"}])
+
+    def test_body_not_an_object(self):
+        for path in ["/pipeline/search", "/pipeline/search?stream=1", "/ai"]:
+            res = self.client.post(path, json=[{"query": "goldfish"}])
+            self.assertEqual(res.status_code, 400, path)
+            self.assertEqual(res.json, {"error": "The request body must be a JSON object, not list"})
+        # no (or malformed) JSON is still an empty body
+        self.assertEqual(self.client.post("/pipeline/search", data="not json").status_code, 200)
+
+    def test_invalid_depth(self):
+        for path, body in [("/pipeline/search?k=0", {"query": "a"}), ("/pipeline/search?limit=0", {"query": "a"}),
+                           ("/pipeline/search", {"query": "a", "k": 0}), ("/pipeline/search/batch?k=0", [{"query": "a"}])]:
+            res = self.client.post(path, json=body)
+            self.assertEqual(res.status_code, 400, path)
+            self.assertIn("at least 1", res.json["error"])
+
+    def test_stream(self):
+        res = self.client.post("/pipeline/rag?stream=1", json={"query": "goldfish"})
+        self.assertEqual(res.mimetype, "text/event-stream")
+        events = [line[len("event: "):] for line in res.data.decode().splitlines() if line.startswith("event: ")]
+        self.assertEqual(events, ["documents", "answer", "done"])
+
+    def test_metrics(self):
+        self.client.post("/pipeline/search", json={"query": "metrics"})
+        res = self.client.get("/metrics")
+        self.assertEqual(res.mimetype, "text/plain")
+        text = res.data.decode()
+        self.assertIn('pyterrier_server_stage_seconds_count{pipeline="search",stage="2",transformer="StandInTextLoader"}', text)
+        self.assertIn('pyterrier_server_cache_misses_total{pipeline="search"}', text)
+        self.assertIn('pyterrier_server_requests_completed_total{pipeline="search"}', text)
+
+    def test_profile(self):
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_ADMIN_TOKEN": "secret"}):
+            res = self.client.post("/pipeline/search?profile=1", json={"query": "goldfish"})
+            self.assertEqual(res.status_code, 403)
+            res = self.client.post("/pipeline/search?profile=1", json={"query": "goldfish"}, headers={"X-Admin-Token": "secret"})
+            self.assertEqual(len(res.json["results"]), 3)
+            self.assertEqual([s["rows_out"] for s in res.json["profile"]["stages"]], [10, 3, 3])
+
+            self.assertEqual(self.client.get("/admin/profiling").status_code, 403)
+            res = self.client.post("/admin/profiling", json={"rate": 0.5}, headers={"X-Admin-Token": "secret"})
+            self.assertEqual(res.json["rate"], 0.5)
+            res = self.client.post("/admin/profiling", json={"rate": 0}, headers={"X-Admin-Token": "secret"})
+            self.assertEqual(res.json["rate"], 0)
+
+    def test_ai_local_router(self):
+        res = self.client.post("/ai", json={"input": "search documents about goldfish", "router": "local"})
+        self.assertEqual(res.status_code, 200)
+        tool = res.json["tools_used"][0]
+        self.assertEqual(tool["name"], "search")
+        self.assertEqual(tool["routing"]["router"], "local")
+        self.assertEqual(json.loads(res.json["output"])[0]["docno"], "search documents about goldfish-0")
+
+        res = self.client.post("/ai?stream=1", json={"input": "answer a question", "router": "local"})
+        events = [line[len("event: "):] for line in res.data.decode().splitlines() if line.startswith("event: ")]
+        self.assertEqual(events, ["route", "documents", "answer", "done"])
+
+    def test_ai_router_fallback(self):
+        class McpCall:
+            name, output = "search", "[]"
+        resp = mock.Mock(output=[McpCall()], output_text="[]", tool_usage=None)
+        with mock.patch.dict(self.app.config, {"MCP_EXISTS": True}), \
+                mock.patch.object(self.app.config["OPENAI_CLIENT"].responses, "create", return_value=resp) as create:
+            res = self.client.post("/ai", json={"input": "hello there", "router": "local"})
+        create.assert_called_once()
+        tool = res.json["tools_used"][0]
+        self.assertEqual(tool["name"], "search")
+        self.assertEqual(tool["routing"]["router"], "llm")
+        self.assertEqual(tool["routing"]["confidence"], 0.)
+
+    def test_config(self):
+        res = self.client.get("/config")
+        residency = res.json["residency"]
+        self.assertTrue(residency["pipelines"]["search"]["resident"])
+        self.assertEqual(residency["pipelines"]["search"]["loads"], 1)
+
+    def test_batch_ndjson(self):
+        body = "\n".join(json.dumps({"query": q}) for q in ["a", "b", "c"])
+        res = self.client.post("/pipeline/search/batch?chunk_size=2", data=body, content_type="application/x-ndjson")
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([line["qid"] for line in lines], ["1", "2", "3"])
+        self.assertEqual([r["docno"] for r in lines[1]["results"]], ["b-0", "b-1", "b-2"])
+
+    def test_batch_json_array(self):
+        res = self.client.post("/pipeline/rag/batch", json=[{"qid": "x", "query": "a"}, {"qid": "y", "q": "b"}])
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([line["qid"] for line in lines], ["x", "y"])
+        self.assertEqual(lines[1]["results"][0]["qanswer"], "b-0")
+
+    def test_batch_duplicate_ids(self):
+        # records sharing a qid, or reusing one the server would assign, still get a line each
+        res = self.client.post("/pipeline/search/batch", json=[{"qid": "x", "query": "a"}, {"qid": "x", "query": "b"},
+                                                              {"qid": "1", "query": "c"}, {"query": "d"}])
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([line["qid"] for line in lines], ["x", "x", "1", "4"])
+        self.assertEqual([line["results"][0]["docno"] for line in lines], ["a-0", "b-0", "c-0", "d-0"])
+        self.assertEqual({r["qid"] for r in lines[1]["results"]}, {"x"})
+
+    def test_batch_invalid(self):
+        res = self.client.post("/pipeline/search/batch", data="[1, 2", content_type="application/json")
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post("/pipeline/search/batch", json=[{"query": "a"}, "b"])
+        self.assertEqual(res.status_code, 400)
+
+    def test_batch_invalid_lines(self):
+        # invalid lines get an error in their place, and the lines after them are still run
+        body = '{"query": "a"}\n{"query": "b"\n{"query": "c"}\n["d"]\n{"query": "e"}\n'
+        res = self.client.post("/pipeline/search/batch?chunk_size=2", data=body, content_type="application/x-ndjson")
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([line.get("qid", line.get("line")) for line in lines], ["1", 2, "3", 4, "5"])
+        self.assertTrue(lines[1]["error"].startswith("Invalid JSON"))
+        self.assertEqual(lines[3]["error"], "Invalid JSON: not a JSON object")
+        self.assertEqual([line["results"][0]["docno"] for line in lines[::2]], ["a-0", "c-0", "e-0"])
+
+
+class TestLoading(unittest.TestCase):
+    def test_readiness(self):
+        app = make_app("""
+  - name: slow
+    pipeline: |
+      import time
+      from tests._pipelines import StandInRetriever
+      time.sleep(1)
+      p = StandInRetriever()
+  - name: lazy
+    lazy: true
+    warmup: warm
+    pipeline: |
+      from tests._pipelines import StandInRetriever
+      p = StandInRetriever()
+""", wait=False)
+        client = app.test_client()
+        self.assertEqual(client.get("/healthz").status_code, 200)
+        res = client.get("/ready")
+        self.assertEqual(res.status_code, 503)
+        self.assertIn(res.json["pipelines"]["slow"], ["pending", "loading"])
+        self.assertEqual(res.json["pipelines"]["lazy"], "lazy")
+        self.assertEqual(client.post("/pipeline/slow", json={"query": "a"}).status_code, 503)
+
+        for _ in range(100):
+            if client.get("/ready?pipelines=search,rag").status_code == 200:
+                break
+            time.sleep(0.05)
+        self.assertEqual(client.get("/ready?pipelines=search,rag").status_code, 200)
+
+        res = client.post("/pipeline/lazy", json={"query": "a"})
+        self.assertEqual(res.status_code, 200)
+        info = app.config["PIPELINES"]["lazy"]
+        self.assertEqual(info["state"], "ready")
+        # the warm-up query ran before the first request
+        self.assertEqual(info["pipeline"].calls, [1, 1])
+
+        for _ in range(100):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.05)
+        self.assertEqual(client.get("/ready").json["pipelines"]["slow"], "ready")
+
+
+@contextlib.contextmanager
+def serve_asgi(app):
+    """
+    Serve the ASGI ``app`` with uvicorn on a free port, yielding ``post(path, body, headers)`` ->
+    ``(status, headers, text)`` (which sends a GET without a ``body``).
+    """
+    import threading
+    import urllib.error
+    import urllib.request
+
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        for _ in range(100):
+            if server.started:
+                break
+            time.sleep(0.05)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        def post(path, body=None, headers=None):
+            data = json.dumps(body).encode() if body is not None else None
+            req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data,
+                                         headers={"Content-Type": "application/json", **(headers or {})})
+            try:
+                with urllib.request.urlopen(req, timeout=10) as res:
+                    return res.status, res.headers, res.read().decode()
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers, e.read().decode()
+        yield post
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+class TestFrontEnds(unittest.TestCase):
+    def test_same_responses(self):
+        # the Flask endpoint and the native ASGI one share their request handling (see _handler.py)
+        from pyterrier_server._asgi import create_asgi_app
+        flask_app = make_app("""
+  - name: popular
+    cache: false
+    pipeline: |
+      from tests._pipelines import StandInShardRetriever
+      p = StandInShardRetriever(0, 1, num_results=2, delay=0.5)
+""")
+        client = flask_app.test_client()
+        requests = [
+            ("/pipeline/search", {"query": "same"}, {}),
+            ("/pipeline/search?k=1&fields=docno", {"query": "same"}, {}),
+            ("/pipeline/search?limit=many", {"query": "same"}, {}),
+            ("/pipeline/search", {"query": "same"}, {"Accept": "text/html"}),
+            ("/pipeline/popular", {"query": "slow query"}, {"X-Request-Timeout": "0.05"}),
+            ("/pipeline/missing", {"query": "same"}, {}),
+            ("/pipeline/search", [{"query": "same"}], {}),
+        ]
+        with serve_asgi(create_asgi_app(flask_app)) as post:
+            for path, body, headers in requests:
+                with self.subTest(path=path, headers=headers):
+                    expected = client.post(path, json=body, headers=headers)
+                    status, _, text = post(path, body, headers)
+                    self.assertEqual(status, expected.status_code)
+                    self.assertEqual(json.loads(text), expected.json)
+
+
+class TestCoHosting(unittest.TestCase):
+    def test_rest_and_mcp(self):
+        from pyterrier_server._asgi import create_asgi_app
+        app = create_asgi_app(make_app(), mcp=True)
+        with serve_asgi(app) as post:
+            with self.assertLogs("pyterrier_server.access", level="INFO") as logs:
+                results = json.loads(post("/pipeline/search", {"query": "goldfish"})[2])
+            self.assertEqual(results[0]["docno"], "goldfish-0")
+            # logged once, by the ASGI middleware
+            self.assertEqual([(r.fields["path"], r.fields["status"]) for r in logs.records], [("/pipeline/search", 200)])
+            data = post("/mcp", {"jsonrpc": "2.0", "id": 1, "method": "tools/list"},
+                        {"Accept": "application/json, text/event-stream"})[2]
+            payload = json.loads(next(line[len("data: "):] for line in data.splitlines() if line.startswith("data: ")) if "data: " in data else data)
+            self.assertIn("search", [tool["name"] for tool in payload["result"]["tools"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from tests._pipelines import write_functions_yaml
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def test_write_and_read(self):
+        from pyterrier_server._store import ResultStore, StoreTier, write_store
+        path = os.path.join(self.dir, "search.store")
+        entries = [(f"{i:040x}", pd.DataFrame({"docno": [f"d{i}", f"e{i}"], "rank": [0, 1]})) for i in range(50)]
+        self.assertEqual(write_store(path, "search", "v1", entries), 50)
+        store = ResultStore(path)
+        self.assertEqual((store.name, store.version, len(store)), ("search", "v1", 50))
+        self.assertEqual(list(store.get(f"{7:040x}")["docno"]), ["d7", "e7"])
+        self.assertIsNone(store.get(f"{99:040x}"))
+        self.assertEqual((store.stats()["hits"], store.stats()["misses"]), (1, 1))
+        self.assertEqual(list(StoreTier(store, k=1).get("search", f"{3:040x}")["docno"]), ["d3"])
+
+    def test_precompute_and_serve(self):
+        from pyterrier_server._loader import load_pipeline
+        from pyterrier_server._precompute import main
+        from pyterrier_server._runner import get_runner
+        log = os.path.join(self.dir, "queries.jsonl")
+        with open(log, "w") as f:
+            f.writelines(json.dumps({"query": query}) + "\n" for query in ["goldfish", "goldfish  ", "cats", "goldfish", "dogs"])
+            f.write(json.dumps({"pipeline": "rag", "query": "other"}) + "\n")
+        yaml_path = write_functions_yaml()
+        env = {"PYTERRIER_SERVER_PIPELINE": yaml_path, "PYTERRIER_SERVER_STORE_DIR": self.dir}
+        with mock.patch.dict(os.environ, env):
+            main(["search", log, "--min-count", "1", "--top", "2"])
+            pipelines = load_pipeline()
+            info = pipelines["search"]
+            runner = get_runner("search", info)
+        store = info["result_store"]
+        self.assertEqual(len(store), 2)  # goldfish and the first of the rest
+
+        retriever = info["pipeline"][0]
+        calls = len(retriever.calls)
+        result = runner(pd.DataFrame([{"qid": "q1", "query": " goldfish"}]))
+        self.assertEqual(list(result["docno"]), ["goldfish-0", "goldfish-1", "goldfish-2"])
+        self.assertEqual(list(result["qid"]), ["q1"] * 3)
+        self.assertEqual(len(retriever.calls), calls)  # served from the store
+        self.assertEqual(store.hits, 1)
+
+    def test_stale_store_is_ignored(self):
+        from pyterrier_server._loader import load_pipeline
+        from pyterrier_server._store import get_store, write_store
+        write_store(os.path.join(self.dir, "search.store"), "search", "old-version", [])
+        yaml_path = write_functions_yaml()
+        with mock.patch.dict(os.environ, {"PYTERRIER_SERVER_PIPELINE": yaml_path, "PYTERRIER_SERVER_STORE_DIR": self.dir}):
+            pipelines = load_pipeline()
+            self.assertIsNone(get_store("search", pipelines["search"]))
+
+    def test_result_version(self):
+        from pyterrier_server._loader import result_version
+        function = {"name": "search", "pipeline": "p = x"}
+        self.assertEqual(result_version(function), result_version({**function, "batching": True, "store": "a"}))
+        self.assertNotEqual(result_version(function), result_version({**function, "pipeline": "p = y"}))
+        self.assertNotEqual(result_version(function), result_version(function, shared_code="x = 1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import unittest
+from types import SimpleNamespace
+
+import pandas as pd
+
+from pyterrier_server._executors import PipelineExecutor
+from pyterrier_server._streaming import (
+    run_staged,
+    stream_ai,
+    stream_pipeline,
+    wants_stream,
+)
+from tests._pipelines import StandInReader, StandInRetriever, StandInTextLoader
+
+
+def parse(events):
+    parsed = []
+    for chunk in events:
+        event, data = chunk.strip().split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = StandInRetriever() % 2 >> StandInTextLoader() >> StandInReader()
+        self.topics = pd.DataFrame([{"qid": "1", "query": "goldfish"}])
+
+    def test_run_staged(self):
+        events = []
+        run_staged(self.pipeline, self.topics, lambda event, data: events.append((event, data)))
+        self.assertEqual([e for e, _ in events], ["documents", "answer", "done"])
+        # documents are sent after the rank cutoff, before the text is loaded
+        documents = json.loads(events[0][1])
+        self.assertEqual([d["docno"] for d in documents], ["goldfish-0", "goldfish-1"])
+        self.assertNotIn("text", documents[0])
+        self.assertEqual(set(events[2][1]["timings"]), {"retrieval", "total"})
+
+    def test_stream_pipeline(self):
+        events = parse(stream_pipeline(PipelineExecutor("rag"), self.pipeline, self.topics))
+        self.assertEqual([e for e, _ in events], ["documents", "answer", "done"])
+        self.assertEqual(events[1][1], [{"qid": "1", "query": "goldfish", "qanswer": "goldfish-0 goldfish-1"}])
+
+    def test_stream_pipeline_error(self):
+        events = parse(stream_pipeline(PipelineExecutor("rag"), self.pipeline, pd.DataFrame([{"qid": "1"}])))
+        self.assertEqual(events[-1][0], "error")
+
+    def test_stream_ai(self):
+        stream = [
+            SimpleNamespace(type="response.output_item.done", item=SimpleNamespace(type="mcp_call", name="search", output="[]")),
+            SimpleNamespace(type="response.output_text.delta", delta="Hel"),
+            SimpleNamespace(type="response.output_text.delta", delta="lo"),
+            SimpleNamespace(type="response.completed", response=SimpleNamespace(output_text="Hello")),
+        ]
+        events = parse(stream_ai(iter(stream)))
+        self.assertEqual([e for e, _ in events], ["tool", "delta", "delta", "answer", "done"])
+        self.assertEqual(events[3][1], {"output": "Hello"})
+
+    def test_wants_stream(self):
+        self.assertTrue(wants_stream({"stream": "1"}, {}))
+        self.assertTrue(wants_stream({}, {"Accept": "text/event-stream"}))
+        self.assertTrue(wants_stream({}, {}, {"stream": True}))
+        self.assertFalse(wants_stream({}, {"Accept": "application/json"}, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()